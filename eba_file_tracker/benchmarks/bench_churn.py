@@ -0,0 +1,295 @@
+"""
+Daemon load benchmark.
+
+Starts the daemon against a temporary directory tree tracked as one dataset, with its uploads going to
+a local stub ingest server, and generates file churn (create, modify, read, delete, rename) over the
+files of the tree. Measures how long an operation takes to reach the ingest server, the events per
+second ingested, the CPU time and the RSS of the daemon, and prints the results as JSON, so runs can be
+compared across commits:
+
+    python -m benchmarks.bench_churn -f 2000 -d 20 -t 20 -r 500 -o churn-$(git rev-parse --short HEAD).json
+
+Run from the eba_file_tracker project directory; it does not touch a daemon that is already running.
+The stub is the relay of the daemon with a recorder in place of its uploader.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from eba_file_tracker.core.relay import MetadataRelay
+from eba_file_tracker.core.models.tracker import FileMetadata
+from eba_file_tracker.sdk import TrackerClient
+
+OPERATIONS = ("create", "modify", "read", "delete", "rename")
+DEFAULT_MIX = "create=1,modify=4,read=2,delete=1,rename=1"
+SERVER_START_TIMEOUT = 30.0
+DRAIN_IDLE_SECONDS = 3.0  # the uploader flushes every second, no ingest for this long means it is done
+DRAIN_TIMEOUT = 60.0
+
+
+class IngestRecorder:
+    """Takes the place of the relay's uploader: records when each file reached the ingest server."""
+    def __init__(self) -> None:
+        self.arrivals: dict[str, list[float]] = dict()
+        self.events = 0
+        self.last_arrival = time.monotonic()
+
+    def submit(self, metadata: FileMetadata) -> None:
+        self.last_arrival = time.monotonic()
+        self.arrivals.setdefault(metadata.file_path, []).append(self.last_arrival)
+        self.events += 1
+
+    @staticmethod
+    def queue_size() -> int:
+        return 0
+
+
+class Churn:
+    """File operations over a directory tree, each one recorded with its path and time."""
+    def __init__(self, root: str, files: int, directories: int, seed: int) -> None:
+        self.root = root
+        self.random = random.Random(seed)
+        self.directories = [os.path.join(root, f"d{i}") for i in range(directories)]
+        self.files: list[str] = []
+        self.counter = 0
+        self.operations: list[tuple[str, str, float]] = []
+        for directory in self.directories:
+            os.makedirs(directory)
+        for _ in range(files):
+            self._write(self._new_path(), "w")
+
+    def _new_path(self) -> str:
+        self.counter += 1
+        return os.path.join(self.random.choice(self.directories), f"f{self.counter}.dat")
+
+    def _write(self, path: str, mode: str) -> None:
+        with open(path, mode) as file:
+            file.write("x" * self.random.randint(1, 512))
+        if mode == "w":
+            self.files.append(path)
+
+    def run(self, operation: str) -> None:
+        if operation != "create" and not self.files:
+            operation = "create"
+        match operation:
+            case "create":
+                path = self._new_path()
+                self._write(path, "w")
+            case "modify":
+                path = self.random.choice(self.files)
+                self._write(path, "a")
+            case "read":
+                path = self.random.choice(self.files)
+                with open(path, "rb") as file:
+                    file.read()
+            case "delete":
+                path = self.files.pop(self.random.randrange(len(self.files)))
+                os.remove(path)
+            case _:
+                index = self.random.randrange(len(self.files))
+                source, path = self.files[index], self._new_path()
+                os.rename(source, path)
+                self.files[index] = path
+        self.operations.append((operation, path, time.monotonic()))
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {name: 0.0 for name in OPERATIONS}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"unknown operation {name}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def generate(churn: Churn, mix: dict[str, float], duration: float, rate: float) -> float:
+    """Run operations for the duration, at the rate per second or as fast as possible, return the elapsed time."""
+    names, weights = list(mix.keys()), list(mix.values())
+    start = time.monotonic()
+    done = 0
+    while (elapsed := time.monotonic() - start) < duration:
+        if rate and done >= elapsed * rate:
+            time.sleep(min(1 / rate, 0.01))
+            continue
+        for operation in churn.random.choices(names, weights, k=16 if not rate else 1):
+            churn.run(operation)
+            done += 1
+    return time.monotonic() - start
+
+
+def process_usage(pid: int) -> dict:
+    """CPU seconds and memory of a process from /proc, empty where it is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as file:
+            status = dict(line.split(":", 1) for line in file if ":" in line)
+    except OSError:
+        return {}
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        'cpu_seconds': (int(fields[11]) + int(fields[12])) / ticks,
+        'rss_mb': int(status['VmRSS'].split()[0]) / 1024,
+        'peak_rss_mb': int(status['VmHWM'].split()[0]) / 1024,
+    }
+
+
+def latency_summary(operations: list[tuple[str, str, float]], arrivals: dict[str, list[float]]) -> dict:
+    """
+    Per operation kind, the time until the file was seen by the ingest server, before the next operation
+    on the file took over. Reads take over nothing, they change no metadata unless atime is updated.
+    Operations without an event of their own, like a modification merged into the next one or a delete,
+    are counted as not ingested.
+    """
+    latencies: dict[str, list[float]] = {name: [] for name in OPERATIONS}
+    unmatched = {name: 0 for name in OPERATIONS}
+    by_path: dict[str, list[tuple[str, float]]] = dict()
+    for operation, path, moment in operations:
+        by_path.setdefault(path, []).append((operation, moment))
+
+    for path, path_operations in by_path.items():
+        for position, (operation, moment) in enumerate(path_operations):
+            end = next((
+                later for name, later in path_operations[position + 1:] if operation == "read" or name != "read"
+            ), float("inf"))
+            arrival = next((arrival for arrival in arrivals.get(path, ()) if moment <= arrival < end), None)
+            if arrival is None:
+                unmatched[operation] += 1
+            else:
+                latencies[operation].append(arrival - moment)
+
+    def percentiles(values: list[float]) -> dict:
+        values.sort()
+
+        def pick(p: float) -> float:
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+        return {'count': len(values), 'p50_ms': pick(0.5), 'p90_ms': pick(0.9), 'p99_ms': pick(0.99),
+                'max_ms': round(values[-1] * 1000, 1)} if values else {'count': 0}
+
+    every = [latency for values in latencies.values() for latency in values]
+    summary = {name: {**percentiles(values), 'not_ingested': unmatched[name]} for name, values in latencies.items()}
+    summary['all'] = {**percentiles(every), 'not_ingested': sum(unmatched.values())}
+    return summary
+
+
+async def wait_for_socket(socket_file: str, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while not os.path.exists(socket_file):
+        if server.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("The daemon did not start, see its log in the work directory")
+        await asyncio.sleep(0.05)
+
+
+async def wait_for_drain(recorder: IngestRecorder) -> None:
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while time.monotonic() - recorder.last_arrival < DRAIN_IDLE_SECONDS and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args: argparse.Namespace, work_dir: str) -> dict:
+    recorder = IngestRecorder()
+    stub = MetadataRelay(recorder)
+    await stub.start("127.0.0.1", args.ingest_port)
+    ingest_port = stub.server.sockets[0].getsockname()[1]
+
+    tree = os.path.join(work_dir, "tree")
+    churn = Churn(tree, args.files, args.directories, args.seed)
+
+    socket_file = os.path.join(work_dir, "server.sock")
+    environment = dict(
+        os.environ,
+        PID_FILE=os.path.join(work_dir, "server.pid"),
+        SOCKET_FILE=socket_file,
+        LOG_FILE=os.path.join(work_dir, "server.log"),
+        SPOOL_FILE=os.path.join(work_dir, "upload-spool.jsonl"),
+        MAIN_SERVER_URL=f"http://127.0.0.1:{ingest_port}",
+    )
+    command = [sys.executable, "-m", "eba_file_tracker.server", "-ux", "-el", args.event_loop, *args.server_args]
+    server = subprocess.Popen(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_socket(socket_file, server)
+        async with TrackerClient(socket_file=socket_file) as client:
+            await client.add_directory(tree, 1)
+            while (await client.info(tree)).file_count < args.files:
+                await asyncio.sleep(0.1)  # the initial scan
+            await wait_for_drain(recorder)
+            initial_events = recorder.events
+
+            before = process_usage(server.pid)
+            recorder.arrivals.clear()
+            elapsed = await asyncio.to_thread(generate, churn, parse_mix(args.mix), args.duration, args.rate)
+            await wait_for_drain(recorder)
+            after = process_usage(server.pid)
+            statistics = (await client.ping()).statistics
+    finally:
+        server.terminate()
+        await asyncio.to_thread(server.wait)
+        await stub.stop()
+
+    events = recorder.events - initial_events
+    return {
+        'commit': git_commit(),
+        'parameters': {name: value for name, value in vars(args).items() if name != 'output'},
+        'operations': len(churn.operations),
+        'operations_per_second': round(len(churn.operations) / elapsed, 1),
+        'ingested_events': events,
+        'ingested_events_per_second': round(events / elapsed, 1),
+        'initial_scan_events': initial_events,
+        'latency': latency_summary(churn.operations, recorder.arrivals),
+        'daemon': {
+            'cpu_seconds': round(after['cpu_seconds'] - before['cpu_seconds'], 2),
+            'cpu_percent': round((after['cpu_seconds'] - before['cpu_seconds']) / elapsed * 100, 1),
+            'rss_mb': round(after['rss_mb'], 1),
+            'peak_rss_mb': round(after['peak_rss_mb'], 1),
+        } if before and after else None,
+        'statistics': statistics,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Daemon load benchmark.")
+    parser.add_argument("-f", "--files", type=int, default=2000, help="files created before the daemon starts")
+    parser.add_argument("-d", "--directories", type=int, default=20, help="directories the files are spread over")
+    parser.add_argument("-t", "--duration", type=float, default=20.0, help="seconds of churn")
+    parser.add_argument("-r", "--rate", type=float, default=500.0, help="operations per second, 0 for no limit")
+    parser.add_argument("-m", "--mix", default=DEFAULT_MIX, help="weights of the operations")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the operations")
+    parser.add_argument("-el", "--event-loop", default="auto", help="event loop of the daemon")
+    parser.add_argument("-p", "--ingest-port", type=int, default=0, help="port of the stub ingest server")
+    parser.add_argument("-o", "--output", default=None, help="write the JSON results to this file")
+    parser.add_argument("server_args", nargs="*", help="more daemon options, after --")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    work_dir = tempfile.mkdtemp(prefix="bench-churn-")
+    try:
+        results = asyncio.run(benchmark(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
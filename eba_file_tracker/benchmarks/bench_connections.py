@@ -0,0 +1,239 @@
+"""
+Client concurrency benchmark and load test of the command socket.
+
+Starts a server of its own in each mode (event loop, UDS or TCP) and runs many concurrent clients, which
+send a mix of ADD, INFO and LIST commands. CLI clients open a new connection per command, like an
+invocation of file-tracker does, SDK clients keep one session each. Reports the throughput, the latency
+percentiles per command and the error rate of every mode, so listen backlogs and event loops can be
+compared under a burst, and exits with a non-zero status when a mode misses the thresholds.
+
+Run from the eba_file_tracker project directory, a server already running is left alone:
+    python -m benchmarks.bench_connections -c 200 -n 20 -m add=1,info=8,list=1 --max-p99-ms 500
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+COMMANDS = ("add", "info", "list")
+DEFAULT_MIX = "add=1,info=8,list=1"
+SERVER_START_TIMEOUT = 10.0
+
+
+def available_loops() -> list[str]:
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return ["asyncio"]
+    return ["asyncio", "uvloop"]
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {name: 0.0 for name in COMMANDS}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"unknown command {name}, expected one of {', '.join(COMMANDS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Target:
+    """Where the server of one mode listens."""
+    def __init__(self, work_dir: str, unix: bool) -> None:
+        self.unix = unix
+        self.socket_file = os.path.join(work_dir, "server.sock")
+        self.port = free_port()
+        self.environment = dict(
+            os.environ,
+            PID_FILE=os.path.join(work_dir, "server.pid"),
+            SOCKET_FILE=self.socket_file,
+            HOST_NAME="127.0.0.1",
+            HOST_PORT=str(self.port),
+            LOG_FILE=os.path.join(work_dir, "server.log"),
+            SPOOL_FILE=os.path.join(work_dir, "upload-spool.jsonl"),
+            MAIN_SERVER_URL="http://127.0.0.1:9",  # nothing listens, the uploader spools
+        )
+
+    async def open_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_unix_connection(self.socket_file) if self.unix \
+            else await asyncio.open_connection("127.0.0.1", self.port)
+
+
+async def wait_for_server(target: Target, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            _, writer = await target.open_connection()
+            writer.close()
+            return
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The server did not start")
+            await asyncio.sleep(0.05)
+
+
+def make_requests(files: list[str], mix: dict[str, float], count: int, seed: int) -> list[tuple[str, bytes]]:
+    generator = random.Random(seed)
+    requests = []
+    for name in generator.choices(list(mix.keys()), list(mix.values()), k=count):
+        match name:
+            case "add":
+                data = {'command': 'add', 'files': [[generator.choice(files), 1]]}
+            case "info":
+                data = {'command': 'info', 'file_path': generator.choice(files)}
+            case _:
+                data = {'command': 'list'}
+        requests.append((name, json.dumps(data).encode()))
+    return requests
+
+
+async def run_clients(target: Target, args: argparse.Namespace, files: list[str], session: bool) -> dict:
+    """Run the clients against a started server, return the results of the mode."""
+    mix = parse_mix(args.mix)
+    latencies: dict[str, list[float]] = {name: [] for name in COMMANDS}
+    errors = 0
+
+    async def one_shot(name: str, request: bytes) -> None:
+        reader, writer = await target.open_connection()
+        try:
+            writer.write(request)
+            writer.write_eof()
+            if not await reader.read() and name != "list":  # an empty list is streamed as no lines at all
+                raise ConnectionError("no response")
+        finally:
+            writer.close()
+
+    async def client(index: int) -> None:
+        nonlocal errors
+        reader = writer = None
+        for name, request in make_requests(files, mix, args.requests, args.seed + index):
+            start = time.perf_counter()
+            try:
+                if not session:
+                    await one_shot(name, request)
+                else:
+                    if writer is None:
+                        reader, writer = await target.open_connection()
+                    writer.write(request + b"\n")
+                    if name == "list":  # streamed, ends with an empty line
+                        while (line := await reader.readline()) not in (b"\n", b""):
+                            pass
+                    else:
+                        line = await reader.readline()
+                    if not line.endswith(b"\n"):
+                        raise ConnectionError("session closed")
+                latencies[name].append(time.perf_counter() - start)
+            except OSError:
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    def percentiles(values: list[float]) -> dict:
+        values.sort()
+
+        def pick(p: float) -> float:
+            return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+        return {'count': len(values), 'p50_ms': pick(0.5), 'p99_ms': pick(0.99)} if values else {'count': 0}
+
+    every = [latency for values in latencies.values() for latency in values]
+    total = len(every) + errors
+    return {
+        'requests_per_second': round(len(every) / elapsed),
+        **percentiles(every),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'commands': {name: percentiles(values) for name, values in latencies.items() if values},
+    }
+
+
+def benchmark(loop: str, unix: bool, session: bool, args: argparse.Namespace) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench-connections-")
+    files = []
+    for i in range(args.files):
+        files.append(os.path.join(work_dir, f"d{i % 10}", f"f{i}"))
+        os.makedirs(os.path.dirname(files[-1]), exist_ok=True)
+        with open(files[-1], "w") as file:
+            file.write("x")
+
+    target = Target(work_dir, unix)
+    command = [sys.executable, "-m", "eba_file_tracker.server", "-el", loop, "-bl", str(args.backlog)]
+    if unix:
+        command.append("-ux")
+    server = subprocess.Popen(command, env=target.environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_server(target, server))
+        return asyncio.run(run_clients(target, args, files, session))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def check_thresholds(mode: str, result: dict, args: argparse.Namespace) -> list[str]:
+    failures = []
+    if result['error_rate'] > args.max_error_rate:
+        failures.append(f"{mode}: error rate {result['error_rate']} > {args.max_error_rate}")
+    if args.max_p99_ms and result.get('p99_ms') is not None and result['p99_ms'] > args.max_p99_ms:
+        failures.append(f"{mode}: p99 {result['p99_ms']} ms > {args.max_p99_ms} ms")
+    if result['requests_per_second'] < args.min_rps:
+        failures.append(f"{mode}: {result['requests_per_second']} requests/s < {args.min_rps}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Client concurrency benchmark.")
+    parser.add_argument("-c", "--clients", type=int, default=200, help="concurrent clients")
+    parser.add_argument("-n", "--requests", type=int, default=20, help="requests of each client")
+    parser.add_argument("-m", "--mix", default=DEFAULT_MIX, help="weights of the commands")
+    parser.add_argument("-f", "--files", type=int, default=1000, help="files the commands pick from")
+    parser.add_argument("-bl", "--backlog", type=int, default=1024, help="listen backlog of the server")
+    parser.add_argument("-k", "--kind", choices=("cli", "sdk", "both"), default="both",
+                        help="cli clients connect per command, sdk clients keep a session")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the command sequences")
+    parser.add_argument("--max-p99-ms", type=float, default=0.0, help="fail above this p99 latency, 0 disables")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="fail above this share of failed requests")
+    parser.add_argument("--min-rps", type=float, default=0.0, help="fail below this throughput")
+    parser.add_argument("-o", "--output", default=None, help="also write the results as JSON to this file")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    results = dict()
+    failures = []
+    for loop in available_loops():
+        for unix in (True, False):
+            for session in ((False, True) if args.kind == "both" else (args.kind == "sdk",)):
+                mode = f"{loop} {'uds' if unix else 'tcp'} {'sdk' if session else 'cli'}"
+                results[mode] = benchmark(loop, unix, session, args)
+                failures += check_thresholds(mode, results[mode], args)
+                print(mode, {name: value for name, value in results[mode].items() if name != 'commands'})
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({'parameters': {**vars(args), 'output': None}, 'results': results}, file, indent=4)
+    if failures:
+        sys.exit("thresholds missed:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
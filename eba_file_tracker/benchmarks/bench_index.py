@@ -0,0 +1,69 @@
+"""
+Memory benchmark of the tracked-file index.
+
+Compares FileIndex with the previous layout (per-directory dicts of full path -> File dataclass)
+and reports the retained bytes per tracked file.
+
+Run from the eba_file_tracker project directory:
+    python -m benchmarks.bench_index -n 1000000 -d 2000
+"""
+import gc
+import time
+import argparse
+import tracemalloc
+from typing import Callable, Iterator
+from eba_file_tracker.core.index import FileIndex
+from eba_file_tracker.core.models.tracker import File
+
+
+def generate_paths(count: int, directories: int) -> Iterator[tuple[str, int]]:
+    per_directory = max(count // directories, 1)
+    for i in range(count):
+        directory = i // per_directory
+        yield f"/data/datasets/project-{directory % 97:02d}/split-{directory:06d}/part-{i:08d}.parquet", directory % 50
+
+
+def build_legacy(paths: Iterator[tuple[str, int]]) -> dict[str, dict[str, File]]:
+    import os
+    trackers: dict[str, dict[str, File]] = dict()
+    for file_path, file_id in paths:
+        trackers.setdefault(os.path.dirname(file_path), dict())[file_path] = File(file_path=file_path, file_id=file_id)
+    return trackers
+
+
+def build_index(paths: Iterator[tuple[str, int]]) -> FileIndex:
+    index = FileIndex()
+    for file_path, file_id in paths:
+        index.add(file_path, file_id)
+    return index
+
+
+def measure(build: Callable, count: int, directories: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    structure = build(generate_paths(count, directories))
+    elapsed = time.perf_counter() - start
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del structure
+
+    return {
+        'bytes_per_file': round(retained / count, 1),
+        'total_mib': round(retained / 2 ** 20, 1),
+        'build_seconds': round(elapsed, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tracked-file index memory benchmark.")
+    parser.add_argument("-n", "--count", type=int, default=1_000_000, help="number of tracked files")
+    parser.add_argument("-d", "--directories", type=int, default=2000, help="number of directories")
+    args = parser.parse_args()
+
+    for name, build in (('legacy', build_legacy), ('index', build_index)):
+        print(name, measure(build, args.count, args.directories))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of building and serializing the metadata record of one event.
+
+Compares the current FileMetadata with the previous dataclass-based record
+(gethostname + three strftime per event, reflective to_json_data).
+
+Run from the eba_file_tracker project directory:
+    python -m benchmarks.bench_metadata -n 100000
+"""
+import os
+import time
+import socket
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from dataclasses import dataclass, fields
+from eba_file_tracker.core.models.tracker import FileMetadata
+
+
+def _legacy_format(timestamp) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+@dataclass
+class LegacyFileMetadata:
+    hostname: str
+    file_path: str
+    dataset_general_info_id: int
+    age: str
+    access_rights: str
+    last_access_date: str
+    last_modification_date: str
+    size: int
+
+    def to_json_data(self) -> dict:
+        json_data = {}
+        for field in fields(self):
+            json_data[field.name] = getattr(self, field.name)
+        return json_data
+
+
+def build_legacy(file_path: str, stats: os.stat_result) -> LegacyFileMetadata:
+    return LegacyFileMetadata(
+        hostname=socket.gethostname(),
+        file_path=file_path,
+        dataset_general_info_id=1,
+        age=_legacy_format(stats.st_ctime),
+        access_rights=oct(stats.st_mode)[-3:],
+        last_access_date=_legacy_format(stats.st_atime),
+        last_modification_date=_legacy_format(stats.st_mtime),
+        size=stats.st_size,
+    )
+
+
+def build_current(file_path: str, stats: os.stat_result) -> FileMetadata:
+    return FileMetadata.from_stat(file_path, 1, stats)
+
+
+def measure(build, file_path: str, stats: os.stat_result, count: int) -> dict:
+    # CPU: record creation alone, then creation + wire serialization
+    start = time.process_time_ns()
+    for _ in range(count):
+        build(file_path, stats)
+    build_ns = (time.process_time_ns() - start) / count
+
+    start = time.process_time_ns()
+    for _ in range(count):
+        build(file_path, stats).to_json_data()
+    serialize_ns = (time.process_time_ns() - start) / count
+
+    # memory: bytes and blocks retained by the records themselves
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [build(file_path, stats) for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in diff)
+    blocks = sum(stat.count_diff for stat in diff)
+    del records
+
+    return {
+        'build_ns_per_event': round(build_ns),
+        'build_and_serialize_ns_per_event': round(serialize_ns),
+        'retained_bytes_per_event': round(size / count, 1),
+        'allocations_per_event': round(blocks / count, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FileMetadata micro-benchmark.")
+    parser.add_argument("-n", "--count", type=int, default=100_000, help="number of events to simulate")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as file:
+        stats = os.stat(file.name)
+        for name, build in (('legacy', build_legacy), ('current', build_current)):
+            print(name, measure(build, file.name, stats, args.count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Client startup benchmark.
+
+Times `file-tracker status` against a bare interpreter start, so the result does not depend on
+how slow the interpreter and its site packages are on the machine, and checks that the status
+fast path loads neither click nor asyncio. Exits with a non-zero status when the overhead of
+the client goes above the limit, so it can guard the startup time in CI.
+
+Run from the eba_file_tracker project directory, with or without a running server:
+    python -m benchmarks.bench_startup -r 20 -l 30
+"""
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# run the client in-process after the startup, to see which modules the status check has loaded
+IMPORTED_MODULES_SCRIPT = """
+import sys
+sys.argv = ["file-tracker", "status"]
+from eba_file_tracker.client import main
+main()
+print(",".join(name for name in ("click", "asyncio", "dotenv") if name in sys.modules))
+"""
+
+
+def measure(command: list[str], runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summary(timings: list[float]) -> dict:
+    return {'best_ms': round(min(timings), 1), 'median_ms': round(statistics.median(timings), 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Client startup benchmark.")
+    parser.add_argument("-r", "--runs", type=int, default=20, help="process starts of each command")
+    parser.add_argument("-l", "--limit", type=float, default=30.0, help="allowed overhead over python, ms")
+    args = parser.parse_args()
+
+    measure([sys.executable, "-m", "eba_file_tracker.client", "status"], 1)  # warm up the bytecode cache
+    interpreter = measure([sys.executable, "-c", "pass"], args.runs)
+    status = measure([sys.executable, "-m", "eba_file_tracker.client", "status"], args.runs)
+    overhead = min(status) - min(interpreter)
+
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORTED_MODULES_SCRIPT], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    heavy_modules = output[-1] if output else ""
+
+    print('python', summary(interpreter))
+    print('status', summary(status))
+    print('overhead', {'ms': round(overhead, 1), 'limit_ms': args.limit, 'heavy_modules': heavy_modules or None})
+
+    if overhead > args.limit or heavy_modules:
+        sys.exit("client startup regressed")
+
+
+if __name__ == "__main__":
+    main()
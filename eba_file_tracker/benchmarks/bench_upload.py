@@ -0,0 +1,62 @@
+"""
+Upload size benchmark.
+
+Compares the bytes put on the wire for a stream of metadata events when every event is posted
+as its own JSON request on a new connection (the previous uploader) and when events are sent
+in gzip-compressed columnar batches over a persistent connection.
+
+Run from the eba_file_tracker project directory:
+    python -m benchmarks.bench_upload -n 100000 -b 512
+"""
+import json
+import time
+import argparse
+from eba_file_tracker.core.models.tracker import FileMetadata
+from eba_file_tracker.core.uploader import encode_batch
+
+# request line and headers requests sends for a small JSON POST, plus the response headers
+HTTP_OVERHEAD_BYTES = 400
+# SYN/SYN-ACK/ACK and FIN/ACK exchanges of a short-lived TCP connection
+TCP_HANDSHAKE_BYTES = 7 * 66
+
+
+def generate_events(count: int) -> list[FileMetadata]:
+    now = time.time_ns()
+    return [
+        FileMetadata(
+            "worker-017.cluster.local", f"/data/datasets/project-{i % 97:02d}/part-{i % 5000:08d}.parquet",
+            i % 50, now - 86_400_000_000_000, 0o644, now - (i % 3600) * 1_000_000_000, now - i * 1_000_000,
+            (1 << 20) + i * 4099,
+        )
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Metadata upload size benchmark.")
+    parser.add_argument("-n", "--count", type=int, default=100_000, help="number of events")
+    parser.add_argument("-b", "--batch-size", type=int, default=512, help="events per batch")
+    args = parser.parse_args()
+
+    events = generate_events(args.count)
+
+    legacy = sum(len(json.dumps(m.to_json_data())) for m in events)
+    legacy += args.count * (HTTP_OVERHEAD_BYTES + TCP_HANDSHAKE_BYTES)
+
+    start = time.perf_counter()
+    batches = [encode_batch(events[i:i + args.batch_size]) for i in range(0, args.count, args.batch_size)]
+    encode_seconds = time.perf_counter() - start
+    batched = sum(len(body) for body in batches) + len(batches) * HTTP_OVERHEAD_BYTES + TCP_HANDSHAKE_BYTES
+
+    print('legacy', {'bytes_per_event': round(legacy / args.count, 1), 'connections': args.count})
+    print('batched', {
+        'bytes_per_event': round(batched / args.count, 1),
+        'connections': 1,
+        'requests': len(batches),
+        'encode_us_per_event': round(encode_seconds / args.count * 1e6, 2),
+    })
+    print('reduction', round(legacy / batched, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import os
+import asyncio
+import signal
+import click
+from datetime import datetime
+from pathlib import Path
+from .core.models.command import Command, AddCommand, AddDirectoryCommand, RemoveCommand, InfoCommand, \
+    BatchInfoCommand, WatchCommand, HistoryCommand, ProfileCommand, SimpleCommand, CommandType
+from .core.models.tracker import File
+from .core.models.result import CommandResult, ListTrackingInfoResult, ListTrackedInfoResult, PingResult, InfoResult, \
+    ListInfoResult, DirectoryInfoResult, ListHistoryResult, ListProfileResult, parse_result
+from .core.communication.json_transfer import read_json, write_json, read_json_lines
+from .core.communication.system import get_pid
+from .response import ResponseFormatter
+from .state import PID_FILE, SOCKET_FILE, HOST_NAME, HOST_PORT, get_state, slim_ping, print_status
+
+
+async def open_connection() -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    return await asyncio.open_unix_connection(SOCKET_FILE) \
+        if get_state().use_unix_optimization \
+        else await asyncio.open_connection(HOST_NAME, HOST_PORT)
+
+
+async def send_command(command: Command) -> CommandResult:
+    reader, writer = await open_connection()
+
+    try:
+        await write_json(writer, command.to_json_data())
+        json_data = [item async for item in read_json_lines(reader)] if command.type.streamed \
+            else await read_json(reader)
+        result = parse_result(command.type, json_data)
+        return result
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def echo_events(command: WatchCommand) -> None:
+    """Print metadata events pushed by the server until the connection is closed."""
+    reader, writer = await open_connection()
+
+    try:
+        await write_json(writer, command.to_json_data())
+        async for json_data in read_json_lines(reader):
+            click.echo(ResponseFormatter.make_from_event(InfoResult.from_json_data(json_data)))
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def send_ping() -> PingResult:
+    """Send ping command to the server."""
+    return asyncio.run(send_command(SimpleCommand(CommandType.PING)))
+
+
+@click.group()
+def cli():
+    """A client for managing a file tracking server."""
+    pass
+
+
+@cli.command()
+@click.option(
+    '-no', '--no-optimization', is_flag=True,
+    help="Don't use UNIX optimizations, even if they are available."
+)
+@click.option(
+    '-ct', '--info-cache-ttl', type=float, default=None,
+    help="Seconds a cached INFO result stays valid if no file event arrives, 0 disables the cache."
+)
+@click.option(
+    '-hl', '--history-length', type=int, default=None,
+    help="Recent events kept per file for the history command, 0 disables the history."
+)
+@click.option(
+    '-hf', '--history-files', type=int, default=None,
+    help="Files with a kept history, the least recently changed ones are forgotten first."
+)
+@click.option(
+    '-rp', '--relay-port', type=int, default=None,
+    help="Also relay event batches of other daemons, which point MAIN_SERVER_URL at this host and port."
+)
+@click.option(
+    '-rh', '--relay-host', default=None,
+    help="Address the relay listens on, HOST_NAME by default. It does not authenticate daemons."
+)
+@click.option(
+    '-ds', '--desired-state-interval', type=float, default=None,
+    help="Seconds between polls of the paths the main server wants tracked on this host, 0 disables the sync."
+)
+@click.option(
+    '-hb', '--heartbeat-interval', type=float, default=None,
+    help="Seconds between heartbeats telling the main server the daemon is alive, 0 disables them."
+)
+@click.option(
+    '-sh', '--shards', type=int, default=None,
+    help="Split the tracked directories between this many worker processes."
+)
+@click.option(
+    '-el', '--event-loop', type=click.Choice(["auto", "asyncio", "uvloop"]), default=None,
+    help="Event loop of the server, auto takes uvloop when it is installed."
+)
+@click.option(
+    '-bl', '--backlog', type=int, default=None,
+    help="Connections waiting to be accepted before new ones are refused."
+)
+def start(
+    no_optimization: bool,
+    info_cache_ttl: float | None,
+    history_length: int | None,
+    history_files: int | None,
+    relay_port: int | None,
+    relay_host: str | None,
+    desired_state_interval: float | None,
+    heartbeat_interval: float | None,
+    shards: int | None,
+    event_loop: str | None,
+    backlog: int | None
+) -> None:
+    """Start the file tracking server."""
+    if slim_ping():
+        send_ping()
+        click.echo("Server is already working")
+        return
+
+    if no_optimization:
+        get_state().use_unix_optimization = False
+
+    server_path = Path("eba_file_tracker.server")
+    start_cmd = f"python3 -m {server_path} -rl"
+    if get_state().use_unix_optimization:
+        start_cmd += " -ux"
+    if info_cache_ttl is not None:
+        start_cmd += f" -ct {info_cache_ttl}"
+    if history_length is not None:
+        start_cmd += f" -hl {history_length}"
+    if history_files is not None:
+        start_cmd += f" -hf {history_files}"
+    if relay_port is not None:
+        start_cmd += f" -rp {relay_port}"
+    if relay_host is not None:
+        start_cmd += f" -rh {relay_host}"
+    if desired_state_interval is not None:
+        start_cmd += f" -ds {desired_state_interval}"
+    if heartbeat_interval is not None:
+        start_cmd += f" -hb {heartbeat_interval}"
+    if shards is not None:
+        start_cmd += f" -sh {shards}"
+    if event_loop is not None:
+        start_cmd += f" -el {event_loop}"
+    if backlog is not None:
+        start_cmd += f" -bl {backlog}"
+
+    os.system(start_cmd)
+
+    ping_result = send_ping()
+    click.echo("Server start work with configuration:")
+    click.echo(ResponseFormatter.make_from_configuration(ping_result.configuration))
+
+
+@cli.command()
+def stop() -> None:
+    """Stop the file tracking server."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    send_ping()
+    get_state().clear()
+    pid = get_pid(PID_FILE)
+    os.kill(pid, signal.SIGTERM)
+    click.echo("Server stopped")
+
+
+@cli.command()
+def status() -> None:
+    """The status of the file tracking server."""
+    print_status()
+
+
+@cli.command()
+@click.argument('file_path', type=click.Path(exists=True))
+@click.argument('file_id', type=int)
+def add(file_path: str, file_id: int) -> None:
+    """
+    Add files to tracking.
+    :param file_path: full path to the file, or to a directory to track every file under it as one dataset
+    :param file_id: id of the file from the main serve.
+    """
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    if os.path.isdir(file_path):
+        command = AddDirectoryCommand(os.path.abspath(file_path), file_id)
+        result: DirectoryInfoResult = asyncio.run(send_command(command))
+        click.echo(ResponseFormatter.make_from_directory(result))
+        return
+
+    results: ListTrackingInfoResult = asyncio.run(send_command(AddCommand([File(file_path, file_id)])))
+    click.echo(ResponseFormatter.make_from_add(results))
+
+
+@cli.command()
+@click.argument("file_paths", nargs=-1, type=click.Path())
+@click.option('-p', '--prefix', default=None, help="Also report every tracked file under this path prefix.")
+def info(file_paths: tuple, prefix: str | None) -> None:
+    """Information about the tracked files, or the totals of a tracked directory."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    if len(file_paths) == 1 and prefix is None:
+        file_path = os.path.abspath(file_paths[0])
+        results: InfoResult | DirectoryInfoResult = asyncio.run(send_command(InfoCommand(file_path)))
+        click.echo(
+            ResponseFormatter.make_from_directory(results) if isinstance(results, DirectoryInfoResult)
+            else ResponseFormatter.make_from_info(results)
+        )
+        return
+
+    file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+    prefix = os.path.abspath(prefix) if prefix else None
+    results: ListInfoResult = asyncio.run(send_command(BatchInfoCommand(file_paths, prefix)))
+    click.echo(ResponseFormatter.make_from_batch_info(results, file_paths))
+
+
+@cli.command()
+@click.option('-p', '--prefix', default=None, help="Only report files under this path prefix.")
+@click.option(
+    '-b', '--buffer-size', type=int, default=None,
+    help="Events the server keeps for this watcher before dropping the oldest ones."
+)
+def watch(prefix: str | None, buffer_size: int | None) -> None:
+    """Print changes of tracked files as they happen."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    prefix = os.path.abspath(prefix) if prefix else None
+    try:
+        asyncio.run(echo_events(WatchCommand(prefix, buffer_size)))
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.argument("file_paths", nargs=-1, type=click.Path())
+@click.option('-p', '--prefix', default=None, help="Also report every file under this path prefix.")
+@click.option('-s', '--since', type=click.DateTime(), default=None, help="Only events at or after this local time.")
+@click.option('-u', '--until', type=click.DateTime(), default=None, help="Only events at or before this local time.")
+def history(file_paths: tuple, prefix: str | None, since: datetime | None, until: datetime | None) -> None:
+    """Recent events of files, kept by the server."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+    prefix = os.path.abspath(prefix) if prefix else None
+    command = HistoryCommand(
+        file_paths, prefix,
+        int(since.timestamp() * 1_000_000_000) if since else None,
+        int(until.timestamp() * 1_000_000_000) if until else None
+    )
+    results: ListHistoryResult = asyncio.run(send_command(command))
+    click.echo(ResponseFormatter.make_from_history(results))
+
+
+@cli.command()
+@click.option('-m', '--memory', is_flag=True, help="Take a memory snapshot instead of profiling the CPU.")
+@click.option('-t', '--seconds', type=float, default=None, help="Seconds to profile the CPU for.")
+@click.option('--stop', is_flag=True, help="With --memory, stop memory tracing.")
+def profile(memory: bool, seconds: float | None, stop: bool) -> None:
+    """
+    Profile the running server, the reports are written next to its log.
+    The first memory snapshot only starts tracing, the next ones report the growth since the previous one.
+    """
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    results: ListProfileResult = asyncio.run(send_command(ProfileCommand(memory, seconds, stop)))
+    click.echo(ResponseFormatter.make_from_profile(results))
+
+
+@cli.command()
+@click.argument("file_paths", nargs=-1, type=click.Path())
+def remove(file_paths: tuple) -> None:
+    """Remove files from tracking."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    file_paths = list(file_paths)
+    results: ListTrackingInfoResult = asyncio.run(send_command(RemoveCommand(file_paths)))
+    click.echo(ResponseFormatter.make_from_remove(results))
+
+
+@cli.command(name="list")
+def get_list() -> None:
+    """List all tracked files."""
+    if not slim_ping():
+        click.echo("Server is not running")
+        return
+
+    results: ListTrackedInfoResult = asyncio.run(send_command(SimpleCommand(CommandType.LIST)))
+    click.echo(ResponseFormatter.make_from_list(results))
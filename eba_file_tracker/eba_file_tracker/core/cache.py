@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import OrderedDict
+from .models.base import DictJsonData
+from .models.tracker import FileMetadata
+
+CACHE_MAX_INVALIDATIONS = 65_536  # paths whose last invalidation is remembered, the oldest are forgotten first
+
+
+class MetadataCache:
+    """
+    Short-lived cache of file metadata for INFO requests.
+    Watch events invalidate entries, the TTL only covers events that were missed (e.g. reads).
+
+    A stat racing with an event may finish after the event invalidated the path. The time of the last
+    invalidation of a path is kept, and a put of metadata stat'ed before it is dropped.
+    """
+    def __init__(self, ttl: float, max_invalidations: int = CACHE_MAX_INVALIDATIONS) -> None:
+        self.ttl_ns = int(ttl * 1_000_000_000)
+        self.max_invalidations = max_invalidations
+        self._entries: dict[str, tuple[int, FileMetadata]] = dict()
+        self._lock = threading.Lock()  # invalidations come from the observer threads
+        self._invalidated: OrderedDict[str, int] = OrderedDict()  # path: time of its last invalidation
+        self._forgotten_until_ns = 0  # invalidations up to this time are not remembered anymore
+        self.hits = 0
+        self.misses = 0
+        self.stale_puts = 0
+
+    def get(self, file_path: str) -> FileMetadata | None:
+        entry = self._entries.get(file_path)
+        if entry is not None and entry[0] > time.monotonic_ns():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, metadata: FileMetadata, stat_started_ns: int | None = None) -> None:
+        """
+        Cache metadata, unless the path was invalidated since stat_started_ns (time.monotonic_ns()
+        taken before the stat) or its invalidations are forgotten since.
+        """
+        if self.ttl_ns <= 0:
+            return
+        with self._lock:
+            if stat_started_ns is not None and (
+                stat_started_ns <= self._forgotten_until_ns
+                or self._invalidated.get(metadata.file_path, -1) >= stat_started_ns
+            ):
+                self.stale_puts += 1
+                return
+            self._entries[metadata.file_path] = (time.monotonic_ns() + self.ttl_ns, metadata)
+
+    def invalidate(self, file_path: str) -> None:
+        if self.ttl_ns <= 0:
+            return
+        with self._lock:
+            self._entries.pop(file_path, None)
+            self._invalidated[file_path] = time.monotonic_ns()
+            self._invalidated.move_to_end(file_path)
+            if len(self._invalidated) > self.max_invalidations:
+                _, self._forgotten_until_ns = self._invalidated.popitem(last=False)
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'info_cache_size': len(self._entries),
+            'info_cache_hits': self.hits,
+            'info_cache_misses': self.misses,
+            'info_cache_stale_puts': self.stale_puts,
+        }
@@ -1,7 +1,11 @@
 import json
 import asyncio
+from typing import AsyncIterator, Iterable
 from ..models.base import JsonData
 
+WRITE_BUFFER_LIMIT = 64 * 1024
+REQUEST_SIZE_LIMIT = 64 * 1024 * 1024  # stream reader limit of the servers, requests are read as one line
+
 
 async def read_json(reader: asyncio.StreamReader) -> JsonData:
     data = b""
@@ -18,6 +22,52 @@ async def write_json(writer: asyncio.StreamWriter, json_data: JsonData) -> None:
     writer.write_eof()
 
 
+async def read_json_lines(reader: asyncio.StreamReader) -> AsyncIterator[JsonData]:
+    """Read a streamed response: one JSON document per line until EOF."""
+    while line := await reader.readline():
+        if line.strip():
+            yield json.loads(line.decode("utf-8"))
+
+
+async def write_json_lines(writer: asyncio.StreamWriter, json_items: Iterable[JsonData]) -> None:
+    """Write one JSON document per line, draining only when the transport buffer fills up."""
+    for json_data in json_items:
+        writer.write(json.dumps(json_data).encode("utf-8") + b"\n")
+        if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            await writer.drain()
+    await writer.drain()
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[JsonData, bool] | None:
+    """
+    Read the next request of a connection and whether it belongs to a session, None once the client is done.
+    A request ended by EOF is the only one of its connection. A request ended by a newline opens a session:
+    the connection stays open, each response is a single line and a streamed response ends with an empty line.
+    The reader limit must fit the largest request, see REQUEST_SIZE_LIMIT.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    return json.loads(line.decode("utf-8")), line.endswith(b"\n")
+
+
+async def write_response(writer: asyncio.StreamWriter, json_data: JsonData, session: bool) -> None:
+    if not session:
+        await write_json(writer, json_data)
+        return
+    writer.write(json.dumps(json_data).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def end_stream(writer: asyncio.StreamWriter, session: bool) -> None:
+    """End a streamed response: by an empty line within a session, otherwise by EOF."""
+    if session:
+        writer.write(b"\n")
+        await writer.drain()
+    else:
+        writer.write_eof()
+
+
 def read_json_from_file(file_path: str) -> JsonData:
     with open(file_path, "r") as file:
         json_data = json.load(file)
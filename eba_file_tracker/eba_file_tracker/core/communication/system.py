@@ -3,6 +3,9 @@ import sys
 import socket
 from pathlib import Path
 
+LISTEN_BACKLOG = 1024  # pending connections, a burst of CLI invocations must not be refused
+UNIX_SOCKET_BUFFER_SIZE = 1024 * 1024
+
 
 def daemonize() -> None:
     """Making the process a daemon."""
@@ -38,25 +41,69 @@ def is_process_running(pid: int) -> None:
         return True
 
 
-def normalize_env_paths(env_file: str) -> None:
-    """Read the .env file, normalize the paths and save"""
+def normalize_env_value(value: str) -> str:
+    if ('/' in value or '\\' in value) and ('http' not in value or ':' not in value):  # look like file path
+        return Path(value).as_posix().replace('\\', '/') \
+            if os.name != 'nt' \
+            else Path(value).as_posix().replace('/', '\\')
+    return value
+
+
+def read_env_file(env_file: str) -> tuple[str, dict[str, str]]:
+    """Read the .env file, return its content and the normalized variables."""
     env_vars = {}
 
     with open(env_file, 'r') as file:
-        for line in file:
+        content = file.read()
+        for line in content.splitlines():
             if line.strip() and '=' in line:  # skip empty string and comment
                 key, value = map(str.strip, line.split('=', 1))
-                if ('/' in value or '\\' in value) and ('http' not in value or ':' not in value):  # look like file path
-                    normalized_path = Path(value).as_posix().replace('\\', '/') \
-                        if os.name != 'nt' \
-                        else Path(value).as_posix().replace('/', '\\')
-                    env_vars[key] = normalized_path
-                else:
-                    env_vars[key] = value
+                env_vars[key] = normalize_env_value(value)
+
+    return content, env_vars
+
+
+def load_env(env_file: str) -> None:
+    """
+    A light replacement of dotenv for the client: set the variables of the .env file,
+    which are not in the environment yet, with the paths normalized in memory.
+    """
+    if not os.path.exists(env_file):
+        return
+    _, env_vars = read_env_file(env_file)
+    for key, value in env_vars.items():
+        os.environ.setdefault(key, value)
 
-    with open(env_file, 'w') as file:
-        for key, value in env_vars.items():
-            file.write(f"{key}={value}\n")
+
+def normalize_env_paths(env_file: str) -> None:
+    """Read the .env file, normalize the paths and save"""
+    content, env_vars = read_env_file(env_file)
+
+    normalized = "".join(f"{key}={value}\n" for key, value in env_vars.items())
+    if normalized == content:
+        return
+
+    # several processes (e.g. shards) start at once, readers must never see a partial file
+    temporary_file = f"{env_file}.{os.getpid()}.tmp"
+    with open(temporary_file, 'w') as file:
+        file.write(normalized)
+    os.replace(temporary_file, env_file)
+
+
+def read_inotify_limit() -> int | None:
+    """
+    Number of directories the daemon may watch with inotify, None where inotify is unavailable.
+    watchdog opens an inotify instance for each watched directory,
+    so both the watch and the instance limits of the user apply.
+    """
+    limits = []
+    for name in ("max_user_watches", "max_user_instances"):
+        try:
+            with open(f"/proc/sys/fs/inotify/{name}", "r") as file:
+                limits.append(int(file.read().strip()))
+        except (OSError, ValueError):
+            return None
+    return min(limits)
 
 
 def clear_files(file_paths: list[str] | str) -> None:
@@ -67,12 +114,26 @@ def clear_files(file_paths: list[str] | str) -> None:
             os.remove(file)
 
 
-def get_tcp_ip_socket(host: str, port: int) -> socket.socket:
+def get_tcp_ip_socket(host: str, port: int, backlog: int = LISTEN_BACKLOG) -> socket.socket:
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # inherited by the accepted sockets
 
     sock.bind((host, port))
-    sock.listen(5)
+    sock.listen(backlog)
     sock.setblocking(False)
 
     return sock
+
+
+def tune_unix_connection(sock: socket.socket) -> None:
+    """
+    Enlarge the buffers of an accepted unix socket, so large responses are written in fewer wakeups.
+    Unlike TCP ones, unix sockets are neither autotuned nor inherit the options of the listening socket.
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UNIX_SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UNIX_SOCKET_BUFFER_SIZE)
+    except OSError:
+        pass  # a transport without a real socket, the defaults stay
+
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import requests
+from typing import Awaitable, Callable
+from .models.base import DictJsonData, JsonData
+from .models.command import Command, AddCommand, AddDirectoryCommand, RemoveCommand
+from .models.result import TrackingStatus
+from .models.tracker import File, HOSTNAME
+
+DESIRED_STATE_PATH = "/client/desired_state"
+DESIRED_STATE_INTERVAL = 60.0  # seconds between polls
+DESIRED_STATE_TIMEOUT = 30.0
+DESIRED_STATE_BATCH_SIZE = 1000  # files per ADD or REMOVE command
+
+CommandExecutor = Callable[[Command], Awaitable[JsonData]]
+
+
+class DesiredState:
+    """The files and directories the main server wants a host to track, by path with their dataset ids."""
+    def __init__(self, files: dict[str, int] | None = None, directories: dict[str, int] | None = None) -> None:
+        self.files = files or dict()
+        self.directories = directories or dict()
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'DesiredState':
+        return DesiredState(
+            {path: file_id for path, file_id in json_data['files']},
+            {path: file_id for path, file_id in json_data['directories']},
+        )
+
+    def changes_to(self, desired: 'DesiredState') -> tuple[list[str], list[File], list[File]]:
+        """Paths to remove, files and directories to add to get from this state to the desired one."""
+        removed = [path for path, file_id in self.files.items() if desired.files.get(path) != file_id]
+        removed += [path for path, file_id in self.directories.items() if desired.directories.get(path) != file_id]
+        added_files = [
+            File(path, file_id) for path, file_id in desired.files.items() if self.files.get(path) != file_id
+        ]
+        added_directories = [
+            File(path, file_id) for path, file_id in desired.directories.items()
+            if self.directories.get(path) != file_id
+        ]
+        return removed, added_files, added_directories
+
+
+class DesiredStateSync:
+    """
+    Polls the main server for the desired state of this host and applies only what changed since the last poll.
+    The state is fetched with the ETag of the last one, so an unchanged state costs a single 304 response.
+    Paths the sync did not add, like files added by hand, are never removed by it.
+    Desired paths which do not exist yet are retried on every poll until they appear.
+    """
+    def __init__(self, server_url: str, execute: CommandExecutor, interval: float = DESIRED_STATE_INTERVAL) -> None:
+        self.url = server_url.rstrip('/') + DESIRED_STATE_PATH
+        self.execute = execute
+        self.interval = interval
+        self.applied = DesiredState()
+        self.missing = DesiredState()
+        self.etag: str | None = None
+
+        self._session = requests.Session()
+        self._session.headers.update({'Accept-Encoding': 'gzip'})
+        self._task: asyncio.Task | None = None
+
+        self.polls = 0
+        self.unchanged_polls = 0
+        self.failed_polls = 0
+        self.added_paths = 0
+        self.removed_paths = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._session.close()
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'desired_state_polls': self.polls,
+            'desired_state_unchanged_polls': self.unchanged_polls,
+            'desired_state_failed_polls': self.failed_polls,
+            'desired_state_added_paths': self.added_paths,
+            'desired_state_removed_paths': self.removed_paths,
+            'desired_state_missing_paths': len(self.missing.files) + len(self.missing.directories),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                self.failed_polls += 1
+                logging.error(f"Couldn't sync the desired state: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sync(self) -> None:
+        self.polls += 1
+        loop = asyncio.get_running_loop()
+        fetched = await loop.run_in_executor(None, self._fetch)
+        if fetched is None:
+            self.unchanged_polls += 1
+            if self.missing.files or self.missing.directories:
+                await self._apply(
+                    [],
+                    [File(path, file_id) for path, file_id in self.missing.files.items()],
+                    [File(path, file_id) for path, file_id in self.missing.directories.items()]
+                )
+            return
+
+        etag, desired = fetched
+        removed, added_files, added_directories = self.applied.changes_to(desired)
+        # missing paths are applied already, they are added again as long as they stay desired
+        added_files += [File(path, file_id) for path, file_id in self.missing.files.items()
+                        if desired.files.get(path) == file_id]
+        added_directories += [File(path, file_id) for path, file_id in self.missing.directories.items()
+                              if desired.directories.get(path) == file_id]
+        await self._apply(removed, added_files, added_directories)
+        self.applied = desired
+        self.etag = etag  # only once applied, a failed sync fetches and applies the state again
+        logging.info(
+            f"Synced the desired state {etag}: {len(desired.files)} files, {len(desired.directories)} directories, "
+            f"{len(removed)} paths removed, {len(added_files) + len(added_directories)} added"
+        )
+
+    def _fetch(self) -> tuple[str | None, DesiredState] | None:
+        """The desired state and its ETag, None if it did not change since the last fetch."""
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = self._session.get(
+            self.url, params={'host': HOSTNAME}, headers=headers, timeout=DESIRED_STATE_TIMEOUT
+        )
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response.headers.get('ETag'), DesiredState.from_json_data(response.json())
+
+    async def _apply(self, removed: list[str], added_files: list[File], added_directories: list[File]) -> None:
+        """Run the commands of the changes, remembering the added paths which do not exist."""
+        missing = DesiredState()
+        for i in range(0, len(removed), DESIRED_STATE_BATCH_SIZE):
+            await self.execute(RemoveCommand(removed[i:i + DESIRED_STATE_BATCH_SIZE]))
+        for i in range(0, len(added_files), DESIRED_STATE_BATCH_SIZE):
+            batch = added_files[i:i + DESIRED_STATE_BATCH_SIZE]
+            for file, result in zip(batch, await self.execute(AddCommand(batch))):
+                if result['status'] == TrackingStatus.NOT_FOUND.value:
+                    missing.files[file.file_path] = file.file_id
+        for directory in added_directories:
+            result = await self.execute(AddDirectoryCommand(directory.file_path, directory.file_id))
+            if result['status'] == TrackingStatus.NOT_FOUND.value:
+                missing.directories[directory.file_path] = directory.file_id
+
+        self.removed_paths += len(removed)
+        self.added_paths += len(added_files) + len(added_directories) - len(missing.files) - len(missing.directories)
+        self.missing = missing
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import requests
+from importlib import metadata
+from typing import Awaitable, Callable
+from .models.base import DictJsonData
+from .models.tracker import HOSTNAME
+
+HEARTBEAT_PATH = "/client/heartbeat"
+HEARTBEAT_INTERVAL = 10.0  # seconds
+HEARTBEAT_TIMEOUT = 5.0
+
+
+def tracker_version() -> str | None:
+    try:
+        return metadata.version("eba-file-tracker")
+    except metadata.PackageNotFoundError:
+        return None  # run from a checkout
+
+
+class HeartbeatSender:
+    """
+    Tells the main server every interval that this daemon is alive, with its version, tracked files and
+    upload backlog taken from the PING statistics. A failed heartbeat is not retried, the next one replaces it.
+    """
+    def __init__(
+        self,
+        server_url: str,
+        collect_statistics: Callable[[], Awaitable[DictJsonData]],
+        interval: float = HEARTBEAT_INTERVAL
+    ) -> None:
+        self.url = server_url.rstrip('/') + HEARTBEAT_PATH
+        self.collect_statistics = collect_statistics
+        self.interval = interval
+        self.version = tracker_version()
+        self.sent = 0
+        self.failed = 0
+
+        self._session = requests.Session()
+        self._task: asyncio.Task | None = None
+        self._failing = False
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._session.close()
+
+    def statistics(self) -> DictJsonData:
+        return {'heartbeats_sent': self.sent, 'heartbeats_failed': self.failed}
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                heartbeat = self._heartbeat(await self.collect_statistics())
+                await loop.run_in_executor(None, self._send, heartbeat)
+                self.sent += 1
+                if self._failing:
+                    logging.info("Heartbeats reach the main server again")
+                self._failing = False
+            except Exception as e:
+                self.failed += 1
+                if not self._failing:  # logged once until the server answers again
+                    logging.warning(f"Couldn't send a heartbeat: {e}")
+                self._failing = True
+            await asyncio.sleep(self.interval)
+
+    def _heartbeat(self, statistics: DictJsonData) -> DictJsonData:
+        return {
+            'hostname': HOSTNAME,
+            'version': self.version,
+            'tracked_files': statistics.get('tracked_files', 0),
+            'upload_queue_size': statistics.get('upload_queue_size', 0),
+            'spool_bytes': statistics.get('upload_spool_bytes', 0),
+        }
+
+    def _send(self, heartbeat: DictJsonData) -> None:
+        response = self._session.post(self.url, json=heartbeat, timeout=HEARTBEAT_TIMEOUT)
+        response.raise_for_status()
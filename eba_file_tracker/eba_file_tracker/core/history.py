@@ -0,0 +1,101 @@
+import threading
+from array import array
+from collections import OrderedDict
+from .models.base import DictJsonData
+from .models.tracker import FileEventType
+
+HISTORY_LENGTH = 16  # events kept per file
+HISTORY_MAX_FILES = 20_000  # files with a history, the least recently active ones are forgotten first
+
+# one event: a timestamp and a size of 8 bytes each and a type of 1 byte
+EVENT_SIZE = 8 + 8 + 1
+# arrays, the ring itself and its entry in the file table, without the path
+FILE_OVERHEAD = 3 * 64 + 56 + 100
+
+HistoryEvent = tuple[int, FileEventType, int]
+
+
+class EventRing:
+    """The last events of one file in fixed-size numeric arrays, the oldest one is overwritten."""
+    __slots__ = ('times', 'types', 'sizes', 'next', 'count')
+
+    def __init__(self, capacity: int) -> None:
+        self.times = array('q', bytes(8 * capacity))
+        self.sizes = array('q', bytes(8 * capacity))
+        self.types = array('b', bytes(capacity))
+        self.next = 0
+        self.count = 0
+
+    def append(self, timestamp_ns: int, event_type: FileEventType, size: int) -> None:
+        i = self.next
+        self.times[i] = timestamp_ns
+        self.types[i] = event_type
+        self.sizes[i] = size
+        self.next = (i + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def events(self, since_ns: int | None = None, until_ns: int | None = None) -> list[HistoryEvent]:
+        """Events in chronological order, optionally only those in [since, until]."""
+        capacity = len(self.times)
+        events = []
+        for j in range(self.next - self.count, self.next):
+            i = j % capacity
+            timestamp_ns = self.times[i]
+            if since_ns is not None and timestamp_ns < since_ns:
+                continue
+            if until_ns is not None and timestamp_ns > until_ns:
+                break
+            events.append((timestamp_ns, FileEventType(self.types[i]), self.sizes[i]))
+        return events
+
+
+class EventHistory:
+    """
+    Recent events of tracked files, kept in the daemon to answer HISTORY without the main server.
+    Memory is bounded by the number of events per file and the number of files with a history.
+    """
+    def __init__(self, length: int = HISTORY_LENGTH, max_files: int = HISTORY_MAX_FILES) -> None:
+        self.length = length
+        self.max_files = max_files
+        self._lock = threading.Lock()  # events are recorded by observer threads
+        self._files: OrderedDict[str, EventRing] = OrderedDict()
+        self.recorded = 0
+        self.forgotten_files = 0
+
+    def record(self, file_path: str, timestamp_ns: int, event_type: FileEventType, size: int) -> None:
+        with self._lock:
+            ring = self._files.get(file_path)
+            if ring is None:
+                if len(self._files) >= self.max_files:
+                    self._files.popitem(last=False)
+                    self.forgotten_files += 1
+                ring = self._files[file_path] = EventRing(self.length)
+            else:
+                self._files.move_to_end(file_path)
+            ring.append(timestamp_ns, event_type, size)
+            self.recorded += 1
+
+    def query(
+        self,
+        file_paths: list[str],
+        prefix: str | None,
+        since_ns: int | None,
+        until_ns: int | None
+    ) -> list[tuple[str, list[HistoryEvent]]]:
+        """Histories of the requested files and of every file under the prefix, files without events are skipped."""
+        with self._lock:
+            selected = {file_path: self._files[file_path] for file_path in file_paths if file_path in self._files}
+            if prefix:
+                selected.update(
+                    (file_path, ring) for file_path, ring in self._files.items() if file_path.startswith(prefix)
+                )
+            histories = [(file_path, ring.events(since_ns, until_ns)) for file_path, ring in selected.items()]
+        return [(file_path, events) for file_path, events in histories if events]
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'history_tracked_files': len(self._files),
+            'history_recorded_events': self.recorded,
+            'history_forgotten_files': self.forgotten_files,
+            'history_memory_limit': self.max_files * (self.length * EVENT_SIZE + FILE_OVERHEAD),
+        }
@@ -0,0 +1,102 @@
+import os
+from typing import Iterator
+
+
+class FileIndex:
+    """
+    Index of tracked files grouped by directory.
+    Each directory path is stored once as a key, its files are kept as a basename -> file id mapping.
+    Files of datasets also have their size, grouped the same way and keyed by the same basename objects.
+    """
+    __slots__ = ('_directories', '_sizes', '_size')
+
+    def __init__(self) -> None:
+        self._directories: dict[str, dict[str, int]] = dict()
+        self._sizes: dict[str, dict[str, int]] = dict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, file_path: str) -> bool:
+        dir_path, name = os.path.split(file_path)
+        files = self._directories.get(dir_path)
+        return files is not None and name in files
+
+    def get(self, file_path: str) -> int | None:
+        dir_path, name = os.path.split(file_path)
+        files = self._directories.get(dir_path)
+        return files.get(name) if files is not None else None
+
+    def add(self, file_path: str, file_id: int, size: int | None = None) -> bool:
+        dir_path, name = os.path.split(file_path)
+        files = self._directories.get(dir_path)
+        if files is None:
+            files = self._directories[dir_path] = dict()
+        elif name in files:
+            return False
+
+        files[name] = file_id
+        if size is not None:
+            self._sizes.setdefault(dir_path, dict())[name] = size
+        self._size += 1
+        return True
+
+    def remove(self, file_path: str) -> bool:
+        dir_path, name = os.path.split(file_path)
+        files = self._directories.get(dir_path)
+        if files is None or files.pop(name, None) is None:
+            return False
+
+        if not files:
+            del self._directories[dir_path]
+        sizes = self._sizes.get(dir_path)
+        if sizes is not None and sizes.pop(name, None) is not None and not sizes:
+            del self._sizes[dir_path]
+        self._size -= 1
+        return True
+
+    def get_size(self, file_path: str) -> int | None:
+        dir_path, name = os.path.split(file_path)
+        sizes = self._sizes.get(dir_path)
+        return sizes.get(name) if sizes is not None else None
+
+    def set_size(self, file_path: str, size: int) -> bool:
+        """Keep the size of a tracked file, False if the file isn't tracked."""
+        dir_path, name = os.path.split(file_path)
+        files = self._directories.get(dir_path)
+        if files is None or name not in files:
+            return False
+
+        self._sizes.setdefault(dir_path, dict())[name] = size
+        return True
+
+    def has_directory(self, dir_path: str) -> bool:
+        return dir_path in self._directories
+
+    def directories(self) -> list[str]:
+        return list(self._directories.keys())
+
+    def select(self, prefix: str = '') -> Iterator[tuple[str, list[tuple[str, int]]]]:
+        """Lazily yield (dir_path, [(basename, file_id), ...]) groups, optionally only under a path prefix."""
+        # snapshots are taken per directory, so observer threads may keep changing the index
+        for dir_path, files in list(self._directories.items()):
+            if not prefix:
+                yield dir_path, list(files.items())
+                continue
+            if (dir_path + os.sep).startswith(prefix):
+                yield dir_path, list(files.items())
+            elif prefix.startswith(dir_path + os.sep):
+                name_prefix = prefix[len(dir_path) + 1:]
+                selected = [(name, file_id) for name, file_id in list(files.items()) if name.startswith(name_prefix)]
+                if selected:
+                    yield dir_path, selected
+
+    def iter_files(self, prefix: str = '') -> Iterator[tuple[str, int]]:
+        for dir_path, files in self.select(prefix):
+            for name, file_id in files:
+                yield os.path.join(dir_path, name), file_id
+
+    def iter_paths(self, prefix: str = '') -> Iterator[str]:
+        for file_path, _ in self.iter_files(prefix):
+            yield file_path
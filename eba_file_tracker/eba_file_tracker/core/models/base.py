@@ -6,6 +6,8 @@ JsonData = DictJsonData | ListJsonData
 
 
 class JsonSerializable(Protocol):
+    __slots__ = ()  # lets slotted implementations stay free of __dict__
+
     def to_json_data(self) -> JsonData:
         pass
 
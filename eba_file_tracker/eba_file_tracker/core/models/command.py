@@ -6,10 +6,20 @@ from .tracker import File
 
 class CommandType(Enum):
     ADD = 'add'
+    ADD_DIRECTORY = 'add_directory'
     INFO = 'info'
     REMOVE = 'remove'
     LIST = 'list'
     PING = 'ping'
+    BATCH_INFO = 'batch_info'
+    WATCH = 'watch'
+    HISTORY = 'history'
+    PROFILE = 'profile'
+
+    @property
+    def streamed(self) -> bool:
+        """The response is sent as JSON lines instead of a single document."""
+        return self in (CommandType.LIST, CommandType.BATCH_INFO, CommandType.WATCH, CommandType.HISTORY)
 
     @staticmethod
     def parse(json_data: DictJsonData) -> 'CommandType':
@@ -40,14 +50,13 @@ class AddCommand(Command):
     def type(self) -> CommandType:
         return self.cmd_type
 
-    def __init__(self, file_path: str, file_id: int) -> None:
-        self.file = File(file_path=file_path, file_id=file_id)
+    def __init__(self, files: list[File]) -> None:
+        self.files: list[File] = files
 
     def to_json_data(self) -> DictJsonData:
         return {
             'command': self.type.value,
-            'file_path': self.file.file_path,
-            'file_id': self.file.file_id,
+            'files': [[file.file_path, file.file_id] for file in self.files],
         }
 
     @staticmethod
@@ -55,7 +64,36 @@ class AddCommand(Command):
         cmd_type = CommandType.parse(json_data)
         if cmd_type != AddCommand.cmd_type:
             raise ValueError(cmd_type)
-        return AddCommand(json_data['file_path'], json_data['file_id'])
+        if 'files' not in json_data:  # a single file, as sent by older clients
+            return AddCommand([File(json_data['file_path'], json_data['file_id'])])
+        return AddCommand([File(file_path, file_id) for file_path, file_id in json_data['files']])
+
+
+class AddDirectoryCommand(Command):
+    """Track every file under a directory tree as one dataset."""
+    cmd_type = CommandType.ADD_DIRECTORY
+
+    @property
+    def type(self) -> CommandType:
+        return self.cmd_type
+
+    def __init__(self, dir_path: str, file_id: int) -> None:
+        self.dir_path = dir_path
+        self.file_id = file_id
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command': self.type.value,
+            'dir_path': self.dir_path,
+            'file_id': self.file_id,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'AddDirectoryCommand':
+        cmd_type = CommandType.parse(json_data)
+        if cmd_type != AddDirectoryCommand.cmd_type:
+            raise ValueError(cmd_type)
+        return AddDirectoryCommand(json_data['dir_path'], json_data['file_id'])
 
 
 class InfoCommand(Command):
@@ -82,6 +120,127 @@ class InfoCommand(Command):
         return InfoCommand(json_data['file_path'])
 
 
+class BatchInfoCommand(Command):
+    cmd_type = CommandType.BATCH_INFO
+
+    @property
+    def type(self) -> CommandType:
+        return self.cmd_type
+
+    def __init__(self, file_paths: list[str], prefix: str | None = None) -> None:
+        self.file_paths: list[str] = file_paths
+        self.prefix: str | None = prefix
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command': self.type.value,
+            'file_paths': self.file_paths,
+            'prefix': self.prefix,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'BatchInfoCommand':
+        cmd_type = CommandType.parse(json_data)
+        if cmd_type != BatchInfoCommand.cmd_type:
+            raise ValueError(cmd_type)
+        return BatchInfoCommand(json_data.get('file_paths', []), json_data.get('prefix'))
+
+
+class WatchCommand(Command):
+    cmd_type = CommandType.WATCH
+
+    @property
+    def type(self) -> CommandType:
+        return self.cmd_type
+
+    def __init__(self, prefix: str | None = None, buffer_size: int | None = None) -> None:
+        self.prefix: str | None = prefix
+        self.buffer_size: int | None = buffer_size
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command': self.type.value,
+            'prefix': self.prefix,
+            'buffer_size': self.buffer_size,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'WatchCommand':
+        cmd_type = CommandType.parse(json_data)
+        if cmd_type != WatchCommand.cmd_type:
+            raise ValueError(cmd_type)
+        return WatchCommand(json_data.get('prefix'), json_data.get('buffer_size'))
+
+
+class HistoryCommand(Command):
+    """Recent events of files kept by the daemon, times are epoch nanoseconds."""
+    cmd_type = CommandType.HISTORY
+
+    @property
+    def type(self) -> CommandType:
+        return self.cmd_type
+
+    def __init__(
+        self,
+        file_paths: list[str],
+        prefix: str | None = None,
+        since_ns: int | None = None,
+        until_ns: int | None = None
+    ) -> None:
+        self.file_paths: list[str] = file_paths
+        self.prefix: str | None = prefix
+        self.since_ns: int | None = since_ns
+        self.until_ns: int | None = until_ns
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command': self.type.value,
+            'file_paths': self.file_paths,
+            'prefix': self.prefix,
+            'since_ns': self.since_ns,
+            'until_ns': self.until_ns,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'HistoryCommand':
+        cmd_type = CommandType.parse(json_data)
+        if cmd_type != HistoryCommand.cmd_type:
+            raise ValueError(cmd_type)
+        return HistoryCommand(
+            json_data.get('file_paths', []), json_data.get('prefix'),
+            json_data.get('since_ns'), json_data.get('until_ns')
+        )
+
+
+class ProfileCommand(Command):
+    """Profile the daemon: CPU for a number of seconds, or a memory snapshot, or stop memory tracing."""
+    cmd_type = CommandType.PROFILE
+
+    @property
+    def type(self) -> CommandType:
+        return self.cmd_type
+
+    def __init__(self, memory: bool = False, seconds: float | None = None, stop: bool = False) -> None:
+        self.memory = memory
+        self.seconds = seconds
+        self.stop = stop
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command': self.type.value,
+            'memory': self.memory,
+            'seconds': self.seconds,
+            'stop': self.stop,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'ProfileCommand':
+        cmd_type = CommandType.parse(json_data)
+        if cmd_type != ProfileCommand.cmd_type:
+            raise ValueError(cmd_type)
+        return ProfileCommand(json_data.get('memory', False), json_data.get('seconds'), json_data.get('stop', False))
+
+
 class RemoveCommand(Command):
     cmd_type = CommandType.REMOVE
 
@@ -129,8 +288,18 @@ def parse_command(json_data: DictJsonData) -> 'Command':
     match cmd_type:
         case CommandType.ADD:
             return AddCommand.from_json_data(json_data)
+        case CommandType.ADD_DIRECTORY:
+            return AddDirectoryCommand.from_json_data(json_data)
         case CommandType.INFO:
             return InfoCommand.from_json_data(json_data)
+        case CommandType.BATCH_INFO:
+            return BatchInfoCommand.from_json_data(json_data)
+        case CommandType.WATCH:
+            return WatchCommand.from_json_data(json_data)
+        case CommandType.HISTORY:
+            return HistoryCommand.from_json_data(json_data)
+        case CommandType.PROFILE:
+            return ProfileCommand.from_json_data(json_data)
         case CommandType.REMOVE:
             return RemoveCommand.from_json_data(json_data)
         case CommandType.LIST | CommandType.PING:
@@ -2,16 +2,19 @@ from enum import Enum, auto
 from typing import Protocol
 from .base import DictJsonData, ListJsonData, JsonData, JsonSerializable
 from .command import CommandType
-from .tracker import FileMetadata
+from .tracker import FileMetadata, FileEventType, format_ns_to_iso8601, parse_iso8601_to_ns
 from .server import ServerConfiguration
 
 
 class CommandResultType(Enum):
     ADD = 'add'
+    DIRECTORY = 'directory'
     INFO = 'info'
     REMOVE = 'remove'
     LIST = 'list'
     PING = 'ping'
+    HISTORY = 'history'
+    PROFILE = 'profile'
 
     @staticmethod
     def parse(json_data: DictJsonData) -> 'CommandResultType':
@@ -123,12 +126,14 @@ class ListTrackedInfoResult(CommandResult):
 
 
 class PingResult(CommandResult):
-    def __init__(self, configuration: ServerConfiguration) -> None:
+    def __init__(self, configuration: ServerConfiguration, statistics: DictJsonData | None = None) -> None:
         self.type = CommandResultType.PING
         self.configuration = configuration
+        self.statistics = statistics or dict()
 
     def to_json_data(self) -> DictJsonData:
         json_data = self.configuration.to_json_data()
+        json_data['statistics'] = self.statistics
         json_data['command_result'] = self.type.value
         return json_data
 
@@ -137,7 +142,7 @@ class PingResult(CommandResult):
         cmd_type = CommandResultType.parse(json_data)
         if cmd_type != CommandResultType.PING:
             raise ValueError(cmd_type)
-        return PingResult(ServerConfiguration.from_json_data(json_data))
+        return PingResult(ServerConfiguration.from_json_data(json_data), json_data.get('statistics'))
 
 
 class InfoResult(CommandResult):
@@ -160,12 +165,163 @@ class InfoResult(CommandResult):
         return InfoResult(metadata)
 
 
+class DirectoryInfoResult(CommandResult):
+    """A directory tracked as one dataset with its aggregates, answers ADD_DIRECTORY and INFO of the directory."""
+    type = CommandResultType.DIRECTORY
+
+    def __init__(
+        self,
+        status: TrackingStatus,
+        dir_path: str,
+        file_id: int | None = None,
+        file_count: int = 0,
+        total_size: int = 0
+    ) -> None:
+        self.status = status
+        self.dir_path = dir_path
+        self.file_id = file_id
+        self.file_count = file_count
+        self.total_size = total_size
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command_result': self.type.value,
+            'status': self.status.value,
+            'dir_path': self.dir_path,
+            'file_id': self.file_id,
+            'file_count': self.file_count,
+            'total_size': self.total_size,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'DirectoryInfoResult':
+        cmd_type = CommandResultType.parse(json_data)
+        if cmd_type != DirectoryInfoResult.type:
+            raise ValueError(cmd_type)
+        return DirectoryInfoResult(
+            TrackingStatus.parse(json_data), json_data['dir_path'], json_data.get('file_id'),
+            json_data.get('file_count', 0), json_data.get('total_size', 0)
+        )
+
+
+class ListInfoResult(CommandResult):
+    def __init__(self, results: list[InfoResult]) -> None:
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def to_json_data(self) -> ListJsonData:
+        return list(map(lambda result: result.to_json_data(), self.results))
+
+    @staticmethod
+    def from_json_data(json_data: ListJsonData) -> 'ListInfoResult':
+        return ListInfoResult(list(map(lambda result: InfoResult.from_json_data(result), json_data)))
+
+
+class HistoryResult(CommandResult):
+    type = CommandResultType.HISTORY
+
+    def __init__(self, file_path: str, events: list[tuple[int, FileEventType, int]]) -> None:
+        self.file_path = file_path
+        self.events = events
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command_result': self.type.value,
+            'file_path': self.file_path,
+            'events': [
+                {'date': format_ns_to_iso8601(timestamp_ns), 'event': event_type.name.lower(), 'size': size}
+                for timestamp_ns, event_type, size in self.events
+            ],
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'HistoryResult':
+        cmd_type = CommandResultType.parse(json_data)
+        if cmd_type != HistoryResult.type:
+            raise ValueError(cmd_type)
+        return HistoryResult(json_data['file_path'], [
+            (parse_iso8601_to_ns(event['date']), FileEventType[event['event'].upper()], event['size'])
+            for event in json_data['events']
+        ])
+
+
+class ListHistoryResult(CommandResult):
+    def __init__(self, results: list[HistoryResult]) -> None:
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def to_json_data(self) -> ListJsonData:
+        return list(map(lambda result: result.to_json_data(), self.results))
+
+    @staticmethod
+    def from_json_data(json_data: ListJsonData) -> 'ListHistoryResult':
+        return ListHistoryResult(list(map(lambda result: HistoryResult.from_json_data(result), json_data)))
+
+
+class ProfileResult(CommandResult):
+    """A profile of one daemon process: the written file, if any, and the top of the report."""
+    type = CommandResultType.PROFILE
+
+    def __init__(self, pid: int, file_path: str | None, summary: list[str], error: str | None = None) -> None:
+        self.pid = pid
+        self.file_path = file_path
+        self.summary = summary
+        self.error = error
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'command_result': self.type.value,
+            'pid': self.pid,
+            'file_path': self.file_path,
+            'summary': self.summary,
+            'error': self.error,
+        }
+
+    @staticmethod
+    def from_json_data(json_data: DictJsonData) -> 'ProfileResult':
+        cmd_type = CommandResultType.parse(json_data)
+        if cmd_type != ProfileResult.type:
+            raise ValueError(cmd_type)
+        return ProfileResult(
+            json_data['pid'], json_data.get('file_path'), json_data.get('summary', []), json_data.get('error')
+        )
+
+
+class ListProfileResult(CommandResult):
+    def __init__(self, results: list[ProfileResult]) -> None:
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def to_json_data(self) -> ListJsonData:
+        return list(map(lambda result: result.to_json_data(), self.results))
+
+    @staticmethod
+    def from_json_data(json_data: ListJsonData) -> 'ListProfileResult':
+        return ListProfileResult(list(map(lambda result: ProfileResult.from_json_data(result), json_data)))
+
+
 def parse_result(cmd_type: CommandType, json_data: JsonData) -> 'CommandResult':
     match cmd_type:
         case CommandType.ADD | CommandType.REMOVE:
             return ListTrackingInfoResult.from_json_data(json_data)
+        case CommandType.ADD_DIRECTORY:
+            return DirectoryInfoResult.from_json_data(json_data)
+        case CommandType.INFO if json_data.get('command_result') == CommandResultType.DIRECTORY.value:
+            return DirectoryInfoResult.from_json_data(json_data)
         case CommandType.INFO:
             return InfoResult.from_json_data(json_data)
+        case CommandType.BATCH_INFO | CommandType.WATCH:
+            return ListInfoResult.from_json_data(json_data)
+        case CommandType.HISTORY:
+            return ListHistoryResult.from_json_data(json_data)
+        case CommandType.PROFILE:
+            return ListProfileResult.from_json_data(json_data)
         case CommandType.LIST:
             return ListTrackedInfoResult.from_json_data(json_data)
         case CommandType.PING:
@@ -8,6 +8,16 @@ class ServerConfiguration(JsonSerializable):
     # from argparse
     use_unix_optimization: bool
     release_version: bool
+    info_cache_ttl: float
+    history_length: int
+    history_files: int
+    relay_port: int | None
+    relay_host: str | None
+    desired_state_interval: float
+    heartbeat_interval: float
+    shards: int
+    event_loop: str
+    backlog: int
 
     # set while working
     pid: int | None
@@ -20,6 +30,16 @@ class ServerConfiguration(JsonSerializable):
         return ServerConfiguration(
             use_unix_optimization=args.unix_optimization,
             release_version=args.release,
+            info_cache_ttl=args.info_cache_ttl,
+            history_length=args.history_length,
+            history_files=args.history_files,
+            relay_port=args.relay_port,
+            relay_host=args.relay_host,
+            desired_state_interval=args.desired_state_interval,
+            heartbeat_interval=args.heartbeat_interval,
+            shards=args.shards,
+            event_loop=args.event_loop,
+            backlog=args.backlog,
             pid=None, host_name=None, host_port=None
         )
 
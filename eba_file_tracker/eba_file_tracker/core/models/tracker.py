@@ -1,7 +1,43 @@
-from datetime import datetime
-from dataclasses import dataclass, fields
+import os
+import time
+import socket
+from enum import IntEnum
+from datetime import datetime, timezone, timedelta
+from dataclasses import dataclass
+from functools import lru_cache
 from .base import JsonSerializable, DictJsonData
 
+HOSTNAME = socket.gethostname()  # resolved once, not per event
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+@lru_cache(maxsize=4096)
+def _format_seconds(seconds: int) -> str:
+    t = time.gmtime(seconds)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+
+def format_ns_to_iso8601(timestamp_ns: int) -> str:
+    """Format epoch nanoseconds the way the main server expects: 2024-11-23T17:25:50.481Z"""
+    seconds, rest = divmod(timestamp_ns, 1_000_000_000)
+    return f"{_format_seconds(seconds)}.{rest // 1_000_000:03d}Z"
+
+
+def parse_iso8601_to_ns(value: str) -> int:
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // _MICROSECOND * 1000
+
+
+class FileEventType(IntEnum):
+    CREATED = 1
+    MODIFIED = 2
+    DELETED = 3
+    MOVED = 4
+
 
 @dataclass
 class File(JsonSerializable):
@@ -9,38 +45,99 @@ class File(JsonSerializable):
     file_id: int
 
 
-@dataclass
 class FileMetadata(JsonSerializable):
-    hostname: str
-    file_path: str
-    dataset_general_info_id: int
-    age: datetime
-    access_rights: str
-    last_access_date: datetime
-    last_modification_date: datetime
-    size: int
+    """
+    Metadata of a tracked file at the moment of an event.
+    Dates are kept as raw epoch nanoseconds and the access rights as mode bits,
+    they are formatted only when the record leaves the daemon.
+    """
+    __slots__ = (
+        'hostname', 'file_path', 'dataset_general_info_id', 'age_ns', 'mode',
+        'last_access_ns', 'last_modification_ns', 'size',
+    )
 
-    def to_json_data(self) -> DictJsonData:
-        json_data = {}
-        for field in fields(self):
-            value = getattr(self, field.name)
-            json_data[field.name] = value
+    # names of the fields on the wire
+    FIELDS = (
+        'hostname', 'file_path', 'dataset_general_info_id', 'age', 'access_rights',
+        'last_access_date', 'last_modification_date', 'size',
+    )
+
+    def __init__(
+        self,
+        hostname: str,
+        file_path: str,
+        dataset_general_info_id: int,
+        age_ns: int,
+        mode: int,
+        last_access_ns: int,
+        last_modification_ns: int,
+        size: int,
+    ) -> None:
+        self.hostname = hostname
+        self.file_path = file_path
+        self.dataset_general_info_id = dataset_general_info_id
+        self.age_ns = age_ns
+        self.mode = mode
+        self.last_access_ns = last_access_ns
+        self.last_modification_ns = last_modification_ns
+        self.size = size
+
+    @staticmethod
+    def from_stat(file_path: str, file_id: int, stats: os.stat_result) -> 'FileMetadata':
+        return FileMetadata(
+            HOSTNAME, file_path, file_id, stats.st_ctime_ns, stats.st_mode & 0o777,
+            stats.st_atime_ns, stats.st_mtime_ns, stats.st_size,
+        )
 
-        return json_data
+    @property
+    def access_rights(self) -> str:
+        return f"{self.mode:03o}"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FileMetadata):
+            return NotImplemented
+        return self.file_path == other.file_path \
+            and self.last_modification_ns == other.last_modification_ns \
+            and self.last_access_ns == other.last_access_ns \
+            and self.size == other.size \
+            and self.mode == other.mode \
+            and self.age_ns == other.age_ns \
+            and self.dataset_general_info_id == other.dataset_general_info_id \
+            and self.hostname == other.hostname
+
+    def __repr__(self) -> str:
+        return f"FileMetadata({self.file_path!r}, id={self.dataset_general_info_id}, size={self.size}, " \
+               f"mtime_ns={self.last_modification_ns}, atime_ns={self.last_access_ns})"
+
+    def to_json_data(self) -> DictJsonData:
+        return {
+            'hostname': self.hostname,
+            'file_path': self.file_path,
+            'dataset_general_info_id': self.dataset_general_info_id,
+            'age': format_ns_to_iso8601(self.age_ns),
+            'access_rights': f"{self.mode:03o}",
+            'last_access_date': format_ns_to_iso8601(self.last_access_ns),
+            'last_modification_date': format_ns_to_iso8601(self.last_modification_ns),
+            'size': self.size,
+        }
 
     @staticmethod
     def is_correct(json_data: DictJsonData) -> bool:
-        for field in fields(FileMetadata):
-            if field.name not in json_data:
+        for field in FileMetadata.FIELDS:
+            if field not in json_data:
                 return False
 
         return True
 
     @staticmethod
     def from_json_data(json_data: DictJsonData) -> 'FileMetadata':
-        kwargs = {}
-        for field in fields(FileMetadata):
-            value = json_data.get(field.name)
-            kwargs[field.name] = value
-
-        return FileMetadata(**kwargs)
+        return FileMetadata(
+            hostname=json_data['hostname'],
+            file_path=json_data['file_path'],
+            dataset_general_info_id=json_data['dataset_general_info_id'],
+            age_ns=parse_iso8601_to_ns(json_data['age']),
+            mode=int(json_data['access_rights'], 8),
+            last_access_ns=parse_iso8601_to_ns(json_data['last_access_date']),
+            last_modification_ns=parse_iso8601_to_ns(json_data['last_modification_date']),
+            size=json_data['size'],
+        )
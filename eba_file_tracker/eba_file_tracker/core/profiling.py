@@ -0,0 +1,87 @@
+import os
+import time
+import asyncio
+import cProfile
+import pstats
+import logging
+import tracemalloc
+
+PROFILE_SECONDS = 30.0
+MAX_PROFILE_SECONDS = 600.0
+TRACEMALLOC_FRAMES = 10
+SUMMARY_LINES = 10  # entries of a report sent back to the client, the files have more
+MEMORY_REPORT_LINES = 50
+
+
+class DaemonProfiler:
+    """
+    On-demand diagnostics of a running daemon, which has no console once daemonized.
+    A CPU profile covers the event loop thread for a number of seconds and is written as a pstats file.
+    Memory snapshots are taken with tracemalloc: the first call starts tracing,
+    every next one writes the difference with the previous snapshot.
+    """
+    def __init__(self, output_dir: str) -> None:
+        self.output_dir = output_dir
+        self.cpu_profiling = False
+        self._snapshot: tracemalloc.Snapshot | None = None
+
+    def _output_path(self, kind: str, extension: str) -> str:
+        return os.path.join(self.output_dir, f"{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+    async def profile_cpu(self, seconds: float | None = None) -> tuple[str, list[str]]:
+        """Profile for the given seconds, return the pstats file and the functions with the most cumulative time."""
+        if self.cpu_profiling:
+            raise RuntimeError("A CPU profile is already running")
+        seconds = min(seconds or PROFILE_SECONDS, MAX_PROFILE_SECONDS)
+
+        self.cpu_profiling = True
+        profile = cProfile.Profile()
+        logging.info(f"CPU profiling for {seconds} seconds")
+        try:
+            profile.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            self.cpu_profiling = False
+
+        file_path = self._output_path("cpu", "pstats")
+        profile.dump_stats(file_path)
+        stats = pstats.Stats(profile).stats
+        top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:SUMMARY_LINES]
+        summary = [
+            f"{cumulative:.3f}s cumulative, {calls} calls: {file_name}:{line}({function})"
+            for (file_name, line, function), (_, calls, _, cumulative, _) in top
+        ]
+        logging.info(f"CPU profile written to {file_path}")
+        return file_path, summary
+
+    def snapshot_memory(self) -> tuple[str | None, list[str]]:
+        """Take a tracemalloc snapshot and write its difference with the previous one."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = tracemalloc.take_snapshot()
+            logging.info("Memory tracing started")
+            return None, ["memory tracing started, the next snapshot reports the growth since now"]
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        differences = snapshot.compare_to(self._snapshot, 'lineno')[:MEMORY_REPORT_LINES]
+        current, peak = tracemalloc.get_traced_memory()
+
+        file_path = self._output_path("memory", "txt")
+        with open(file_path, "w") as file:
+            file.write(f"traced memory: current={current} peak={peak}\n")
+            file.writelines(f"{difference}\n" for difference in differences)
+        snapshot.dump(os.path.splitext(file_path)[0] + ".tracemalloc")
+        self._snapshot = snapshot
+
+        logging.info(f"Memory snapshot difference written to {file_path}")
+        return file_path, [f"traced memory: current={current} peak={peak}"] + \
+            [str(difference) for difference in differences[:SUMMARY_LINES]]
+
+    def stop_memory_tracing(self) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
+        logging.info("Memory tracing stopped")
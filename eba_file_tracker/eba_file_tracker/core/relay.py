@@ -0,0 +1,160 @@
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from .models.base import DictJsonData
+from .models.tracker import FileMetadata
+from .uploader import MetadataUploader, MetadataKey, UPLOAD_PATH, decode_batch, metadata_key
+
+RELAY_MAX_BODY_SIZE = 16 * 1024 * 1024
+RELAY_MAX_QUEUE_SIZE = 200_000  # queued events above which downstream daemons are asked to back off
+RELAY_RETRY_AFTER = 2
+RELAY_IDLE_TIMEOUT = 120.0
+RELAY_MAX_FILES = 1_000_000  # files whose handles are kept, the least recently sent ones are forgotten first
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            503: "Service Unavailable"}
+
+
+class MetadataRelay:
+    """
+    Relay mode: accepts event batches of other daemons on the main server ingest route and forwards
+    them upstream through the local uploader, which coalesces all hosts into large batches,
+    suppresses repeated states and spools while the main server is unavailable.
+
+    The relay hands out its own handles, so downstream daemons keep sending partial events,
+    which are resolved against the last full state the relay has seen for the file. A forgotten handle
+    is answered with no handle, and the daemon sends the file in full again.
+
+    The relay does not authenticate the daemons and forwards whatever they send under their hostnames,
+    so it must listen only on an interface the trusted daemons reach. The main server rate limits
+    ingest by peer address, so list the relay in its `INGEST__RELAY_HOSTS` to give it a bucket of its own.
+    """
+    def __init__(self, uploader: MetadataUploader, max_files: int = RELAY_MAX_FILES) -> None:
+        self.uploader = uploader
+        self.max_files = max_files
+        self.server: asyncio.Server | None = None
+        self._handles: dict[MetadataKey, int] = dict()
+        self._files: OrderedDict[int, FileMetadata] = OrderedDict()
+        self._next_handle = 1
+        self.relayed_events = 0
+        self.rejected_batches = 0
+
+    async def start(self, host: str, port: int) -> None:
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logging.info(f"Relay is listening on {host}:{port}")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'relay_files': len(self._files),
+            'relayed_events': self.relayed_events,
+            'relay_rejected_batches': self.rejected_batches,
+        }
+
+    def accept(self, rows: list[tuple]) -> list[int | None]:
+        """Resolve decoded rows into full metadata, queue it upstream and return the handle of each row."""
+        handles = []
+        for row_handle, hostname, file_path, file_id, age, mode, last_access, last_modification, size in rows:
+            if row_handle is None:
+                metadata = FileMetadata(hostname, file_path, file_id, age, mode, last_access, last_modification, size)
+                key = metadata_key(metadata)
+                handle = self._handles.get(key)
+                if handle is None:
+                    handle = self._handles[key] = self._next_handle
+                    self._next_handle += 1
+            else:
+                handle = row_handle
+                previous = self._files.get(handle)
+                if previous is None or previous.hostname != hostname:
+                    # the relay restarted or the handle is not of this host, the daemon will send the file in full
+                    handles.append(None)
+                    continue
+                metadata = FileMetadata(
+                    previous.hostname, previous.file_path, previous.dataset_general_info_id,
+                    previous.age_ns if age is None else age,
+                    previous.mode if mode is None else mode,
+                    previous.last_access_ns if last_access is None else last_access,
+                    previous.last_modification_ns if last_modification is None else last_modification,
+                    previous.size if size is None else size,
+                )
+
+            self._files[handle] = metadata
+            self._files.move_to_end(handle)
+            if len(self._files) > self.max_files:
+                _, forgotten = self._files.popitem(last=False)
+                del self._handles[metadata_key(forgotten)]
+            self.uploader.submit(metadata)
+            handles.append(handle)
+        self.relayed_events += len(handles)
+        return handles
+
+    def _respond(self, method: str, path: str, headers: dict[str, str], body: bytes) -> tuple[int, DictJsonData]:
+        if path != UPLOAD_PATH:
+            return 404, {'message': f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {'message': f"Method {method} is not allowed"}
+        if self.uploader.queue_size() >= RELAY_MAX_QUEUE_SIZE:
+            return 503, {'message': "Relay is busy"}
+
+        try:
+            rows = decode_batch(body, headers.get('content-encoding'))
+        except ValueError as e:
+            self.rejected_batches += 1
+            return 400, {'message': f"Malformed event batch: {e}"}
+
+        handles = self.accept(rows)
+        accepted = len(handles) - handles.count(None)
+        return 200, {'accepted': accepted, 'rejected': len(handles) - accepted, 'handles': handles}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """A minimal HTTP/1.1 server: keep-alive connections with Content-Length framed requests."""
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), RELAY_IDLE_TIMEOUT)
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(" ", 2)
+
+                headers = dict()
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > RELAY_MAX_BODY_SIZE:
+                    await self._write_response(writer, 413, {'message': "Batch is too large"}, close=True)
+                    break
+                body = await reader.readexactly(length)
+
+                status, content = self._respond(method, path.split("?", 1)[0], headers, body)
+                close = headers.get('connection', '').lower() == 'close'
+                await self._write_response(writer, status, content, close)
+                if close:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _write_response(writer: asyncio.StreamWriter, status: int, content: DictJsonData, close: bool) -> None:
+        body = json.dumps(content, separators=(',', ':')).encode()
+        head = [
+            f"HTTP/1.1 {status} {_REASONS[status]}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'close' if close else 'keep-alive'}",
+        ]
+        if status == 503:
+            head.append(f"Retry-After: {RELAY_RETRY_AFTER}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
@@ -0,0 +1,84 @@
+import asyncio
+from collections import deque
+from .models.base import DictJsonData
+from .models.tracker import FileMetadata
+
+WATCH_BUFFER_SIZE = 1024
+MAX_WATCH_BUFFER_SIZE = 65536
+
+
+class Subscriber:
+    """A WATCH client: a bounded buffer of pending events that drops the oldest ones when full."""
+    def __init__(self, prefix: str | None, buffer_size: int) -> None:
+        self.prefix = prefix
+        self.events: deque[FileMetadata] = deque(maxlen=buffer_size)
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def matches(self, metadata: FileMetadata) -> bool:
+        return not self.prefix or metadata.file_path.startswith(self.prefix)
+
+    def push(self, metadata: FileMetadata) -> None:
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append(metadata)
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def wait(self, timeout: float) -> list[FileMetadata]:
+        """Take all pending events, waiting up to timeout for at least one."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+
+        self._ready.clear()
+        events = list(self.events)
+        self.events.clear()
+        self.delivered += len(events)
+        return events
+
+
+class SubscriptionHub:
+    """
+    Fans metadata events out to WATCH subscribers.
+    publish() is called from observer threads, delivery happens on the event loop.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._subscribers: set[Subscriber] = set()
+        self._dropped_by_closed = 0
+
+    def subscribe(self, prefix: str | None, buffer_size: int | None) -> Subscriber:
+        buffer_size = min(buffer_size or WATCH_BUFFER_SIZE, MAX_WATCH_BUFFER_SIZE)
+        subscriber = Subscriber(prefix, buffer_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        self._dropped_by_closed += subscriber.dropped
+
+    def close_all(self) -> None:
+        for subscriber in self._subscribers:
+            subscriber.close()
+
+    def publish(self, metadata: FileMetadata) -> None:
+        if self._subscribers:
+            self._loop.call_soon_threadsafe(self._deliver, metadata)
+
+    def _deliver(self, metadata: FileMetadata) -> None:
+        for subscriber in self._subscribers:
+            if subscriber.matches(metadata):
+                subscriber.push(metadata)
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'watch_subscribers': len(self._subscribers),
+            'watch_dropped_events': self._dropped_by_closed + sum(s.dropped for s in self._subscribers),
+        }
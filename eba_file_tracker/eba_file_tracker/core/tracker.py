@@ -1,122 +1,396 @@
 import os
-import socket
+import time
 import logging
-import requests
-from datetime import datetime, timezone
-from watchdog.events import FileSystemEventHandler, DirModifiedEvent, FileModifiedEvent, DirDeletedEvent, \
-    FileDeletedEvent
+import threading
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import FileSystemEvent, FileSystemEventHandler, DirModifiedEvent, FileModifiedEvent, DirDeletedEvent, \
+    FileDeletedEvent, DirMovedEvent, FileMovedEvent, DirCreatedEvent, FileCreatedEvent
 from watchdog.observers import Observer
-from .models.tracker import File, FileMetadata
+from watchdog.observers.api import BaseObserver, ObservedWatch
+from watchdog.observers.polling import PollingObserver
+from .cache import MetadataCache
+from .history import EventHistory
+from .index import FileIndex
+from .communication.system import read_inotify_limit
+from .models.base import DictJsonData
+from .models.tracker import File, FileMetadata, FileEventType
 from .models.result import CommandResultType, TrackingStatus, TrackingInfoResult, TrackedInfoResult, \
-    ListTrackedInfoResult, InfoResult
+    ListTrackedInfoResult, InfoResult, DirectoryInfoResult
 
+STAT_CHUNK_SIZE = 256  # files of one directory stat'ed by a single worker
+WATCH_BUDGET_RATIO = 0.9  # share of the inotify limit the daemon uses, the rest is left to other programs
+POLLING_INTERVAL = 5.0  # seconds between scans of directories watched by polling
+COLD_DIRECTORY_AGE = 300.0  # seconds without events after which a directory may be moved to polling
 
-def format_timestamp_to_iso8601(timestamp) -> datetime:
-    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+MetadataListener = Callable[[FileMetadata], None]
 
 
-def send_metadata_to_server(metadata: FileMetadata) -> None:
+def stat_directory_files(dir_path: str, files: list[tuple[str, int]]) -> list[FileMetadata]:
+    """Stat files of one directory relative to an open descriptor of it, skipping vanished files."""
+    results = []
     try:
-        if not metadata:
-            raise ValueError("Empty metadata")
-        response = requests.post("http://127.0.0.1:8000/client/add_event", json=metadata.to_json_data())
-        if response.status_code == 200:
-            logging.info(f"Metadata has been sent successfully: {metadata.file_path}")
-        else:
-            logging.error(f"Error while sending metadata: {response.status_code}")
-    except Exception as e:
-        logging.error(f"Couldn't send metadata: {e}")
+        dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY) if os.stat in os.supports_dir_fd else None
+    except OSError:
+        return results
+    try:
+        for name, file_id in files:
+            try:
+                stats = os.stat(name, dir_fd=dir_fd) if dir_fd is not None else os.stat(os.path.join(dir_path, name))
+            except OSError:
+                continue
+            results.append(FileMetadata.from_stat(os.path.join(dir_path, name), file_id, stats))
+    finally:
+        if dir_fd is not None:
+            os.close(dir_fd)
+    return results
+
+
+def scan_directory(dir_path: str) -> tuple[list[str], list[str]]:
+    """Names of the regular files and paths of the subdirectories of a directory, symlinks are not followed."""
+    names, subdirectories = [], []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        names.append(entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return names, subdirectories
+
+
+class DirectoryAggregates:
+    """
+    File count and total size of a dataset directory, updated by the initial scan and by events.
+    The sizes of the files are kept by the file index, next to the files.
+    """
+    def __init__(self, index: FileIndex) -> None:
+        self._index = index
+        self._lock = threading.Lock()
+        self.file_count = 0
+        self.total_size = 0
+
+    def put(self, file_path: str, file_id: int, size: int) -> None:
+        """Track the file if it isn't yet and count its size."""
+        with self._lock:
+            previous = self._index.get_size(file_path)
+            if not self._index.add(file_path, file_id, size):
+                self._index.set_size(file_path, size)
+            if previous is None:
+                self.file_count += 1
+            self.total_size += size - (previous or 0)
+
+    def remove(self, file_path: str) -> bool:
+        """Stop tracking the file and uncount its size, False if it wasn't tracked."""
+        with self._lock:
+            size = self._index.get_size(file_path)
+            if size is not None:
+                self.file_count -= 1
+                self.total_size -= size
+            return self._index.remove(file_path)
 
 
 class DirectoryEventHandler(FileSystemEventHandler):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        dir_path: str,
+        index: FileIndex,
+        cache: MetadataCache,
+        listeners: list[MetadataListener],
+        history: EventHistory | None,
+        on_empty: Callable[[str], None]
+    ) -> None:
         super().__init__()
-        self.files: dict[str, File] = dict()
+        self.dir_path = dir_path
+        self.index = index
+        self.cache = cache
+        self.listeners = listeners
+        self.history = history
+        self.on_empty = on_empty
+        self.last_event_at = time.monotonic()
 
-    def add_file(self, file: File) -> bool:
-        if file.file_path in self.files:
-            return False
+    def get_metadata(self, file_path: str) -> FileMetadata | None:
+        file_id = self.index.get(file_path)
+        if file_id is None:
+            return None
 
-        self.files[file.file_path] = file
-        return True
+        return FileMetadata.from_stat(file_path, file_id, os.stat(file_path))
 
-    def remove_file(self, file_path: str) -> bool:
-        if file_path not in self.files:
-            return False
+    def on_any_event(self, event: FileSystemEvent) -> None:
+        self.last_event_at = time.monotonic()
+        if not event.is_directory:
+            self.cache.invalidate(event.src_path)
+            if event.dest_path:
+                self.cache.invalidate(event.dest_path)
 
-        self.files.pop(file_path)
-        return True
+    def on_modified(self, event: DirModifiedEvent | FileModifiedEvent) -> None:
+        if not event.is_directory and event.src_path in self.index:
+            logging.info(f"File modified: {event.src_path}")
+            self._publish(self.get_metadata(event.src_path), FileEventType.MODIFIED)
 
-    def get_metadata(self, file_path: str) -> FileMetadata | None:
-        if file_path not in self.files:
-            return None
+    def on_deleted(self, event: DirDeletedEvent | FileDeletedEvent) -> None:
+        if not event.is_directory and self.index.remove(event.src_path):
+            logging.info(f"File deleted: {event.src_path}")
+            self._record(event.src_path, FileEventType.DELETED, 0)
+            self._check_empty()
+
+    def on_moved(self, event: DirMovedEvent | FileMovedEvent) -> None:
+        if not event.is_directory and self.index.remove(event.src_path):
+            logging.info(f"File moved away: {event.src_path}")
+            self._record(event.src_path, FileEventType.MOVED, 0)
+            self._check_empty()
+
+    def _publish(self, metadata: FileMetadata, event_type: FileEventType) -> None:
+        self.cache.put(metadata)
+        self._record(metadata.file_path, event_type, metadata.size)
+        for listener in self.listeners:
+            listener(metadata)
+
+    def _record(self, file_path: str, event_type: FileEventType, size: int) -> None:
+        if self.history is not None:
+            self.history.record(file_path, time.time_ns(), event_type, size)
+
+    def _check_empty(self) -> None:
+        if not self.index.has_directory(self.dir_path):
+            self.on_empty(self.dir_path)
+
+
+class DatasetEventHandler(DirectoryEventHandler):
+    """Events of a directory tree tracked as one dataset: new files join it and the aggregates follow every change."""
+    def __init__(
+        self,
+        dir_path: str,
+        file_id: int,
+        index: FileIndex,
+        cache: MetadataCache,
+        listeners: list[MetadataListener],
+        history: EventHistory | None,
+        on_empty: Callable[[str], None]
+    ) -> None:
+        super().__init__(dir_path, index, cache, listeners, history, on_empty)
+        self.file_id = file_id
+        self.aggregates = DirectoryAggregates(index)
+        # paths deleted or moved away while the initial scan runs, the scan may have stat'ed them before
+        self._scan_lock = threading.Lock()
+        self._removed_while_scanning: set[str] | None = set()
+        # directories of the tree below its root, a recursive inotify watch holds one watch for each of them
+        self._subdirectories: set[str] = set()
+
+    @property
+    def scanning(self) -> bool:
+        return self._removed_while_scanning is not None
+
+    @property
+    def watch_count(self) -> int:
+        return 1 + len(self._subdirectories)
+
+    def register_scanned(self, metadata_list: list[FileMetadata]) -> None:
+        """Add files found by the initial scan, unless an event removed or already counted them since."""
+        with self._scan_lock:
+            for metadata in metadata_list:
+                if self.index.get_size(metadata.file_path) is None \
+                        and not self._removed_during_scan(metadata.file_path):
+                    self.aggregates.put(metadata.file_path, self.file_id, metadata.size)
+
+    def register_scanned_directories(self, dir_paths: list[str]) -> None:
+        """Count subdirectories found by the initial scan, unless an event removed them since."""
+        with self._scan_lock:
+            self._subdirectories.update(
+                dir_path for dir_path in dir_paths if not self._removed_during_scan(dir_path)
+            )
 
-        stats = os.stat(file_path)
-        return FileMetadata(
-            hostname=socket.gethostname(),
-            file_path=file_path,
-            dataset_general_info_id=self.files[file_path].file_id,
-            age=format_timestamp_to_iso8601(stats.st_ctime),
-            access_rights=oct(stats.st_mode)[-3:],
-            last_access_date=format_timestamp_to_iso8601(stats.st_atime),
-            last_modification_date=format_timestamp_to_iso8601(stats.st_mtime),
-            size=stats.st_size,
-        )
+    def finish_scan(self) -> None:
+        with self._scan_lock:
+            self._removed_while_scanning = None
+
+    def _removed_during_scan(self, path: str) -> bool:
+        removed = self._removed_while_scanning
+        if not removed:
+            return False
+        while path != self.dir_path:
+            if path in removed:
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return False
+
+    def on_created(self, event: DirCreatedEvent | FileCreatedEvent) -> None:
+        if event.is_directory:
+            with self._scan_lock:
+                self._subdirectories.add(event.src_path)
+        else:
+            self._add_file(event.src_path)
 
     def on_modified(self, event: DirModifiedEvent | FileModifiedEvent) -> None:
-        if event.src_path in self.files:
-            logging.info(f"File modified: {event.src_path}")
+        if event.is_directory or event.src_path not in self.index:
+            return
+        try:
             metadata = self.get_metadata(event.src_path)
-            send_metadata_to_server(metadata)
+        except OSError:
+            return
+        if metadata is not None:
+            self.aggregates.put(metadata.file_path, self.file_id, metadata.size)
+            self._publish(metadata, FileEventType.MODIFIED)
 
     def on_deleted(self, event: DirDeletedEvent | FileDeletedEvent) -> None:
-        if event.src_path in self.files:
-            if self.remove_file(event.src_path):
-                logging.info(f"File deleted: {event.src_path}")
+        if event.src_path == self.dir_path:
+            self.on_empty(self.dir_path)
+        elif event.is_directory:
+            # a deleted tree reports every directory of it, bottom up
+            self._forget_directory(event.src_path)
+            self._remove_tree(event.src_path)
+        else:
+            self._remove_file(event.src_path, FileEventType.DELETED)
+
+    def on_moved(self, event: DirMovedEvent | FileMovedEvent) -> None:
+        # moves inside the tree are also reported for every file of a moved directory
+        inside = event.dest_path.startswith(self.dir_path + os.sep)
+        if event.is_directory:
+            self._forget_directory(event.src_path, subtree=not inside)
+            if inside:
+                with self._scan_lock:
+                    self._subdirectories.add(event.dest_path)
+            else:
+                self._remove_tree(event.src_path)
+            return
+        self._remove_file(event.src_path, FileEventType.MOVED)
+        if inside:
+            self._add_file(event.dest_path)
+
+    def _add_file(self, file_path: str) -> None:
+        try:
+            stats = os.stat(file_path)
+        except OSError:
+            return
+        self.aggregates.put(file_path, self.file_id, stats.st_size)
+        self._publish(FileMetadata.from_stat(file_path, self.index.get(file_path), stats), FileEventType.CREATED)
+
+    def _remove_file(self, file_path: str, event_type: FileEventType) -> None:
+        with self._scan_lock:
+            if self._removed_while_scanning is not None:
+                self._removed_while_scanning.add(file_path)
+            removed = self.aggregates.remove(file_path)
+        if removed:
+            logging.info(f"File deleted: {file_path}")
+            self._record(file_path, event_type, 0)
+
+    def _forget_directory(self, dir_path: str, subtree: bool = False) -> None:
+        with self._scan_lock:
+            self._subdirectories.discard(dir_path)
+            if subtree:  # moved away, its subdirectories are not reported
+                prefix = dir_path + os.sep
+                self._subdirectories = {path for path in self._subdirectories if not path.startswith(prefix)}
+
+    def _remove_tree(self, dir_path: str) -> None:
+        with self._scan_lock:
+            if self._removed_while_scanning is not None:
+                self._removed_while_scanning.add(dir_path)  # its files may not be registered yet
+        for file_path in list(self.index.iter_paths(dir_path + os.sep)):
+            self._remove_file(file_path, FileEventType.DELETED)
 
 
 class SingleDirectoryTracker:
-    def __init__(self, dir_path: str) -> None:
-        super().__init__()
-        self._handler = DirectoryEventHandler()
-        self._observer = Observer()
+    """A watch of one directory, scheduled on one of the observers shared by all directories."""
+    recursive = False
 
-        self._observer.schedule(self._handler, dir_path, recursive=False)
-        self._observer.start()
+    def __init__(self, handler: DirectoryEventHandler, observer: BaseObserver) -> None:
+        self._handler = handler
+        self.observer = observer
+        self.watch = observer.schedule(handler, handler.dir_path, recursive=self.recursive)
 
-    def add_file(self, file: File) -> bool:
-        return self._handler.add_file(file)
+    @property
+    def polling(self) -> bool:
+        return isinstance(self.observer, PollingObserver)
 
-    def remove_file(self, file_path: str) -> bool:
-        return self._handler.remove_file(file_path)
+    @property
+    def last_event_at(self) -> float:
+        return self._handler.last_event_at
 
     def get_file_info(self, file_path: str) -> FileMetadata | None:
         return self._handler.get_metadata(file_path)
 
-    def empty(self) -> bool:
-        return len(self._handler.files) == 0
-
-    def list(self) -> list[str]:
-        return list(self._handler.files.keys())
+    def move_to(self, observer: BaseObserver) -> 'SingleDirectoryTracker':
+        """Watch the directory with another observer, the new watch starts before the old one stops."""
+        tracker = type(self)(self._handler, observer)
+        self.stop()
+        return tracker
 
     def stop(self) -> None:
-        self._observer.stop()
-        self._observer.join()
+        self.observer.unschedule(self.watch)
+
+
+class DatasetTracker(SingleDirectoryTracker):
+    """A directory tree tracked as one dataset through a recursive watch."""
+    recursive = True
+    _handler: DatasetEventHandler
+
+    @property
+    def dir_path(self) -> str:
+        return self._handler.dir_path
+
+    @property
+    def file_id(self) -> int:
+        return self._handler.file_id
+
+    @property
+    def aggregates(self) -> DirectoryAggregates:
+        return self._handler.aggregates
+
+    @property
+    def scanning(self) -> bool:
+        return self._handler.scanning
+
+    @property
+    def watch_count(self) -> int:
+        return self._handler.watch_count
+
+    def register_scanned(self, metadata_list: list[FileMetadata]) -> None:
+        self._handler.register_scanned(metadata_list)
+
+    def register_scanned_directories(self, dir_paths: list[str]) -> None:
+        self._handler.register_scanned_directories(dir_paths)
+
+    def finish_scan(self) -> None:
+        self._handler.finish_scan()
 
 
 class DirectoryTrackerManager:
-    def __init__(self):
+    def __init__(self, info_cache_ttl: float = 0, history: EventHistory | None = None):
         self.tracker: dict[str, SingleDirectoryTracker] = dict()
+        self.datasets: dict[str, DatasetTracker] = dict()
+        self.index = FileIndex()
+        self.cache = MetadataCache(info_cache_ttl)
+        self.listeners: list[MetadataListener] = []
+        self.history = history
+        self.executor = ThreadPoolExecutor(thread_name_prefix="stat")
+
+        self.observer = Observer()
+        self.polling_observer = PollingObserver(timeout=POLLING_INTERVAL)
+        self.observer.start()
+        self.polling_observer.start()
+        self.watch_limit = read_inotify_limit() if not isinstance(self.observer, PollingObserver) else None
+        self.watch_budget = self._full_watch_budget()
+        self.reaped_watches = 0
+        self.demoted_watches = 0
+        # directories whose last tracked file was deleted, filled by observer threads
+        self._empty_directories: set[str] = set()
 
     def start_watching(self, file: File) -> TrackingInfoResult:
         if not os.path.exists(file.file_path):
             return TrackingInfoResult(CommandResultType.ADD, TrackingStatus.NOT_FOUND, file.file_path)
 
         dir_path = os.path.dirname(file.file_path)
-        if dir_path not in self.tracker:
-            self.tracker[dir_path] = SingleDirectoryTracker(dir_path)
+        if dir_path not in self.tracker and self._dataset_of(file.file_path) is None:
+            self._add_tracker(dir_path)
 
-        if self.tracker[dir_path].add_file(file):
+        if self.index.add(file.file_path, file.file_id):
             return TrackingInfoResult(CommandResultType.ADD, TrackingStatus.IN_PROGRESS, file.file_path)
         else:
             return TrackingInfoResult(CommandResultType.ADD, TrackingStatus.ALREADY, file.file_path)
@@ -125,44 +399,307 @@ class DirectoryTrackerManager:
         if not os.path.exists(file_path):
             return TrackingInfoResult(CommandResultType.REMOVE, TrackingStatus.NOT_FOUND, file_path)
 
+        if file_path in self.datasets:
+            self._remove_dataset(file_path)
+            return TrackingInfoResult(CommandResultType.REMOVE, TrackingStatus.COMPLETED, file_path)
+
         dir_path = os.path.dirname(file_path)
-        if dir_path not in self.tracker:
+        dataset = self._dataset_of(file_path)
+        if dir_path not in self.tracker and dataset is None:
             return TrackingInfoResult(CommandResultType.REMOVE, TrackingStatus.ALREADY, file_path)
 
-        tracker = self.tracker[dir_path]
-        is_success = tracker.remove_file(file_path)
+        is_success = dataset.aggregates.remove(file_path) if dataset is not None else self.index.remove(file_path)
+        self.cache.invalidate(file_path)
 
-        if tracker.empty():
+        if dataset is None and not self.index.has_directory(dir_path):
             self._remove_tracker(dir_path)
 
         return TrackingInfoResult(CommandResultType.REMOVE, TrackingStatus.COMPLETED, file_path) if is_success \
             else TrackingInfoResult(CommandResultType.REMOVE, TrackingStatus.ALREADY, file_path)
 
     def get_file_info(self, file_path: str) -> InfoResult:
+        metadata = self.cache.get(file_path)
+        if metadata is not None:
+            return InfoResult(metadata)
+
         if not os.path.exists(file_path):
             return InfoResult(None)
 
-        dir_path = os.path.dirname(file_path)
-        if dir_path not in self.tracker:
+        tracker = self.tracker.get(os.path.dirname(file_path)) or self._dataset_of(file_path)
+        if tracker is None:
             return InfoResult(None)
 
-        tracker = self.tracker[dir_path]
-        return InfoResult(tracker.get_file_info(file_path))
+        stat_started_ns = time.monotonic_ns()
+        metadata = tracker.get_file_info(file_path)
+        if metadata is not None:
+            self.cache.put(metadata, stat_started_ns)
+        return InfoResult(metadata)
+
+    def start_watching_directory(
+        self,
+        dir_path: str,
+        file_id: int
+    ) -> tuple[DirectoryInfoResult, DatasetTracker | None]:
+        """
+        Start tracking a directory tree as one dataset and return the dataset to scan,
+        which is None if the directory is missing or already tracked.
+        """
+        if not os.path.isdir(dir_path):
+            return DirectoryInfoResult(TrackingStatus.NOT_FOUND, dir_path), None
+
+        dataset = self.datasets.get(dir_path) or self._dataset_of(dir_path)
+        if dataset is not None:
+            return self._directory_info(dataset, TrackingStatus.ALREADY), None
+
+        # the recursive watch replaces the watches of directories and datasets inside the tree
+        subtree = dir_path + os.sep
+        for tracked_dir in [tracked_dir for tracked_dir in self.tracker if tracked_dir.startswith(subtree)]:
+            self._remove_tracker(tracked_dir)
+        if dir_path in self.tracker:
+            self._remove_tracker(dir_path)
+        for root in [root for root in self.datasets if root.startswith(subtree)]:
+            self.datasets.pop(root).stop()
+
+        handler = DatasetEventHandler(
+            dir_path, file_id, self.index, self.cache, self.listeners, self.history, self._empty_directories.add
+        )
+        dataset = self.datasets[dir_path] = self._schedule(DatasetTracker, handler)
+        return self._directory_info(dataset, TrackingStatus.IN_PROGRESS), dataset
+
+    def is_tracking(self, dataset: DatasetTracker) -> bool:
+        return self.datasets.get(dataset.dir_path) is dataset
+
+    def register_scanned(self, dataset: DatasetTracker, metadata_list: list[FileMetadata]) -> None:
+        """Add files found by the initial scan of a dataset, which may race with the events of its watch."""
+        dataset.register_scanned(metadata_list)
+
+    def register_scanned_directories(self, dataset: DatasetTracker, dir_paths: list[str]) -> None:
+        """Count the subdirectories found by the initial scan of a dataset, each one holds a watch of its tree."""
+        dataset.register_scanned_directories(dir_paths)
+
+    def finish_scan(self, dataset: DatasetTracker) -> None:
+        """End the initial scan of a dataset, which is polled if its tree needs more watches than the budget has."""
+        dataset.finish_scan()
+        if self.is_tracking(dataset) and not dataset.polling and not self._has_watch_budget(0):
+            self._poll_dataset(dataset)
+
+    def get_directory_info(self, dir_path: str) -> DirectoryInfoResult | None:
+        dataset = self.datasets.get(dir_path)
+        return self._directory_info(dataset, TrackingStatus.COMPLETED) if dataset is not None else None
+
+    @staticmethod
+    def _directory_info(dataset: DatasetTracker, status: TrackingStatus) -> DirectoryInfoResult:
+        aggregates = dataset.aggregates
+        return DirectoryInfoResult(
+            status, dataset.dir_path, dataset.file_id, aggregates.file_count, aggregates.total_size
+        )
+
+    def group_tracked_files(
+        self,
+        file_paths: list[str],
+        prefix: str | None
+    ) -> tuple[list[FileMetadata], list[tuple[str, list[tuple[str, int]]]]]:
+        """
+        Split the requested tracked files into cached metadata and per-directory chunks
+        for stat_directory_files.
+        """
+        groups: dict[str, dict[str, int]] = dict()
+        for file_path in file_paths:
+            file_id = self.index.get(file_path)
+            if file_id is not None:
+                dir_path, name = os.path.split(file_path)
+                groups.setdefault(dir_path, dict())[name] = file_id
+        if prefix:
+            for dir_path, files in self.index.select(prefix):
+                groups.setdefault(dir_path, dict()).update(files)
+
+        cached = []
+        chunks = []
+        for dir_path, files in groups.items():
+            missed = []
+            for name, file_id in files.items():
+                metadata = self.cache.get(os.path.join(dir_path, name))
+                if metadata is not None:
+                    cached.append(metadata)
+                else:
+                    missed.append((name, file_id))
+            for i in range(0, len(missed), STAT_CHUNK_SIZE):
+                chunks.append((dir_path, missed[i:i + STAT_CHUNK_SIZE]))
+        return cached, chunks
+
+    def statistics(self) -> DictJsonData:
+        native_watches = self._native_watches()
+        statistics = {
+            'tracked_files': len(self.index),
+            'tracked_directories': len(self.tracker),
+            'tracked_datasets': len(self.datasets),
+            'native_watches': native_watches,
+            'polling_watches': len(self.polling_observer.emitters),
+            'polling_datasets': sum(dataset.polling for dataset in self.datasets.values()),
+            'reaped_watches': self.reaped_watches,
+            'demoted_watches': self.demoted_watches,
+            **self.cache.statistics(),
+            **(self.history.statistics() if self.history else {}),
+        }
+        if self.watch_limit:
+            statistics['watch_limit'] = self.watch_limit
+            statistics['watch_usage'] = round(native_watches / self.watch_limit, 3)
+        return statistics
 
     def list_watched_files(self) -> ListTrackedInfoResult:
-        watched_files: list[TrackedInfoResult] = []
-        for tracker in self.tracker.values():
-            watched_files.extend(
-                map(
-                    lambda tracker_file: TrackedInfoResult(tracker_file),
-                    tracker.list()
-                )
-            )
-        return ListTrackedInfoResult(watched_files)
+        return ListTrackedInfoResult([TrackedInfoResult(file_path) for file_path in self.index.iter_paths()])
+
+    def maintain_watches(self) -> None:
+        """
+        Reap the watches of directories left without tracked files
+        and move the most active polled directories back to inotify while the budget allows.
+        Datasets grow a watch with every new subdirectory, the largest ones are polled while the watches
+        exceed the budget and watched with inotify again once their whole tree fits.
+        """
+        while self._empty_directories:
+            dir_path = self._empty_directories.pop()
+            if dir_path in self.tracker and not self.index.has_directory(dir_path):
+                self._remove_tracker(dir_path)
+                self.reaped_watches += 1
+                logging.info(f"Reaped the watch of {dir_path}, no tracked files left")
+            elif dir_path in self.datasets and not os.path.isdir(dir_path):
+                self._remove_dataset(dir_path)
+                self.reaped_watches += 1
+                logging.info(f"Reaped the watch of dataset {dir_path}, the directory was deleted")
+
+        self.watch_budget = self._full_watch_budget()  # the limit may have been raised or freed by other programs
+        native_datasets = sorted(
+            (dataset for dataset in self.datasets.values() if not dataset.polling and not dataset.scanning),
+            key=lambda dataset: dataset.watch_count,
+            reverse=True
+        )
+        for dataset in native_datasets:
+            if self._has_watch_budget(0):
+                break
+            self._poll_dataset(dataset)
+
+        if not self.polling_observer.emitters:
+            return
+        polled = sorted(
+            (dir_path for dir_path, tracker in self.tracker.items() if tracker.polling),
+            key=lambda dir_path: self.tracker[dir_path].last_event_at,
+            reverse=True
+        )
+        for dir_path in polled:
+            if not self._has_watch_budget():
+                break
+            try:
+                self.tracker[dir_path] = self.tracker[dir_path].move_to(self.observer)
+            except OSError as e:
+                self._on_watch_error(dir_path, e)
+                break
+            logging.info(f"Watching {dir_path} with inotify again")
+
+        for dir_path, dataset in list(self.datasets.items()):
+            if not dataset.polling or dataset.scanning or not self._has_watch_budget(dataset.watch_count):
+                continue
+            try:
+                self.datasets[dir_path] = dataset.move_to(self.observer)
+            except OSError as e:
+                self._on_watch_error(dir_path, e)
+                break
+            logging.info(f"Watching dataset {dir_path} with inotify again, {dataset.watch_count} watches")
 
     def stop_all_watching(self) -> None:
         for dir_path in list(self.tracker.keys()):
             self._remove_tracker(dir_path)
+        for dataset in self.datasets.values():
+            dataset.stop()
+        self.datasets.clear()
+        for observer in (self.observer, self.polling_observer):
+            observer.stop()
+            observer.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _full_watch_budget(self) -> int | None:
+        return int(self.watch_limit * WATCH_BUDGET_RATIO) if self.watch_limit else None
+
+    def _native_watches(self) -> int:
+        """inotify watches in use: one per watched directory and one per directory of every dataset tree."""
+        # the emitter of a dataset holds the watch of its root
+        return len(self.observer.emitters) + sum(
+            dataset.watch_count - 1 for dataset in self.datasets.values() if not dataset.polling
+        )
+
+    def _has_watch_budget(self, watches: int = 1) -> bool:
+        """Whether the budget has room for this many more watches."""
+        return self.watch_budget is None or self._native_watches() + watches <= self.watch_budget
+
+    def _add_tracker(self, dir_path: str) -> None:
+        handler = DirectoryEventHandler(
+            dir_path, self.index, self.cache, self.listeners, self.history, self._empty_directories.add
+        )
+        self.tracker[dir_path] = self._schedule(SingleDirectoryTracker, handler)
+
+    def _schedule(
+        self,
+        tracker_class: type[SingleDirectoryTracker],
+        handler: DirectoryEventHandler
+    ) -> SingleDirectoryTracker:
+        """Watch with inotify if the budget allows, making room by demoting a cold directory, or poll."""
+        dir_path = handler.dir_path
+        if self._has_watch_budget() or self._demote_cold_directory():
+            try:
+                return tracker_class(handler, self.observer)
+            except OSError as e:
+                watch = ObservedWatch(dir_path, recursive=tracker_class.recursive)
+                self.observer.remove_handler_for_watch(handler, watch)
+                self._on_watch_error(dir_path, e)
+        logging.info(f"Watching {dir_path} by polling, inotify watch budget is used up")
+        return tracker_class(handler, self.polling_observer)
+
+    def _dataset_of(self, path: str) -> DatasetTracker | None:
+        """The dataset whose tree contains the path."""
+        if not self.datasets:
+            return None
+        dir_path = os.path.dirname(path)
+        while True:
+            dataset = self.datasets.get(dir_path)
+            if dataset is not None:
+                return dataset
+            parent = os.path.dirname(dir_path)
+            if parent == dir_path:
+                return None
+            dir_path = parent
+
+    def _remove_dataset(self, dir_path: str) -> None:
+        """Stop the watch of a dataset and forget every file tracked under it."""
+        self.datasets.pop(dir_path).stop()
+        for file_path in list(self.index.iter_paths(dir_path + os.sep)):
+            self.index.remove(file_path)
+            self.cache.invalidate(file_path)
+
+    def _demote_cold_directory(self) -> bool:
+        native = [
+            (tracker.last_event_at, dir_path) for dir_path, tracker in self.tracker.items() if not tracker.polling
+        ]
+        if not native:
+            return False
+        last_event_at, dir_path = min(native)
+        if time.monotonic() - last_event_at < COLD_DIRECTORY_AGE:
+            return False
+
+        self.tracker[dir_path] = self.tracker[dir_path].move_to(self.polling_observer)
+        self.demoted_watches += 1
+        logging.info(f"Watching cold directory {dir_path} by polling")
+        return True
+
+    def _poll_dataset(self, dataset: DatasetTracker) -> None:
+        self.datasets[dataset.dir_path] = dataset.move_to(self.polling_observer)
+        self.demoted_watches += 1
+        logging.info(
+            f"Watching dataset {dataset.dir_path} by polling, its {dataset.watch_count} watches exceed the budget"
+        )
+
+    def _on_watch_error(self, dir_path: str, error: OSError) -> None:
+        # the kernel limits are shared with other programs of the user, so they can run out before the budget does
+        self.watch_budget = self._native_watches()
+        logging.warning(f"Cannot watch {dir_path} with inotify, the budget is lowered to {self.watch_budget}: {error}")
 
     def _remove_tracker(self, dir_path: str) -> None:
         tracker = self.tracker.pop(dir_path)
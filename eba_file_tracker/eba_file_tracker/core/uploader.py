@@ -0,0 +1,448 @@
+import os
+import gzip
+import json
+import time
+import zlib
+import queue
+import random
+import shutil
+import hashlib
+import logging
+import threading
+import requests
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from .models.base import DictJsonData
+from .models.tracker import FileMetadata
+
+UPLOAD_PATH = "/client/add_events"
+UPLOAD_BATCH_SIZE = 512  # events
+UPLOAD_MIN_BATCH_SIZE = 16
+UPLOAD_MAX_BATCH_SIZE = 4096
+UPLOAD_MAX_ACKNOWLEDGED = 200_000  # files whose acknowledged metadata is kept, the least recently sent are forgotten
+UPLOAD_FLUSH_INTERVAL = 1.0  # seconds an event may wait for a batch to fill up
+UPLOAD_TIMEOUT = 10.0
+UPLOAD_COMPRESS_LEVEL = 6
+
+UPLOAD_MAX_ATTEMPTS = 8
+UPLOAD_BACKOFF_BASE = 0.5  # seconds
+UPLOAD_BACKOFF_CAP = 60.0
+THROTTLED_STATUSES = (429, 503)
+
+SPOOL_MAX_BYTES = 256 * 1024 * 1024
+SPOOL_RETRY_INTERVAL = 30.0  # seconds between replay attempts while no new events arrive
+
+BATCH_VERSION = 3
+BATCH_COLUMNS = (
+    'handle', 'hostname', 'file_path', 'dataset_general_info_id', 'age', 'access_rights',
+    'last_access_date', 'last_modification_date', 'size',
+)
+EVENT_KEY_COLUMN = 'event_key'  # since version 3, optional when decoding
+BATCH_MAX_BYTES = 64 * 1024 * 1024  # decompressed, as much as the main server accepts
+
+MetadataKey = tuple[str, str, int]
+# server handle of a file and its last metadata the server has (or will have, earlier in the same batch)
+Delta = tuple[int, FileMetadata]
+
+
+def metadata_key(metadata: FileMetadata) -> MetadataKey:
+    return metadata.hostname, metadata.file_path, metadata.dataset_general_info_id
+
+
+def _changed(value: int, base: int, divisor: int = 1) -> int | None:
+    return value // divisor if value != base else None
+
+
+def _to_ns(value_ms: int | None) -> int | None:
+    return value_ms * 1_000_000 if value_ms is not None else None
+
+
+def _decompress(body: bytes, content_encoding: str | None) -> bytes:
+    """Inflate a gzip body, never to more than BATCH_MAX_BYTES, so a small body cannot exhaust the memory."""
+    if content_encoding != 'gzip':
+        return body
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, BATCH_MAX_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"malformed batch: broken gzip stream: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"malformed batch: larger than {BATCH_MAX_BYTES} bytes")
+    return data
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None  # an HTTP date, the backoff is used instead
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server asked for."""
+    delay = random.uniform(0, min(UPLOAD_BACKOFF_CAP, UPLOAD_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def event_key(metadata: FileMetadata) -> str:
+    """
+    Key of an event, the same for every upload of it, so the main server ignores an event it already stored
+    when a batch is retried or replayed from the spool. It is made of what the server receives,
+    dates in milliseconds, so a relay forwarding the event computes the same key.
+    """
+    fields = (
+        metadata.hostname, metadata.file_path, metadata.dataset_general_info_id, metadata.age_ns // 1_000_000,
+        metadata.mode, metadata.last_access_ns // 1_000_000, metadata.last_modification_ns // 1_000_000,
+        metadata.size,
+    )
+    return hashlib.blake2b("\0".join(map(str, fields)).encode(), digest_size=16).hexdigest()
+
+
+def encode_batch(batch: list[FileMetadata], deltas: list[Delta | None] | None = None) -> bytes:
+    """
+    Encode events column by column so field names are sent once per batch,
+    with dates as epoch milliseconds and access rights as permission bits, then gzip it.
+    An event with a delta is sent as its handle, its hostname, which the server checks the handle against,
+    and the fields that differ from the delta's metadata.
+    Every event carries its key, whether it is sent in full or as a delta.
+    """
+    columns = {name: [] for name in BATCH_COLUMNS}
+    columns[EVENT_KEY_COLUMN] = [event_key(m) for m in batch]
+    for m, delta in zip(batch, deltas or [None] * len(batch)):
+        if delta is None:
+            row = (
+                None, m.hostname, m.file_path, m.dataset_general_info_id, m.age_ns // 1_000_000, m.mode,
+                m.last_access_ns // 1_000_000, m.last_modification_ns // 1_000_000, m.size,
+            )
+        else:
+            handle, base = delta
+            row = (
+                handle, m.hostname, None, None,
+                _changed(m.age_ns, base.age_ns, 1_000_000),
+                _changed(m.mode, base.mode),
+                _changed(m.last_access_ns, base.last_access_ns, 1_000_000),
+                _changed(m.last_modification_ns, base.last_modification_ns, 1_000_000),
+                _changed(m.size, base.size),
+            )
+        for column, value in zip(columns.values(), row):
+            column.append(value)
+
+    body = json.dumps({'version': BATCH_VERSION, 'columns': columns}, separators=(',', ':'))
+    return gzip.compress(body.encode(), compresslevel=UPLOAD_COMPRESS_LEVEL)
+
+
+def decode_batch(body: bytes, content_encoding: str | None = None) -> list[tuple]:
+    """
+    Decode a batch made by encode_batch into rows of BATCH_COLUMNS values with dates in nanoseconds,
+    raises ValueError if it is malformed. Event keys are left out, they follow from the resolved metadata.
+    """
+    data = _decompress(body, content_encoding)
+    try:
+        batch = json.loads(data)
+        columns = batch['columns']
+        count = len(columns['file_path'])
+        rows = list(zip(
+            columns.get('handle', [None] * count),
+            *(columns[name] for name in BATCH_COLUMNS[1:])
+        ))
+    except (TypeError, KeyError, AttributeError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"malformed batch: {e}") from e
+
+    if len(rows) != count:
+        raise ValueError("malformed batch: columns have different lengths")
+    return [
+        (handle, hostname, file_path, file_id, _to_ns(age), mode, _to_ns(access), _to_ns(modification), size)
+        for handle, hostname, file_path, file_id, age, mode, access, modification, size in rows
+    ]
+
+
+class MetadataUploader:
+    """
+    Sends metadata events to the main server in compressed batches.
+    Events are queued by observer threads and uploaded by a single background thread
+    over one persistent keep-alive connection.
+
+    The metadata the server acknowledged last is remembered per file: events equal to it are not sent,
+    others only carry the changed fields and the handle the server assigned to the file.
+    A file forgotten to keep that memory bounded is simply sent in full again.
+
+    Throttled (429/503) and failed uploads are retried with jittered exponential backoff,
+    events that still could not be sent are appended to a spool file and replayed once the server answers again.
+    The batch size adapts: it grows when the host is rate limited, so fewer requests carry the same events,
+    shrinks when the server is overloaded, and drifts back to the configured size after successes.
+    """
+    def __init__(
+        self,
+        server_url: str,
+        batch_size: int = UPLOAD_BATCH_SIZE,
+        flush_interval: float = UPLOAD_FLUSH_INTERVAL,
+        spool_path: str | None = None,
+        max_acknowledged: int = UPLOAD_MAX_ACKNOWLEDGED
+    ) -> None:
+        self.url = server_url.rstrip('/') + UPLOAD_PATH
+        self.base_batch_size = batch_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue: queue.SimpleQueue[FileMetadata | None] = queue.SimpleQueue()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+        self._acknowledged: OrderedDict[MetadataKey, Delta] = OrderedDict()
+        self.max_acknowledged = max_acknowledged
+        self.spool_path = spool_path
+        self._spool_pending = spool_path is not None \
+            and (os.path.exists(spool_path) or os.path.exists(spool_path + ".replay"))
+
+        self.uploaded_events = 0
+        self.partial_events = 0
+        self.suppressed_events = 0
+        self.uploaded_bytes = 0
+        self.failed_batches = 0
+        self.throttled_responses = 0
+        self.dropped_events = 0
+        self.spooled_events = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, metadata: FileMetadata) -> None:
+        self._queue.put(metadata)
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self) -> None:
+        """Upload what is still queued, without waiting out backoffs, and close the connection."""
+        self._stopping.set()
+        self._queue.put(None)
+        self._thread.join()
+        self._session.close()
+
+    def statistics(self) -> DictJsonData:
+        return {
+            'upload_queue_size': self._queue.qsize(),
+            'uploaded_events': self.uploaded_events,
+            'uploaded_bytes': self.uploaded_bytes,
+            'upload_partial_events': self.partial_events,
+            'upload_suppressed_events': self.suppressed_events,
+            'upload_failed_batches': self.failed_batches,
+            'upload_throttled_responses': self.throttled_responses,
+            'upload_dropped_events': self.dropped_events,
+            'upload_spooled_events': self.spooled_events,
+            'upload_spool_bytes': self._spool_size() if self.spool_path is not None else 0,
+            'upload_batch_size': self.batch_size,
+        }
+
+    def _run(self) -> None:
+        batch: list[FileMetadata] = []
+        deadline = 0.0
+        stopping = False
+        while not stopping:
+            if batch:
+                timeout = max(deadline - time.monotonic(), 0)
+            else:
+                timeout = SPOOL_RETRY_INTERVAL if self._spool_pending else None
+            try:
+                metadata = self._queue.get(timeout=timeout)
+                if metadata is None:
+                    stopping = True
+                else:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(metadata)
+            except queue.Empty:
+                if not batch:
+                    self._replay_spool()
+                    continue
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                unsent = self._upload(batch)
+                if unsent:
+                    self._spool(unsent)
+                elif self._spool_pending and not stopping:
+                    self._replay_spool()
+                batch = []
+
+    def _select_changes(self, batch: list[FileMetadata]) -> tuple[list[FileMetadata], list[Delta | None]]:
+        """Drop events that change nothing and pair the rest with the state they are a delta to."""
+        changes = []
+        deltas = []
+        latest: dict[MetadataKey, tuple[int | None, FileMetadata]] = dict()
+        for metadata in batch:
+            key = metadata_key(metadata)
+            handle, previous = latest.get(key) or self._acknowledged.get(key) or (None, None)
+            if metadata == previous:
+                self.suppressed_events += 1
+                continue
+
+            changes.append(metadata)
+            # the handle of a new file is known only after the server answered its first full event
+            deltas.append((handle, previous) if handle is not None else None)
+            latest[key] = (handle, metadata)
+        return changes, deltas
+
+    def _acknowledge(self, changes: list[FileMetadata], handles: list[int | None]) -> None:
+        for metadata, handle in zip(changes, handles):
+            if handle is not None:
+                key = metadata_key(metadata)
+                self._acknowledged[key] = (handle, metadata)
+                self._acknowledged.move_to_end(key)
+                if len(self._acknowledged) > self.max_acknowledged:
+                    self._acknowledged.popitem(last=False)
+            else:
+                self._acknowledged.pop(metadata_key(metadata), None)
+
+    def _adapt_batch_size(self, status_code: int) -> None:
+        if status_code == 429:
+            self.batch_size = min(self.batch_size * 2, UPLOAD_MAX_BATCH_SIZE)
+        elif status_code == 503:
+            self.batch_size = max(self.batch_size // 2, UPLOAD_MIN_BATCH_SIZE)
+        elif self.batch_size != self.base_batch_size:
+            step = max(abs(self.base_batch_size - self.batch_size) // 8, 1)
+            self.batch_size += step if self.batch_size < self.base_batch_size else -step
+
+    def _upload(self, batch: list[FileMetadata]) -> list[FileMetadata]:
+        """Upload the changes of a batch, return the events which could not be sent."""
+        changes, deltas = self._select_changes(batch)
+        sent = 0
+        while sent < len(changes):
+            size = self.batch_size
+            if not self._send(changes[sent:sent + size], deltas[sent:sent + size]):
+                # later deltas may build on the unsent events, so those files are sent in full next time
+                for metadata in changes[sent:]:
+                    self._acknowledged.pop(metadata_key(metadata), None)
+                return changes[sent:]
+            sent += size
+        return []
+
+    def _send(self, changes: list[FileMetadata], deltas: list[Delta | None]) -> bool:
+        body = encode_batch(changes, deltas)
+        for attempt in range(UPLOAD_MAX_ATTEMPTS):
+            retry_after = None
+            try:
+                response = self._session.post(self.url, data=body, timeout=UPLOAD_TIMEOUT)
+                if response.status_code == 200:
+                    self._acknowledge(changes, self._read_handles(response))
+                    self._adapt_batch_size(response.status_code)
+                    partial = len(changes) - deltas.count(None)
+                    self.uploaded_events += len(changes)
+                    self.partial_events += partial
+                    self.uploaded_bytes += len(body)
+                    logging.info(
+                        f"Metadata has been sent successfully: {len(changes)} events ({partial} partial), "
+                        f"{len(body)} bytes"
+                    )
+                    return True
+
+                self.failed_batches += 1
+                if response.status_code in THROTTLED_STATUSES:
+                    self.throttled_responses += 1
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    self._adapt_batch_size(response.status_code)
+                    logging.warning(f"Metadata upload throttled: {response.status_code}, retry after {retry_after}")
+                elif response.status_code < 500:
+                    logging.error(f"Error while sending metadata: {response.status_code}")
+                    return False  # the server rejected the batch, retrying will not help
+                else:
+                    logging.error(f"Error while sending metadata: {response.status_code}")
+            except requests.RequestException as e:
+                self.failed_batches += 1
+                logging.error(f"Couldn't send metadata: {e}")
+
+            if self._stopping.wait(backoff_delay(attempt, retry_after)):
+                break
+        return False
+
+    @staticmethod
+    def _read_handles(response: requests.Response) -> list[int | None]:
+        try:
+            return response.json().get('handles', [])
+        except (ValueError, AttributeError):
+            return []
+
+    def _spool(self, events: list[FileMetadata]) -> None:
+        try:
+            if self.spool_path is None or self._spool_size() >= SPOOL_MAX_BYTES:
+                raise OSError("spool is disabled or full")
+            with open(self.spool_path, "a") as spool:
+                for metadata in events:
+                    spool.write(json.dumps(metadata.to_json_data(), separators=(',', ':')) + "\n")
+        except OSError as e:
+            self.dropped_events += len(events)
+            logging.error(f"Dropped {len(events)} metadata events: {e}")
+            return
+
+        self._spool_pending = True
+        self.spooled_events += len(events)
+        logging.warning(f"Spooled {len(events)} metadata events to {self.spool_path}")
+
+    def _spool_size(self) -> int:
+        try:
+            return os.path.getsize(self.spool_path)
+        except OSError:
+            return 0
+
+    def _replay_spool(self) -> None:
+        """
+        Upload spooled events oldest first.
+        If the server fails again, the rest of them go back to the head of the spool, ahead of any event
+        spooled after them, so the server never receives an older state of a file after a newer one.
+        """
+        replay_path = self.spool_path + ".replay"
+        self._spool_pending = False
+        try:
+            if not os.path.exists(replay_path):  # otherwise a replay was interrupted by a crash
+                os.replace(self.spool_path, replay_path)
+            spool = open(replay_path)
+        except OSError:
+            return
+
+        with spool:
+            batch = []
+            unsent = []
+            for line in spool:
+                try:
+                    batch.append(FileMetadata.from_json_data(json.loads(line)))
+                except (ValueError, KeyError):
+                    continue  # a line cut short by a crash
+                if len(batch) >= self.batch_size:
+                    unsent = self._upload(batch)
+                    if unsent:
+                        break
+                    batch = []
+            else:
+                if batch:
+                    unsent = self._upload(batch)
+
+            rest = spool.read()
+        if unsent or rest:
+            self._respool(unsent, rest)
+        os.remove(replay_path)
+        self._spool_pending = self._spool_pending or os.path.exists(self.spool_path)
+        logging.info("Metadata spool replay interrupted" if unsent or rest else "Replayed the metadata spool")
+
+    def _respool(self, events: list[FileMetadata], rest: str) -> None:
+        """Write the events and spool lines a replay did not send into a new spool, followed by the current one."""
+        new_path = self.spool_path + ".new"
+        try:
+            with open(new_path, "w") as new_spool:
+                for metadata in events:
+                    new_spool.write(json.dumps(metadata.to_json_data(), separators=(',', ':')) + "\n")
+                new_spool.write(rest)
+                if os.path.exists(self.spool_path):  # left by a replay interrupted by a crash
+                    with open(self.spool_path) as newer_spool:
+                        shutil.copyfileobj(newer_spool, new_spool)
+            os.replace(new_path, self.spool_path)
+        except OSError as e:
+            self.dropped_events += len(events)
+            logging.error(f"Couldn't put the unsent metadata events back to the spool: {e}")
+            return
+
+        self._spool_pending = True
+        self.spooled_events += len(events)
@@ -1,6 +1,6 @@
 from .core.models.server import ServerConfiguration
 from .core.models.result import TrackingStatus, CommandResultType, ListTrackingInfoResult, ListTrackedInfoResult, \
-    InfoResult
+    InfoResult, ListInfoResult, DirectoryInfoResult, ListHistoryResult, ListProfileResult
 
 
 class ResponseFormatter:
@@ -14,6 +14,10 @@ class ResponseFormatter:
 
         return '\n'.join(response)
 
+    @staticmethod
+    def make_from_statistics(statistics: dict) -> str:
+        return '\n'.join(f"- {key}={value}" for key, value in statistics.items())
+
     @staticmethod
     def make_from_add(add_results: ListTrackingInfoResult) -> str:
         response = []
@@ -32,6 +36,25 @@ class ResponseFormatter:
 
         return '\n'.join(response)
 
+    @staticmethod
+    def make_from_directory(result: DirectoryInfoResult) -> str:
+        match result.status:
+            case TrackingStatus.IN_PROGRESS:
+                response = [f"- directory tracking started: {result.dir_path}"]
+            case TrackingStatus.ALREADY:
+                response = [f"- directory is already being tracked: {result.dir_path}"]
+            case TrackingStatus.COMPLETED:
+                response = [f"- directory is tracked: {result.dir_path}"]
+            case TrackingStatus.NOT_FOUND:
+                return f"- directory not found: {result.dir_path}"
+            case _:
+                raise ValueError(result.status)
+
+        response.append(f"- file_id={result.file_id}")
+        response.append(f"- file_count={result.file_count}")
+        response.append(f"- total_size={result.total_size}")
+        return '\n'.join(response)
+
     @staticmethod
     def make_from_remove(remove_results: ListTrackingInfoResult) -> str:
         response = ["The result of remove files from tracking:"]
@@ -65,6 +88,51 @@ class ResponseFormatter:
 
         return '\n'.join(response)
 
+    @staticmethod
+    def make_from_batch_info(results: ListInfoResult, requested_paths: list[str]) -> str:
+        response = []
+        reported = set()
+        for result in sorted(results, key=lambda result: result.metadata.file_path):
+            response.append(f"{result.metadata.file_path}:")
+            response.append(ResponseFormatter.make_from_info(result))
+            reported.add(result.metadata.file_path)
+
+        for file_path in requested_paths:
+            if file_path not in reported:
+                response.append(f"{file_path}:")
+                response.append("- file is not tracked")
+
+        return '\n'.join(response)
+
+    @staticmethod
+    def make_from_event(result: InfoResult) -> str:
+        metadata = result.metadata.to_json_data()
+        return f"- {metadata['file_path']}: size={metadata['size']}, " \
+               f"last_modification_date={metadata['last_modification_date']}, " \
+               f"last_access_date={metadata['last_access_date']}"
+
+    @staticmethod
+    def make_from_history(results: ListHistoryResult) -> str:
+        response = []
+        for result in sorted(results, key=lambda result: result.file_path):
+            response.append(f"{result.file_path}:")
+            for event in result.to_json_data()['events']:
+                response.append(f"- {event['date']} {event['event']}, size={event['size']}")
+
+        return '\n'.join(response) if response else "No events"
+
+    @staticmethod
+    def make_from_profile(results: ListProfileResult) -> str:
+        response = []
+        for result in results:
+            if result.error:
+                response.append(f"PID {result.pid}: {result.error}")
+                continue
+            response.append(f"PID {result.pid}: {result.file_path}" if result.file_path else f"PID {result.pid}:")
+            response.extend(f"- {line}" for line in result.summary)
+
+        return '\n'.join(response)
+
     @staticmethod
     def make_from_list(list_results: ListTrackedInfoResult) -> str:
         response = ["List of tracked files:"]
@@ -0,0 +1,280 @@
+"""
+Client library of the file tracking server, for programs which would otherwise run the CLI for every command.
+
+    async with TrackerClient.from_environment() as client:
+        await client.add_many([(file_path, file_id) for file_path in file_paths])
+        async for file_path in client.stream_list():
+            ...
+
+    with SyncTrackerClient.from_environment() as client:
+        client.add("/data/file.csv", 12)
+"""
+import json
+import asyncio
+from typing import AsyncIterator, Iterable, Iterator
+from .core.models.command import Command, AddCommand, AddDirectoryCommand, RemoveCommand, InfoCommand, \
+    BatchInfoCommand, WatchCommand, HistoryCommand, ProfileCommand, SimpleCommand, CommandType
+from .core.models.result import CommandResult, TrackingInfoResult, TrackedInfoResult, PingResult, InfoResult, \
+    DirectoryInfoResult, HistoryResult, ProfileResult, parse_result
+from .core.models.tracker import File
+from .core.communication.json_transfer import write_json, read_json_lines, REQUEST_SIZE_LIMIT
+
+BATCH_SIZE = 1000  # files per request of the bulk calls
+
+
+class TrackerClient:
+    """
+    An asyncio client keeping one connection to the server open as a session, reconnected when it breaks.
+    Bulk calls are split into requests of batch_size files, which are all sent before their results are read.
+    Calls of concurrent tasks are served one after another.
+    """
+    def __init__(
+        self,
+        socket_file: str | None = None,
+        host: str | None = None,
+        port: int | None = None,
+        batch_size: int = BATCH_SIZE
+    ) -> None:
+        if socket_file is None and host is None:
+            raise ValueError("Either a socket file or a host is required")
+        self.socket_file = socket_file
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def from_environment(batch_size: int = BATCH_SIZE) -> 'TrackerClient':
+        """A client of the server the CLI talks to, as set in the .env file and the CLI state."""
+        from .state import SOCKET_FILE, HOST_NAME, HOST_PORT, get_state
+
+        if get_state().use_unix_optimization:
+            return TrackerClient(socket_file=SOCKET_FILE, batch_size=batch_size)
+        return TrackerClient(host=HOST_NAME, port=HOST_PORT, batch_size=batch_size)
+
+    async def __aenter__(self) -> 'TrackerClient':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _open_connection(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self.socket_file is not None:
+            return await asyncio.open_unix_connection(self.socket_file, limit=REQUEST_SIZE_LIMIT)
+        return await asyncio.open_connection(self.host, self.port, limit=REQUEST_SIZE_LIMIT)
+
+    async def connect(self) -> None:
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await self._open_connection()
+
+    async def close(self) -> None:
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _send(self, command: Command) -> None:
+        self._writer.write(json.dumps(command.to_json_data()).encode("utf-8") + b"\n")
+
+    async def _read_line(self) -> bytes:
+        line = await self._reader.readline()
+        if not line.endswith(b"\n"):
+            raise ConnectionError("The server closed the connection, see its log")
+        return line
+
+    async def _receive(self, command: Command) -> CommandResult:
+        if not command.type.streamed:
+            return parse_result(command.type, json.loads(await self._read_line()))
+        return parse_result(command.type, [json.loads(line) async for line in self._read_stream()])
+
+    async def _read_stream(self) -> AsyncIterator[bytes]:
+        while (line := await self._read_line()) != b"\n":
+            yield line
+
+    async def _pipeline(self, commands: list[Command]) -> list[CommandResult]:
+        """Send the commands at once and read their results in order."""
+        async with self._lock:
+            await self.connect()
+            for command in commands:
+                self._send(command)
+            sending = asyncio.create_task(self._writer.drain())  # results are read while the requests go out
+            try:
+                results = [await self._receive(command) for command in commands]
+                await sending
+                return results
+            except BaseException:
+                sending.cancel()
+                await self.close()  # the connection is in an unknown state
+                raise
+
+    async def request(self, command: Command) -> CommandResult:
+        """Send any command but WATCH and return its parsed result."""
+        if command.type == CommandType.WATCH:
+            raise ValueError("Use watch(), events are pushed on a connection of their own")
+        return (await self._pipeline([command]))[0]
+
+    def _batches(self, items: list) -> Iterator[list]:
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
+
+    async def add(self, file_path: str, file_id: int) -> TrackingInfoResult:
+        return (await self.add_many([(file_path, file_id)]))[0]
+
+    async def add_many(self, files: Iterable[tuple[str, int] | File]) -> list[TrackingInfoResult]:
+        files = [file if isinstance(file, File) else File(*file) for file in files]
+        results = await self._pipeline([AddCommand(batch) for batch in self._batches(files)])
+        return [result for batch_results in results for result in batch_results]
+
+    async def add_directory(self, dir_path: str, file_id: int) -> DirectoryInfoResult:
+        return await self.request(AddDirectoryCommand(dir_path, file_id))
+
+    async def remove(self, file_paths: Iterable[str]) -> list[TrackingInfoResult]:
+        results = await self._pipeline([RemoveCommand(batch) for batch in self._batches(list(file_paths))])
+        return [result for batch_results in results for result in batch_results]
+
+    async def info(self, file_path: str) -> InfoResult | DirectoryInfoResult:
+        return await self.request(InfoCommand(file_path))
+
+    async def batch_info(self, file_paths: Iterable[str], prefix: str | None = None) -> list[InfoResult]:
+        file_paths = list(file_paths)
+        commands = [BatchInfoCommand(batch) for batch in self._batches(file_paths)]
+        if prefix is not None or not commands:
+            commands.append(BatchInfoCommand([], prefix))
+        results = await self._pipeline(commands)
+        return [result for batch_results in results for result in batch_results]
+
+    async def history(
+        self,
+        file_paths: Iterable[str] = (),
+        prefix: str | None = None,
+        since_ns: int | None = None,
+        until_ns: int | None = None
+    ) -> list[HistoryResult]:
+        return list(await self.request(HistoryCommand(list(file_paths), prefix, since_ns, until_ns)))
+
+    async def profile(
+        self,
+        memory: bool = False,
+        seconds: float | None = None,
+        stop: bool = False
+    ) -> list[ProfileResult]:
+        return list(await self.request(ProfileCommand(memory, seconds, stop)))
+
+    async def ping(self) -> PingResult:
+        return await self.request(SimpleCommand(CommandType.PING))
+
+    async def list(self) -> list[str]:
+        return [file_path async for file_path in self.stream_list()]
+
+    async def stream_list(self) -> AsyncIterator[str]:
+        """Paths of the tracked files as the server sends them, without waiting for the whole list."""
+        command = SimpleCommand(CommandType.LIST)
+        async with self._lock:
+            await self.connect()
+            finished = False
+            try:
+                self._send(command)
+                await self._writer.drain()
+                async for line in self._read_stream():
+                    yield TrackedInfoResult.from_json_data(json.loads(line)).file_path
+                finished = True
+            finally:
+                if not finished:
+                    await self.close()  # the rest of the list would be read as the next results
+
+    async def watch(self, prefix: str | None = None, buffer_size: int | None = None) -> AsyncIterator[InfoResult]:
+        """Metadata events pushed by the server, on a connection of their own, until the iteration stops."""
+        reader, writer = await self._open_connection()
+        try:
+            await write_json(writer, WatchCommand(prefix, buffer_size).to_json_data())
+            async for json_data in read_json_lines(reader):
+                yield InfoResult.from_json_data(json_data)
+        finally:
+            writer.close()
+
+
+class SyncTrackerClient:
+    """The blocking counterpart of TrackerClient, which runs it on an event loop of its own."""
+    def __init__(self, *args, **kwargs) -> None:
+        self._runner = asyncio.Runner()
+        self._client = TrackerClient(*args, **kwargs)
+
+    @staticmethod
+    def from_environment(batch_size: int = BATCH_SIZE) -> 'SyncTrackerClient':
+        client = TrackerClient.from_environment(batch_size)
+        return SyncTrackerClient(client.socket_file, client.host, client.port, batch_size)
+
+    def __enter__(self) -> 'SyncTrackerClient':
+        self._runner.run(self._client.connect())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._runner.run(self._client.close())
+        self._runner.close()
+
+    def request(self, command: Command) -> CommandResult:
+        return self._runner.run(self._client.request(command))
+
+    def add(self, file_path: str, file_id: int) -> TrackingInfoResult:
+        return self._runner.run(self._client.add(file_path, file_id))
+
+    def add_many(self, files: Iterable[tuple[str, int] | File]) -> list[TrackingInfoResult]:
+        return self._runner.run(self._client.add_many(files))
+
+    def add_directory(self, dir_path: str, file_id: int) -> DirectoryInfoResult:
+        return self._runner.run(self._client.add_directory(dir_path, file_id))
+
+    def remove(self, file_paths: Iterable[str]) -> list[TrackingInfoResult]:
+        return self._runner.run(self._client.remove(file_paths))
+
+    def info(self, file_path: str) -> InfoResult | DirectoryInfoResult:
+        return self._runner.run(self._client.info(file_path))
+
+    def batch_info(self, file_paths: Iterable[str], prefix: str | None = None) -> list[InfoResult]:
+        return self._runner.run(self._client.batch_info(file_paths, prefix))
+
+    def history(
+        self,
+        file_paths: Iterable[str] = (),
+        prefix: str | None = None,
+        since_ns: int | None = None,
+        until_ns: int | None = None
+    ) -> list[HistoryResult]:
+        return self._runner.run(self._client.history(file_paths, prefix, since_ns, until_ns))
+
+    def profile(self, memory: bool = False, seconds: float | None = None, stop: bool = False) -> list[ProfileResult]:
+        return self._runner.run(self._client.profile(memory, seconds, stop))
+
+    def ping(self) -> PingResult:
+        return self._runner.run(self._client.ping())
+
+    def list(self) -> list[str]:
+        return self._runner.run(self._client.list())
+
+    def stream_list(self) -> Iterator[str]:
+        return self._iterate(self._client.stream_list())
+
+    def watch(self, prefix: str | None = None, buffer_size: int | None = None) -> Iterator[InfoResult]:
+        return self._iterate(self._client.watch(prefix, buffer_size))
+
+    def _iterate(self, iterator: AsyncIterator) -> Iterator:
+        async def next_item():
+            return await anext(iterator)
+
+        try:
+            while True:
+                try:
+                    yield self._runner.run(next_item())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._runner.run(iterator.aclose())
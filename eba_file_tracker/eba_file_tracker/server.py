@@ -1,29 +1,70 @@
 import os
+import time
 import asyncio
 import signal
 import logging
 import argparse
+from typing import Callable
 from dotenv import load_dotenv
 from pathlib import Path
-from .core.tracker import DirectoryTrackerManager
+from .core.tracker import DirectoryTrackerManager, DatasetTracker, STAT_CHUNK_SIZE, stat_directory_files, \
+    scan_directory
+from .core.history import EventHistory, HISTORY_LENGTH, HISTORY_MAX_FILES
+from .core.subscription import SubscriptionHub
+from .core.uploader import MetadataUploader
+from .core.relay import MetadataRelay
+from .core.profiling import DaemonProfiler
+from .core.desired_state import DesiredStateSync, DESIRED_STATE_INTERVAL
+from .core.heartbeat import HeartbeatSender, HEARTBEAT_INTERVAL
+from .core.models.base import DictJsonData, JsonData
 from .core.models.server import ServerConfiguration
-from .core.models.command import CommandType, AddCommand, RemoveCommand, InfoCommand, parse_command
-from .core.models.result import ListTrackingInfoResult, PingResult, InfoResult
-from .core.communication.json_transfer import read_json, write_json
-from .core.communication.system import daemonize, clear_files, get_tcp_ip_socket
+from .core.models.tracker import File
+from .core.models.command import Command, CommandType, AddCommand, AddDirectoryCommand, RemoveCommand, InfoCommand, \
+    BatchInfoCommand, WatchCommand, HistoryCommand, ProfileCommand, SimpleCommand, parse_command
+from .core.models.result import CommandResult, TrackingStatus, ListTrackingInfoResult, PingResult, InfoResult, \
+    DirectoryInfoResult, HistoryResult, ProfileResult, ListProfileResult
+from .core.communication.json_transfer import read_request, write_response, write_json_lines, end_stream, \
+    REQUEST_SIZE_LIMIT
+from .core.communication.system import daemonize, clear_files, get_tcp_ip_socket, normalize_env_paths, \
+    tune_unix_connection, LISTEN_BACKLOG
 
-load_dotenv(Path("eba_file_tracker") / "var" / ".env")
+ENV_FILE = Path("eba_file_tracker") / "var" / ".env"
+normalize_env_paths(ENV_FILE)  # once at the server start, the client only reads the file
+load_dotenv(ENV_FILE)
 PID_FILE = os.getenv("PID_FILE")
 SOCKET_FILE = os.getenv("SOCKET_FILE")
 HOST_NAME = os.getenv("HOST_NAME")
 HOST_PORT = int(os.getenv("HOST_PORT"))
 LOG_FILE = os.getenv("LOG_FILE")
+MAIN_SERVER_URL = os.getenv("MAIN_SERVER_URL", "http://127.0.0.1:8000")
+SPOOL_FILE = os.getenv("SPOOL_FILE")
+
+WATCH_KEEPALIVE_INTERVAL = 15.0
+WATCH_MAINTENANCE_INTERVAL = 10.0
+# kill -USR1 <pid> profiles the CPU, kill -USR2 <pid> takes a memory snapshot
+PROFILE_SIGNALS = {signal.SIGUSR1: False, signal.SIGUSR2: True} if hasattr(signal, "SIGUSR1") else {}
 
 
 def clear_runtime_files() -> None:
     clear_files([PID_FILE, SOCKET_FILE])
 
 
+def select_event_loop(name: str) -> tuple[str, Callable[[], asyncio.AbstractEventLoop] | None]:
+    """
+    The event loop to run the server on and its factory for asyncio.Runner, None for the default one.
+    'auto' takes uvloop when it is installed.
+    """
+    if name == "asyncio":
+        return name, None
+    try:
+        import uvloop
+    except ImportError:
+        if name == "uvloop":
+            raise RuntimeError("uvloop is not installed, pip install uvloop")
+        return "asyncio", None
+    return "uvloop", uvloop.new_event_loop
+
+
 def set_up_logging(release_version: bool) -> None:
     handlers = [logging.FileHandler(LOG_FILE)]  # logging to file
     if not release_version:
@@ -35,63 +76,254 @@ def set_up_logging(release_version: bool) -> None:
     )
 
 
+def prepare_process(configuration: ServerConfiguration) -> None:
+    """Daemonize if needed, set up logging and write the PID file."""
+    clear_runtime_files()
+    if configuration.release_version:
+        daemonize()
+    set_up_logging(configuration.release_version)
+
+    pid = os.getpid()
+    with open(PID_FILE, "w") as f:
+        f.write(str(pid))
+
+    configuration.set_dynamic(pid, HOST_NAME, HOST_PORT)
+
+
 class FileTrackingServer:
-    def __init__(self, configuration: ServerConfiguration) -> None:
+    def __init__(
+        self,
+        configuration: ServerConfiguration,
+        socket_file: str = SOCKET_FILE,
+        spool_file: str | None = SPOOL_FILE,
+        files: list[tuple[str, int]] | None = None,
+        directories: list[tuple[str, int]] | None = None
+    ) -> None:
         self.configuration = configuration
+        self.socket_file = socket_file
+        self.spool_file = spool_file
+        self.initial_files = files or []  # tracked again on start, e.g. by a restarted shard
+        self.initial_directories = directories or []
         self.tracker_manager: DirectoryTrackerManager = None
         self.server: asyncio.Server = None
-
-        clear_runtime_files()
-        if configuration.release_version:
-            daemonize()
-        set_up_logging(configuration.release_version)
-
+        self.subscriptions: SubscriptionHub = None
+        self.uploader: MetadataUploader = None
+        self.relay: MetadataRelay | None = None
+        self.desired_state: DesiredStateSync | None = None
+        self.heartbeat: HeartbeatSender | None = None
+        self.maintenance: asyncio.Task | None = None
+        self.profiler = DaemonProfiler(os.path.dirname(LOG_FILE))
+        self._profiles: set[asyncio.Task] = set()
         self.pid = os.getpid()
-        with open(PID_FILE, "w") as f:
-            f.write(str(self.pid))
-
-        self.configuration.set_dynamic(self.pid, HOST_NAME, HOST_PORT)
 
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
         addr = None
         try:
             addr = writer.get_extra_info('socket') if self.configuration.use_unix_optimization \
                 else writer.get_extra_info('peername')
-            request_data = await read_json(reader)
-            logging.info(f"Received from {addr} {request_data}")
-            command = parse_command(request_data)
+            if self.configuration.use_unix_optimization:
+                tune_unix_connection(addr)
+            while (request := await read_request(reader)) is not None:
+                request_data, session = request
+                logging.info(f"Received from {addr} {request_data}")
+                await self._handle_command(parse_command(request_data), writer, session, addr)
+                if not session:
+                    break
+        except Exception as e:
+            logging.error(f"Error while handling client {addr if addr else '-'}: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass  # the client has already gone
 
+    async def _handle_command(
+        self,
+        command: Command,
+        writer: asyncio.StreamWriter,
+        session: bool,
+        addr: object
+    ) -> None:
+        if command.type.streamed:
             match command.type:
-                case CommandType.ADD:
-                    command: AddCommand
-                    result = ListTrackingInfoResult(
-                        [self.tracker_manager.start_watching(command.file)]
-                    )
-                case CommandType.REMOVE:
-                    command: RemoveCommand
-                    result = ListTrackingInfoResult(
-                        [self.tracker_manager.stop_watching(file_path) for file_path in command.file_paths]
-                    )
-                case CommandType.INFO:
-                    command: InfoCommand
-                    result = InfoResult(self.tracker_manager.get_file_info(command.file_path))
                 case CommandType.LIST:
-                    result = self.tracker_manager.list_watched_files()
-                case CommandType.PING:
-                    result = PingResult(self.configuration)
+                    count = await self._stream_list(writer)
+                case CommandType.BATCH_INFO:
+                    count = await self._stream_files_info(command, writer)
+                case CommandType.HISTORY:
+                    count = await self._stream_history(command, writer)
                 case _:
-                    raise ValueError(f"Unknown command {command}")
+                    count = await self._stream_events(command, writer)  # takes the connection over
+            if not writer.is_closing():
+                await end_stream(writer, session)
+            logging.info(f"Streamed {count} results for {addr}")
+            return
 
-            response_data = result.to_json_data()
-            logging.info(f"Response for {addr} {response_data}")
-            await write_json(writer, response_data)
-        except Exception as e:
-            logging.error(f"Error while handling client {addr if addr else '-'}: {e}")
+        response_data = (await self._execute(command)).to_json_data()
+        logging.info(f"Response for {addr} {response_data}")
+        await write_response(writer, response_data, session)
+
+    async def _execute(self, command: Command) -> CommandResult:
+        """Run a command which is answered by a single result."""
+        match command.type:
+            case CommandType.ADD:
+                command: AddCommand
+                result = ListTrackingInfoResult(
+                    [self.tracker_manager.start_watching(file) for file in command.files]
+                )
+            case CommandType.REMOVE:
+                command: RemoveCommand
+                result = ListTrackingInfoResult(
+                    [self.tracker_manager.stop_watching(file_path) for file_path in command.file_paths]
+                )
+            case CommandType.ADD_DIRECTORY:
+                command: AddDirectoryCommand
+                result = await self._add_directory(command.dir_path, command.file_id)
+            case CommandType.INFO:
+                command: InfoCommand
+                result = self.tracker_manager.get_directory_info(command.file_path) \
+                    or InfoResult(self.tracker_manager.get_file_info(command.file_path))
+            case CommandType.PROFILE:
+                command: ProfileCommand
+                result = ListProfileResult([await self._profile(command)])
+            case CommandType.PING:
+                result = PingResult(
+                    self.configuration,
+                    {
+                        **self.tracker_manager.statistics(),
+                        **self.subscriptions.statistics(),
+                        **self.uploader.statistics(),
+                        **(self.relay.statistics() if self.relay else {}),
+                        **(self.desired_state.statistics() if self.desired_state else {}),
+                        **(self.heartbeat.statistics() if self.heartbeat else {}),
+                    }
+                )
+            case _:
+                raise ValueError(f"Unknown command {command}")
+        return result
+
+    async def _apply_desired_change(self, command: Command) -> JsonData:
+        return (await self._execute(command)).to_json_data()
+
+    async def _collect_statistics(self) -> DictJsonData:
+        return (await self._execute(SimpleCommand(CommandType.PING))).statistics
+
+    async def _stream_list(self, writer: asyncio.StreamWriter) -> int:
+        results = self.tracker_manager.list_watched_files().to_json_data()
+        await write_json_lines(writer, results)
+        return len(results)
+
+    async def _stream_files_info(self, command: BatchInfoCommand, writer: asyncio.StreamWriter) -> int:
+        """Stat the requested files per directory on the worker pool and stream results as they are ready."""
+        loop = asyncio.get_running_loop()
+        cached, chunks = self.tracker_manager.group_tracked_files(command.file_paths, command.prefix)
+        stat_started_ns = time.monotonic_ns()  # events from now on invalidate what the stats return
+        futures = [
+            loop.run_in_executor(self.tracker_manager.executor, stat_directory_files, dir_path, files)
+            for dir_path, files in chunks
+        ]
+
+        await write_json_lines(writer, (InfoResult(metadata).to_json_data() for metadata in cached))
+        count = len(cached)
+        for future in asyncio.as_completed(futures):
+            metadata_list = await future
+            for metadata in metadata_list:
+                self.tracker_manager.cache.put(metadata, stat_started_ns)
+            await write_json_lines(writer, (InfoResult(metadata).to_json_data() for metadata in metadata_list))
+            count += len(metadata_list)
+        return count
+
+    async def _add_directory(self, dir_path: str, file_id: int) -> DirectoryInfoResult:
+        result, dataset = self.tracker_manager.start_watching_directory(dir_path, file_id)
+        if dataset is not None:
+            await self._scan_dataset(dataset)
+            result = self.tracker_manager.get_directory_info(dir_path) or result
+            result.status = TrackingStatus.IN_PROGRESS
+            logging.info(f"Scanned dataset {dir_path}: {result.file_count} files, {result.total_size} bytes")
+        return result
+
+    async def _scan_dataset(self, dataset: DatasetTracker) -> None:
+        """
+        Initial scan of a dataset, parallel on the worker pool: every directory is listed by one task
+        and its files are stat'ed in chunks. The watch is already running, so no change is missed.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self.tracker_manager.executor
+        file_id = dataset.file_id
+
+        async def scan(dir_path: str) -> None:
+            if not self.tracker_manager.is_tracking(dataset):
+                return  # removed while being scanned
+            names, subdirectories = await loop.run_in_executor(executor, scan_directory, dir_path)
+            if subdirectories:
+                self.tracker_manager.register_scanned_directories(dataset, subdirectories)
+            for subdirectory in subdirectories:
+                group.create_task(scan(subdirectory))
+
+            chunks = [
+                loop.run_in_executor(
+                    executor, stat_directory_files, dir_path,
+                    [(name, file_id) for name in names[i:i + STAT_CHUNK_SIZE]]
+                )
+                for i in range(0, len(names), STAT_CHUNK_SIZE)
+            ]
+            for future in asyncio.as_completed(chunks):
+                metadata_list = await future
+                if self.tracker_manager.is_tracking(dataset):
+                    self.tracker_manager.register_scanned(dataset, metadata_list)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(scan(dataset.dir_path))
         finally:
-            writer.close()
-            await writer.wait_closed()
+            self.tracker_manager.finish_scan(dataset)
+
+    async def _stream_history(self, command: HistoryCommand, writer: asyncio.StreamWriter) -> int:
+        history = self.tracker_manager.history
+        histories = history.query(command.file_paths, command.prefix, command.since_ns, command.until_ns) \
+            if history is not None else []
+        await write_json_lines(
+            writer, (HistoryResult(file_path, events).to_json_data() for file_path, events in histories)
+        )
+        return len(histories)
+
+    async def _profile(self, command: ProfileCommand) -> ProfileResult:
+        try:
+            if command.memory and command.stop:
+                self.profiler.stop_memory_tracing()
+                file_path, summary = None, ["memory tracing stopped"]
+            elif command.memory:
+                file_path, summary = self.profiler.snapshot_memory()
+            else:
+                file_path, summary = await self.profiler.profile_cpu(command.seconds)
+        except RuntimeError as e:
+            return ProfileResult(self.pid, None, [], str(e))
+        return ProfileResult(self.pid, file_path, summary)
+
+    def _handle_profile_signal(self, memory: bool) -> None:
+        task = asyncio.create_task(self._profile(ProfileCommand(memory)))
+        self._profiles.add(task)
+        task.add_done_callback(self._profiles.discard)
 
-    async def run(self) -> None:
+    async def _stream_events(self, command: WatchCommand, writer: asyncio.StreamWriter) -> int:
+        """Push metadata events to a WATCH subscriber until it disconnects."""
+        subscriber = self.subscriptions.subscribe(command.prefix, command.buffer_size)
+        try:
+            while not subscriber.closed and not writer.is_closing():
+                events = await subscriber.wait(WATCH_KEEPALIVE_INTERVAL)
+                if events:
+                    await write_json_lines(writer, (InfoResult(metadata).to_json_data() for metadata in events))
+                else:
+                    writer.write(b"\n")  # keepalive, detects subscribers that went away
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscriptions.unsubscribe(subscriber)
+        return subscriber.delivered
+
+    async def run(self, signals: tuple[signal.Signals, ...] = (signal.SIGINT, signal.SIGTERM)) -> None:
         await self._start_server()
         stop_event = asyncio.Event()
 
@@ -100,24 +332,76 @@ class FileTrackingServer:
             stop_event.set()
 
         loop = asyncio.get_running_loop()
-        for sig in (signal.SIGINT, signal.SIGTERM):
-            loop.add_signal_handler(sig, lambda: handle_signal(sig))
+        for sig in signals:
+            loop.add_signal_handler(sig, handle_signal, sig)
+        for sig, memory in PROFILE_SIGNALS.items():
+            loop.add_signal_handler(sig, self._handle_profile_signal, memory)
 
         await stop_event.wait()
         await self._stop_server()
 
     async def _start_server(self) -> None:
-        self.tracker_manager = DirectoryTrackerManager()
-        self.server = await asyncio.start_unix_server(self.handle_client, path=SOCKET_FILE) \
-            if self.configuration.use_unix_optimization \
-            else await asyncio.start_server(self.handle_client, sock=get_tcp_ip_socket(HOST_NAME, HOST_PORT))
+        history = EventHistory(self.configuration.history_length, self.configuration.history_files) \
+            if self.configuration.history_length > 0 else None
+        self.tracker_manager = DirectoryTrackerManager(self.configuration.info_cache_ttl, history)
+        self.subscriptions = SubscriptionHub(asyncio.get_running_loop())
+        self.uploader = MetadataUploader(MAIN_SERVER_URL, spool_path=self.spool_file)
+        self.uploader.start()
+        if self.configuration.relay_port:
+            self.relay = MetadataRelay(self.uploader)
+            await self.relay.start(
+                self.configuration.relay_host or HOST_NAME or "127.0.0.1", self.configuration.relay_port
+            )
+        self.tracker_manager.listeners.append(self.uploader.submit)
+        self.tracker_manager.listeners.append(self.subscriptions.publish)
+        for file_path, file_id in self.initial_files:
+            self.tracker_manager.start_watching(File(file_path, file_id))
+        self.maintenance = asyncio.create_task(self._maintain_watches())
+        backlog = self.configuration.backlog
+        self.server = await asyncio.start_unix_server(
+            self.handle_client, path=self.socket_file, limit=REQUEST_SIZE_LIMIT, backlog=backlog
+        ) if self.configuration.use_unix_optimization else await asyncio.start_server(
+            self.handle_client, sock=get_tcp_ip_socket(HOST_NAME, HOST_PORT, backlog), limit=REQUEST_SIZE_LIMIT,
+            backlog=backlog
+        )
 
         extra_info = f" on {HOST_NAME}:{HOST_PORT}" if not self.configuration.use_unix_optimization else ""
         logging.info(f"Server started with a PID={self.pid}{extra_info}, {self.configuration}")
+        for dir_path, file_id in self.initial_directories:
+            await self._add_directory(dir_path, file_id)  # clients are already served while the trees are scanned
+        if self.configuration.desired_state_interval > 0:
+            self.desired_state = DesiredStateSync(
+                MAIN_SERVER_URL, self._apply_desired_change, self.configuration.desired_state_interval
+            )
+            self.desired_state.start()
+        if self.configuration.heartbeat_interval > 0:
+            self.heartbeat = HeartbeatSender(
+                MAIN_SERVER_URL, self._collect_statistics, self.configuration.heartbeat_interval
+            )
+            self.heartbeat.start()
+
+    async def _maintain_watches(self) -> None:
+        while True:
+            await asyncio.sleep(WATCH_MAINTENANCE_INTERVAL)
+            try:
+                self.tracker_manager.maintain_watches()
+            except Exception as e:
+                logging.error(f"Error while maintaining watches: {e}")
 
     async def _stop_server(self) -> None:
+        self.maintenance.cancel()
+        if self.desired_state:
+            self.desired_state.stop()
+        if self.heartbeat:
+            self.heartbeat.stop()
+        for task in self._profiles:
+            task.cancel()
         self.tracker_manager.stop_all_watching()
-        clear_runtime_files()
+        if self.relay:
+            await self.relay.stop()
+        self.uploader.stop()
+        self.subscriptions.close_all()
+        clear_files([self.socket_file])
         self.server.close()
         await self.server.wait_closed()
         logging.info("Server stopped.")
@@ -139,13 +423,86 @@ def main() -> None:
         help="disable console logging and daemonize the server"
     )
 
+    parser.add_argument(
+        "-ct", "--info-cache-ttl",
+        type=float, default=2.0,
+        help="seconds a cached INFO result stays valid if no file event arrives, 0 disables the cache"
+    )
+
+    parser.add_argument(
+        "-hl", "--history-length",
+        type=int, default=HISTORY_LENGTH,
+        help="recent events kept per file for the HISTORY command, 0 disables the history"
+    )
+
+    parser.add_argument(
+        "-hf", "--history-files",
+        type=int, default=HISTORY_MAX_FILES,
+        help="files with a kept history, the least recently changed ones are forgotten first"
+    )
+
+    parser.add_argument(
+        "-rp", "--relay-port",
+        type=int, default=None,
+        help="also act as a relay: accept event batches of other daemons on this port and forward them upstream"
+    )
+
+    parser.add_argument(
+        "-rh", "--relay-host",
+        default=None,
+        help="address the relay listens on, HOST_NAME by default. The relay does not authenticate daemons, "
+             "so use an address only trusted daemons reach"
+    )
+
+    parser.add_argument(
+        "-ds", "--desired-state-interval",
+        type=float, default=DESIRED_STATE_INTERVAL,
+        help="seconds between polls of the files and directories the main server wants tracked, 0 disables the sync"
+    )
+
+    parser.add_argument(
+        "-hb", "--heartbeat-interval",
+        type=float, default=HEARTBEAT_INTERVAL,
+        help="seconds between heartbeats telling the main server this daemon is alive, 0 disables them"
+    )
+
+    parser.add_argument(
+        "-sh", "--shards",
+        type=int, default=1,
+        help="number of worker processes the tracked directories are partitioned between, 1 runs in one process"
+    )
+
+    parser.add_argument(
+        "-el", "--event-loop",
+        choices=("auto", "asyncio", "uvloop"), default="auto",
+        help="event loop implementation, auto takes uvloop when it is installed"
+    )
+
+    parser.add_argument(
+        "-bl", "--backlog",
+        type=int, default=LISTEN_BACKLOG,
+        help="connections waiting to be accepted before new ones are refused, capped by net.core.somaxconn"
+    )
+
     configuration = ServerConfiguration.parse(parser)
-    server = FileTrackingServer(configuration)
+    try:
+        configuration.event_loop, loop_factory = select_event_loop(configuration.event_loop)
+    except RuntimeError as e:
+        parser.error(str(e))
+    prepare_process(configuration)
+    if configuration.shards > 1:
+        from .shards import ShardedTrackingServer
+        server = ShardedTrackingServer(configuration)
+    else:
+        server = FileTrackingServer(configuration)
 
     try:
-        asyncio.run(server.run())
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            runner.run(server.run())
     except Exception as e:
         logging.error(f"Server error: {e}")
+    finally:
+        clear_runtime_files()
 
 
 if __name__ == "__main__":
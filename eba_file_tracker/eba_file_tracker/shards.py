@@ -0,0 +1,447 @@
+import os
+import copy
+import json
+import time
+import zlib
+import signal
+import asyncio
+import logging
+import dataclasses
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from .server import FileTrackingServer, select_event_loop, SOCKET_FILE, SPOOL_FILE, HOST_NAME, HOST_PORT, LOG_FILE, \
+    MAIN_SERVER_URL, PROFILE_SIGNALS
+from .core.desired_state import DesiredStateSync
+from .core.heartbeat import HeartbeatSender
+from .core.models.base import DictJsonData, JsonData
+from .core.models.server import ServerConfiguration
+from .core.models.command import Command, CommandType, AddCommand, AddDirectoryCommand, RemoveCommand, InfoCommand, \
+    BatchInfoCommand, HistoryCommand, WatchCommand, SimpleCommand, parse_command
+from .core.models.result import TrackingStatus, PingResult
+from .core.models.tracker import File
+from .core.communication.json_transfer import read_json, write_json, read_request, write_response, end_stream, \
+    WRITE_BUFFER_LIMIT, REQUEST_SIZE_LIMIT
+from .core.communication.system import clear_files, get_tcp_ip_socket, tune_unix_connection
+
+SHARD_START_TIMEOUT = 30.0
+SHARD_CHECK_INTERVAL = 1.0
+SHARD_MAX_RESTART_DELAY = 30.0
+SHARD_STABLE_UPTIME = 60.0  # a shard that ran this long is restarted without delay
+# tracked files of a shard as [file path, file id or null once removed] lines, replayed into it after a restart
+SHARD_JOURNAL_FILE = os.path.join(os.path.dirname(LOG_FILE), "tracked-files.jsonl")
+
+
+def shard_of(file_path: str, shards: int) -> int:
+    """Shard owning the directory of a file, stable across processes and restarts."""
+    return zlib.crc32(os.path.dirname(file_path).encode()) % shards
+
+
+def shard_path(path: str, index: int) -> str:
+    base, extension = os.path.splitext(path)
+    return f"{base}-shard-{index}{extension}"
+
+
+def read_journal(path: str) -> dict[str, int]:
+    """The files a shard journal leaves tracked."""
+    files: dict[str, int] = dict()
+    try:
+        with open(path, "r") as journal:
+            for line in journal:
+                try:
+                    file_path, file_id = json.loads(line)
+                except ValueError:
+                    continue  # the last line may be cut by a crash
+                if file_id is None:
+                    files.pop(file_path, None)
+                else:
+                    files[file_path] = file_id
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def compact_journal(path: str) -> int:
+    """Rewrite a shard journal with only the files it leaves tracked, return their count."""
+    files = read_journal(path)
+    with open(path + ".new", "w") as journal:
+        journal.writelines(json.dumps([file_path, file_id]) + "\n" for file_path, file_id in files.items())
+    os.replace(path + ".new", path)
+    return len(files)
+
+
+def run_shard(
+    index: int,
+    configuration: ServerConfiguration,
+    journal_file: str,
+    directories: list[tuple[str, int]]
+) -> None:
+    """Entry point of a shard process: a single-process server on its own socket, tracking its partition."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group, the front stops the shards
+    handlers = [logging.FileHandler(LOG_FILE)]
+    if not configuration.release_version:
+        handlers.append(logging.StreamHandler())
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - %(levelname)s - shard {index} - %(message)s",
+        handlers=handlers,
+    )
+
+    server = FileTrackingServer(
+        configuration,
+        socket_file=shard_path(SOCKET_FILE, index),
+        spool_file=shard_path(SPOOL_FILE, index) if SPOOL_FILE else None,
+        files=list(read_journal(journal_file).items()),
+        directories=directories
+    )
+    _, loop_factory = select_event_loop(configuration.event_loop)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(_serve_shard(server))
+
+
+async def _serve_shard(server: FileTrackingServer) -> None:
+    parent = os.getppid()
+
+    async def watch_parent() -> None:
+        # a front killed with SIGKILL cannot stop its shards
+        while os.getppid() == parent:
+            await asyncio.sleep(SHARD_CHECK_INTERVAL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    watcher = asyncio.create_task(watch_parent())
+    try:
+        await server.run(signals=(signal.SIGTERM,))
+    finally:
+        watcher.cancel()
+
+
+class Shard:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.socket_file = shard_path(SOCKET_FILE, index)
+        self.process: BaseProcess | None = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_delay = 0.0
+        self.restarting: asyncio.Task | None = None
+        # tracked files and directories of the shard, replayed into it after a restart;
+        # the files are journaled on disk, there may be millions of them
+        self.journal_file = shard_path(SHARD_JOURNAL_FILE, index)
+        self.directories: dict[str, int] = dict()
+
+    def journal(self, records: list[tuple[str, int | None]]) -> None:
+        if records:
+            with open(self.journal_file, "a") as journal:
+                journal.writelines(json.dumps(record) + "\n" for record in records)
+
+
+class ShardedTrackingServer:
+    """
+    Front of the sharded mode.
+    Supervises worker processes that each track a hash partition of the directories,
+    routes commands to the shard owning the file and merges the answers of commands for all files.
+    """
+    def __init__(self, configuration: ServerConfiguration) -> None:
+        self.configuration = configuration
+        # the front syncs the desired state, routing its changes like the commands of clients, and sends heartbeats
+        self.shard_configuration = dataclasses.replace(
+            configuration, use_unix_optimization=True, shards=1, desired_state_interval=0, heartbeat_interval=0
+        )
+        self.context = multiprocessing.get_context("spawn")
+        self.shards = [Shard(index) for index in range(configuration.shards)]
+        self.datasets: dict[str, Shard] = dict()  # a dataset directory tree belongs to one shard as a whole
+        self.server: asyncio.Server = None
+        self.desired_state: DesiredStateSync | None = None
+        self.heartbeat: HeartbeatSender | None = None
+        self.pid = os.getpid()
+        self._stopping = False
+
+    async def run(self) -> None:
+        clear_files([shard.journal_file for shard in self.shards])  # a new daemon starts with nothing tracked
+        await asyncio.gather(*(self._start_shard(shard) for shard in self.shards))
+        backlog = self.configuration.backlog
+        self.server = await asyncio.start_unix_server(
+            self.handle_client, path=SOCKET_FILE, limit=REQUEST_SIZE_LIMIT, backlog=backlog
+        ) if self.configuration.use_unix_optimization else await asyncio.start_server(
+            self.handle_client, sock=get_tcp_ip_socket(HOST_NAME, HOST_PORT, backlog), limit=REQUEST_SIZE_LIMIT,
+            backlog=backlog
+        )
+        logging.info(f"Server started with a PID={self.pid} and {len(self.shards)} shards, {self.configuration}")
+        if self.configuration.desired_state_interval > 0:
+            self.desired_state = DesiredStateSync(
+                MAIN_SERVER_URL, self._apply_desired_change, self.configuration.desired_state_interval
+            )
+            self.desired_state.start()
+        if self.configuration.heartbeat_interval > 0:
+            self.heartbeat = HeartbeatSender(
+                MAIN_SERVER_URL, self._collect_statistics, self.configuration.heartbeat_interval
+            )
+            self.heartbeat.start()
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        for sig in PROFILE_SIGNALS:
+            loop.add_signal_handler(sig, self._forward_signal, sig)  # the work is done by the shards
+
+        supervisor = asyncio.create_task(self._supervise())
+        await stop_event.wait()
+        logging.info("Received exit signal. Stopping shards...")
+        self._stopping = True
+        supervisor.cancel()
+        await self._stop()
+
+    async def _start_shard(self, shard: Shard) -> None:
+        clear_files([shard.socket_file])
+        configuration = self.shard_configuration if shard.index == 0 \
+            else dataclasses.replace(self.shard_configuration, relay_port=None)  # one relay for the whole host
+        # compacted before the shard reads it, and without awaiting so no command appends meanwhile
+        file_count = compact_journal(shard.journal_file)
+        shard.process = self.context.Process(
+            target=run_shard,
+            args=(shard.index, configuration, shard.journal_file, list(shard.directories.items())),
+            name=f"shard-{shard.index}"
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+
+        deadline = time.monotonic() + SHARD_START_TIMEOUT
+        while not os.path.exists(shard.socket_file) and shard.process.is_alive() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        logging.info(
+            f"Shard {shard.index} started with a PID={shard.process.pid}, "
+            f"{file_count} files and {len(shard.directories)} directories"
+        )
+
+    async def _supervise(self) -> None:
+        """Restart crashed shards, with a growing delay for shards that keep crashing."""
+        while not self._stopping:
+            await asyncio.sleep(SHARD_CHECK_INTERVAL)
+            for shard in self.shards:
+                if shard.process.exitcode is None or shard.restarting is not None:
+                    continue
+
+                logging.error(f"Shard {shard.index} exited with code {shard.process.exitcode}, restarting")
+                # on its own, the delay of a shard that keeps crashing must not hold back the others
+                shard.restarting = asyncio.create_task(self._restart_shard(shard))
+
+    async def _restart_shard(self, shard: Shard) -> None:
+        try:
+            if time.monotonic() - shard.started_at >= SHARD_STABLE_UPTIME:
+                shard.restart_delay = 0.0
+            await asyncio.sleep(shard.restart_delay)
+            shard.restart_delay = min(max(shard.restart_delay * 2, 1.0), SHARD_MAX_RESTART_DELAY)
+            shard.restarts += 1
+            await self._start_shard(shard)
+        finally:
+            shard.restarting = None
+
+    def _forward_signal(self, sig: signal.Signals) -> None:
+        for shard in self.shards:
+            if shard.process.is_alive():
+                os.kill(shard.process.pid, sig)
+
+    async def _stop(self) -> None:
+        restarts = [shard.restarting for shard in self.shards if shard.restarting is not None]
+        for restart in restarts:
+            restart.cancel()
+        await asyncio.gather(*restarts, return_exceptions=True)
+        if self.desired_state:
+            self.desired_state.stop()
+        if self.heartbeat:
+            self.heartbeat.stop()
+        self.server.close()
+        for shard in self.shards:
+            if shard.process.is_alive():
+                shard.process.terminate()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, shard.process.join) for shard in self.shards))
+        clear_files([shard.journal_file for shard in self.shards])
+        await self.server.wait_closed()
+        logging.info("Server stopped.")
+
+    async def _request(self, shard: Shard, request_data: JsonData) -> JsonData:
+        reader, writer = await asyncio.open_unix_connection(shard.socket_file)
+        try:
+            await write_json(writer, request_data)
+            return await read_json(reader)
+        finally:
+            writer.close()
+
+    async def _gather(self, requests: dict[Shard, JsonData]) -> list[JsonData]:
+        return list(await asyncio.gather(*(self._request(shard, data) for shard, data in requests.items())))
+
+    def _shard_of(self, path: str) -> Shard:
+        """The shard of the dataset containing the path, otherwise the shard of its directory."""
+        dir_path = path
+        while self.datasets:
+            shard = self.datasets.get(dir_path)
+            if shard is not None:
+                return shard
+            parent = os.path.dirname(dir_path)
+            if parent == dir_path:
+                break
+            dir_path = parent
+        return self.shards[shard_of(path, len(self.shards))]
+
+    def _group_by_shard(self, file_paths: list[str]) -> dict[Shard, list[str]]:
+        groups: dict[Shard, list[str]] = dict()
+        for file_path in file_paths:
+            groups.setdefault(self._shard_of(file_path), []).append(file_path)
+        return groups
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            if self.configuration.use_unix_optimization:
+                tune_unix_connection(writer.get_extra_info('socket'))
+            while (request := await read_request(reader)) is not None:
+                request_data, session = request
+                logging.info(f"Received {request_data}")
+                await self._handle_command(parse_command(request_data), request_data, writer, session)
+                if not session:
+                    break
+        except Exception as e:
+            logging.error(f"Error while handling client: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _handle_command(
+        self,
+        command: Command,
+        request_data: DictJsonData,
+        writer: asyncio.StreamWriter,
+        session: bool
+    ) -> None:
+        if command.type.streamed:
+            count = await self._stream(command, request_data, writer)
+            if not writer.is_closing():
+                await end_stream(writer, session)
+            logging.info(f"Streamed {count} results")
+            return
+
+        await write_response(writer, await self._execute(command, request_data), session)
+
+    async def _execute(self, command: Command, request_data: DictJsonData) -> JsonData:
+        """Route a command which is answered by a single result to the shards concerned."""
+        match command.type:
+            case CommandType.ADD:
+                command: AddCommand
+                groups: dict[Shard, list[File]] = dict()
+                for file in command.files:
+                    groups.setdefault(self._shard_of(file.file_path), []).append(file)
+                responses = await self._gather({
+                    shard: AddCommand(files).to_json_data() for shard, files in groups.items()
+                })
+                response_data = [result for response in responses for result in response]
+                for (shard, files), response in zip(groups.items(), responses):
+                    shard.journal([
+                        (file.file_path, file.file_id)
+                        for file, result in zip(files, response)  # results follow the order of the files
+                        if result['status'] != TrackingStatus.NOT_FOUND.value
+                    ])
+            case CommandType.ADD_DIRECTORY:
+                command: AddDirectoryCommand
+                shard = self._shard_of(command.dir_path)
+                response_data = await self._request(shard, request_data)
+                if response_data['status'] == TrackingStatus.IN_PROGRESS.value:
+                    self.datasets[command.dir_path] = shard
+                    shard.directories[command.dir_path] = command.file_id
+            case CommandType.REMOVE:
+                command: RemoveCommand
+                groups = self._group_by_shard(command.file_paths)
+                responses = await self._gather({
+                    shard: RemoveCommand(file_paths).to_json_data() for shard, file_paths in groups.items()
+                })
+                response_data = [result for response in responses for result in response]
+                for shard, file_paths in groups.items():
+                    shard.journal([(file_path, None) for file_path in file_paths])
+                    for file_path in file_paths:
+                        if shard.directories.pop(file_path, None) is not None:
+                            del self.datasets[file_path]
+            case CommandType.INFO:
+                command: InfoCommand
+                response_data = await self._request(self._shard_of(command.file_path), request_data)
+            case CommandType.PROFILE:
+                responses = await self._gather({shard: request_data for shard in self.shards})
+                response_data = [result for response in responses for result in response]
+            case CommandType.PING:
+                responses = await self._gather({shard: request_data for shard in self.shards})
+                statistics = self._merge_statistics(responses)
+                if self.desired_state:
+                    statistics.update(self.desired_state.statistics())
+                if self.heartbeat:
+                    statistics.update(self.heartbeat.statistics())
+                response_data = PingResult(self.configuration, statistics).to_json_data()
+            case _:
+                raise ValueError(f"Unknown command {command}")
+        return response_data
+
+    async def _apply_desired_change(self, command: Command) -> JsonData:
+        return await self._execute(command, command.to_json_data())
+
+    async def _collect_statistics(self) -> DictJsonData:
+        command = SimpleCommand(CommandType.PING)
+        return (await self._execute(command, command.to_json_data()))['statistics']
+
+    def _merge_statistics(self, responses: list[DictJsonData]) -> DictJsonData:
+        statistics = {'shard_restarts': sum(shard.restarts for shard in self.shards)}
+        for response in responses:
+            for name, value in response.get('statistics', {}).items():
+                if name == 'watch_limit':
+                    statistics[name] = value  # one limit for the user of all shards
+                elif name != 'watch_usage':
+                    statistics[name] = statistics.get(name, 0) + value
+        if 'watch_limit' in statistics:
+            statistics['watch_usage'] = round(statistics['native_watches'] / statistics['watch_limit'], 3)
+        return statistics
+
+    async def _stream(
+        self,
+        command: BatchInfoCommand | HistoryCommand | WatchCommand,
+        request_data: DictJsonData,
+        writer: asyncio.StreamWriter
+    ) -> int:
+        """Forward a streamed command to the shards concerned and interleave their result lines."""
+        if command.type in (CommandType.BATCH_INFO, CommandType.HISTORY):
+            # files go to their shards, a prefix may match files of every shard
+            groups = self._group_by_shard(command.file_paths)
+            requests = dict()
+            for shard in self.shards if command.prefix else groups.keys():
+                shard_command = copy.copy(command)
+                shard_command.file_paths = groups.get(shard, [])
+                requests[shard] = shard_command.to_json_data()
+        else:
+            requests = {shard: request_data for shard in self.shards}
+
+        count = 0
+
+        async def forward(shard: Shard, data: DictJsonData) -> None:
+            nonlocal count
+            shard_reader, shard_writer = await asyncio.open_unix_connection(shard.socket_file)
+            try:
+                await write_json(shard_writer, data)
+                while line := await shard_reader.readline():
+                    if writer.is_closing():
+                        raise ConnectionError("client disconnected")
+                    writer.write(line)
+                    if line.strip():
+                        count += 1
+                    if not line.strip() or writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                        await writer.drain()
+            finally:
+                shard_writer.close()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for shard, data in requests.items():
+                    group.create_task(forward(shard, data))
+        except* ConnectionError:
+            pass
+
+        if not writer.is_closing():
+            await writer.drain()
+        return count
@@ -0,0 +1,102 @@
+"""
+The light part of the client: settings, the client state and a blocking request to the server.
+It imports neither click nor asyncio, so `file-tracker status` answers without loading them.
+"""
+import os
+import json
+import socket
+from .core.communication.system import get_pid, is_process_running, load_env
+
+load_env(os.path.join("eba_file_tracker", "var", ".env"))
+PID_FILE = os.getenv("PID_FILE")
+SOCKET_FILE = os.getenv("SOCKET_FILE")
+HOST_NAME = os.getenv("HOST_NAME")
+HOST_PORT = int(os.getenv("HOST_PORT"))
+CLIENT_STATE_FILE = os.getenv("CLIENT_STATE_FILE")
+
+RECEIVE_SIZE = 64 * 1024
+
+
+class State:
+    def __init__(self, json_data: dict) -> None:
+        self.state = json_data
+        self.changed = False
+
+    @property
+    def use_unix_optimization(self) -> bool:
+        return self.state.get('use_unix_optimization', os.name == 'posix')
+
+    @use_unix_optimization.setter
+    def use_unix_optimization(self, value: bool) -> None:
+        if self.state.get('use_unix_optimization') != value:
+            self.state['use_unix_optimization'] = value
+            self.changed = True
+
+    def clear(self) -> None:
+        self.changed = self.changed or bool(self.state)
+        self.state = dict()
+
+    @staticmethod
+    def read() -> 'State':
+        try:
+            with open(CLIENT_STATE_FILE, "r") as file:
+                return State(json.load(file))
+        except (FileNotFoundError, ValueError):
+            return State(dict())
+
+    def write(self) -> None:
+        """Save the state, only if a command has changed it."""
+        if not self.changed:
+            return
+        with open(CLIENT_STATE_FILE, "w") as file:
+            json.dump(self.state, file)
+        self.changed = False
+
+
+_state: State | None = None
+
+
+def get_state() -> State:
+    global _state
+    if _state is None:
+        _state = State.read()
+    return _state
+
+
+def slim_ping() -> bool:
+    """Simplified server work check."""
+    return os.path.exists(PID_FILE) and is_process_running(get_pid(PID_FILE))
+
+
+def request_json(json_data: dict) -> dict:
+    """Send a not streamed command with a blocking socket and read the answer until EOF."""
+    if get_state().use_unix_optimization:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = SOCKET_FILE
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (HOST_NAME, HOST_PORT)
+
+    with sock:
+        sock.connect(address)
+        sock.sendall(json.dumps(json_data).encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := sock.recv(RECEIVE_SIZE):
+            chunks.append(chunk)
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+
+def print_status() -> None:
+    """The status command without the event loop and the command models."""
+    if not slim_ping():
+        print("Server is not running")
+        return
+
+    json_data = request_json({'command': 'ping'})
+    statistics = json_data.pop('statistics', None) or dict()
+    json_data.pop('command_result', None)
+    print("Server is working with configuration:")
+    print('\n'.join(f"- {key}={value}" for key, value in json_data.items() if value is not None))
+    print("Statistics:")
+    print('\n'.join(f"- {key}={value}" for key, value in statistics.items()))
@@ -4,3 +4,5 @@ REFRESH_TOKEN_NOT_FOUND = "Refresh token not found"
 REFRESH_TOKEN_EXPIRED = "Refresh token expired"
 REFRESH_TOKEN_ALREADY_USED = "Refresh token already used"
 EMAIL_ADDRESS_ALREADY_USED = "Cannot use this email address"
+INGEST_RATE_LIMITED = "Too many ingest requests from this host"
+INGEST_OVERLOADED = "Server is busy with other ingest requests"
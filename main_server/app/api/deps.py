@@ -1,13 +1,14 @@
 from collections.abc import AsyncGenerator
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import api_messages
 from app.core import database_session
+from app.core.rate_limit import get_ingest_limiter
 from app.core.security.jwt import verify_jwt_token
 from app.models import User
 
@@ -19,6 +20,27 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def limit_ingest(request: Request) -> AsyncGenerator[None, None]:
+    # the peer address, a header the client chooses would give it a fresh bucket on every request
+    host = request.client.host if request.client else ""
+    limiter = get_ingest_limiter()
+
+    rejection = limiter.try_acquire(host)
+    if rejection is not None:
+        status_code, retry_after = rejection
+        raise HTTPException(
+            status_code=status_code,
+            detail=api_messages.INGEST_OVERLOADED if status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            else api_messages.INGEST_RATE_LIMITED,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: AsyncSession = Depends(get_session),
@@ -1,74 +1,123 @@
-from datetime import datetime
+import gzip
+import json
 
 from fastapi import APIRouter, status
-from fastapi import Depends
+from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
-from app.api.deps import get_session
-from app.core.repository import DatasetUsageHistoryRepository, DatasetRepository
-from app.models import DatasetGeneralInfo, Dataset
-from app.schemas.requests import DaemonClientRequest
+from app.api.deps import get_session, limit_ingest
+from app.core.config import get_settings
+from app.core.heartbeat import get_heartbeat_buffer
+from app.core.ingest import decode_event_batch
+from app.core.ingest_writer import UsageEventWriter
+from app.core.repository import TrackedPathRepository
+from app.schemas.requests import DaemonClientRequest, HeartbeatRequest
 
 router = APIRouter()
 
+DESIRED_STATE_VERSION = 1
+DESIRED_STATE_COMPRESS_LEVEL = 6
 
-@router.post("/add_event", status_code=status.HTTP_200_OK, description="Add an event for dataset usage")
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+
+
+@router.post(
+    "/add_event",
+    status_code=status.HTTP_200_OK,
+    description="Add an event for dataset usage",
+    dependencies=[Depends(limit_ingest)]
+)
 async def add_usage_event(
         client_request: DaemonClientRequest,
         session: AsyncSession = Depends(get_session)
 ):
-    dataset_repo = DatasetRepository(session)
-    events_repo = DatasetUsageHistoryRepository(session)
-
-    dataset_query = select(Dataset).filter(
-        Dataset.file_path == client_request.file_path,
-        Dataset.host == client_request.hostname,
-        Dataset.dataset_general_info_id == client_request.dataset_general_info_id
-    )
-
-    result = await session.execute(dataset_query)
-    dataset = result.scalar_one_or_none()
-    print(f'DATASET = {dataset}')
-
-    if not dataset:
-        dataset_general_info_query = select(DatasetGeneralInfo).filter(
-            DatasetGeneralInfo.id == client_request.dataset_general_info_id
+    handles, events, _ = await UsageEventWriter(session).write([client_request])
+    if handles[0] is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": f"DatasetGeneralInfo with ID {client_request.dataset_general_info_id} not found"}
         )
-        result = await session.execute(dataset_general_info_query)
-        dataset_general_info = result.scalar_one_or_none()
-
-        print(f'dataset_general_info = {dataset_general_info}')
-        if not dataset_general_info:
-            return JSONResponse(
-                status_code=status.HTTP_404_NOT_FOUND,
-                content={"message": f"DatasetGeneralInfo with ID {client_request.dataset_general_info_id} not found"}
-            )
-
-        dataset = Dataset(
-            file_path=client_request.file_path,
-            access_rights=client_request.access_rights,
-            size=client_request.size,
-            host=client_request.hostname,
-            created_at_device=client_request.age,
-            created_at_server=datetime.utcnow(),
-            dataset_general_info=dataset_general_info
-        )
-
-        session.add(dataset)
-        await session.commit()
-        await session.refresh(dataset)
-
-    dataset.last_access_date = client_request.last_access_date
-    dataset.last_modification_date = client_request.last_modification_date
-    dataset.size = client_request.size
 
-    await session.commit()
+    return {"message": f"Event added = {events[0]}"}
 
-    event_added = await events_repo.add_event(dataset.id, client_request)
-    verdict = {"message": f"Event added = {event_added}"}
-    print(verdict)
-    return verdict
 
+@router.post(
+    "/add_events",
+    status_code=status.HTTP_200_OK,
+    description="Add a batch of dataset usage events in the compact columnar encoding, optionally gzip-compressed. "
+                "Full events are answered with a handle that later partial events of the same file refer to",
+    dependencies=[Depends(limit_ingest)]
+)
+async def add_usage_events(
+        request: Request,
+        session: AsyncSession = Depends(get_session)
+):
+    try:
+        rows = decode_event_batch(await request.body(), request.headers.get("content-encoding"))
+    except ValueError as e:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"message": f"Malformed event batch: {e}"}
+        )
 
+    handles, _, unknown_dataset_ids = await UsageEventWriter(session).write(rows)
+
+    accepted = sum(handle is not None for handle in handles)
+    return {
+        "accepted": accepted,
+        "rejected": len(rows) - accepted,
+        "unknown_dataset_general_info_ids": sorted(unknown_dataset_ids),
+        "handles": handles,
+    }
+
+
+@router.get(
+    "/desired_state",
+    status_code=status.HTTP_200_OK,
+    description="Get the files and directories a tracker host should track as [path, dataset_general_info_id] pairs. "
+                "The document carries an ETag, a request with a matching If-None-Match is answered with 304",
+    responses={304: {"description": "The desired state did not change"}}
+)
+async def get_desired_state(
+        host: str,
+        request: Request,
+        session: AsyncSession = Depends(get_session)
+):
+    repository = TrackedPathRepository(session)
+    version = await repository.get_version(host)
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # a change between the two queries is sent under the older version, the next poll fetches the state again
+    files, directories = await repository.get_desired_state(host)
+    body = json.dumps(
+        {"version": DESIRED_STATE_VERSION, "etag": version, "files": files, "directories": directories},
+        separators=(",", ":")
+    ).encode()
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=DESIRED_STATE_COMPRESS_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.post(
+    "/heartbeat",
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Report that a tracker daemon is alive, with its version and load. "
+                "Heartbeats are coalesced in memory and written periodically"
+)
+async def add_heartbeat(heartbeat: HeartbeatRequest):
+    if not get_heartbeat_buffer().record(heartbeat):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "Too many unflushed heartbeats"},
+            headers={"Retry-After": str(round(get_settings().heartbeat.flush_interval))}
+        )
+    return {"message": "Heartbeat accepted"}
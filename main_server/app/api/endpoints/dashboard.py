@@ -1,16 +1,21 @@
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import HttpUrl
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
+from app.core.config import get_settings
 from app.core.db_utils import get_dataset_summaries
+from app.core.heartbeat import get_heartbeat_buffer
 from app.core.repository import LinkRepository, \
-    DatasetGeneralInfoRepository
-from app.models import Link
-from app.schemas.requests import LinkDescriptionUpdateRequest, DatasetInfoUpdateRequest, DatasetInfoCreateRequest
-from app.schemas.responses import LinkResponse, DatasetsSummary, DatasetInfoUpdateResponse
+    DatasetGeneralInfoRepository, TrackedPathRepository, TrackerHostRepository
+from app.models import Link, TrackedPath, TrackerHost
+from app.schemas.requests import LinkDescriptionUpdateRequest, DatasetInfoUpdateRequest, DatasetInfoCreateRequest, \
+    TrackedPathRequest
+from app.schemas.responses import LinkResponse, DatasetsSummary, DatasetInfoUpdateResponse, TrackedPathResponse, \
+    TrackerHostResponse
 
 router = APIRouter()
 
@@ -64,3 +69,71 @@ async def delete_link(
     repository = LinkRepository(session)
 
     return await repository.delete_link(str(link_url))
+
+
+@router.get(
+    "/tracked_paths",
+    status_code=status.HTTP_200_OK,
+    response_model=List[TrackedPathResponse],
+    description="Get the files and directories a tracker host should track"
+)
+async def get_tracked_paths(
+    host: str,
+    session: AsyncSession = Depends(deps.get_session)
+) -> List[TrackedPath]:
+    repository = TrackedPathRepository(session)
+
+    return list(await repository.get_by_host(host))
+
+@router.post(
+    "/tracked_paths",
+    status_code=status.HTTP_200_OK,
+    response_model=List[TrackedPathResponse],
+    description="Register a file or directory a tracker host should track, its daemon picks it up on the next poll"
+)
+async def add_or_update_tracked_path(
+    request: TrackedPathRequest,
+    session: AsyncSession = Depends(deps.get_session)
+) -> List[TrackedPath]:
+    repository = TrackedPathRepository(session)
+    tracked_paths = await repository.add_or_update(request)
+    if tracked_paths is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"DatasetGeneralInfo with ID {request.dataset_general_info_id} not found"
+        )
+
+    return list(tracked_paths)
+
+@router.delete("/tracked_paths", status_code=status.HTTP_200_OK, response_model=List[TrackedPathResponse])
+async def delete_tracked_path(
+    host: str,
+    path: str,
+    session: AsyncSession = Depends(deps.get_session)
+) -> List[TrackedPath]:
+    repository = TrackedPathRepository(session)
+
+    return list(await repository.delete(host, path))
+
+
+@router.get(
+    "/hosts/stale",
+    status_code=status.HTTP_200_OK,
+    response_model=List[TrackerHostResponse],
+    description="Get the tracker hosts without a heartbeat for stale_after seconds, the longest silent first"
+)
+async def get_stale_hosts(
+    stale_after: Optional[float] = None,
+    session: AsyncSession = Depends(deps.get_session)
+) -> List[TrackerHost]:
+    if stale_after is None:
+        stale_after = get_settings().heartbeat.stale_after
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_after)
+    repository = TrackerHostRepository(session)
+    buffer = get_heartbeat_buffer()
+
+    # a heartbeat waiting for the next flush is as good as a written one
+    return [
+        host for host in await repository.get_not_seen_since(cutoff)
+        if (buffer.last_seen(host.host) or host.last_seen) < cutoff
+    ]
@@ -0,0 +1,170 @@
+# Run-length compaction of READ events into access sessions.
+#
+# A file read in a loop gets a new access time on every read, and every new access time used to be a READ event.
+# Reads of a dataset less than the session gap apart are stored as one access session instead,
+# a (start_time, end_time, read_count) row of `dataset_access_session`:
+#
+# - reads are merged into the sessions of their datasets when a batch of events is ingested,
+# - READ events stored before are moved into sessions by a background compaction job.
+#
+# A read at a time an existing session of its dataset covers is not counted again: it is a retried upload
+# or a replay from a daemon's spool, so sessions stay idempotent like the keyed events are. Writers of the sessions
+# of a dataset take a transaction advisory lock on its id first, so two batches with the same new read,
+# like a retry sent while the original request is in flight, cannot both insert a session for it.
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.models import DatasetAccessSession, DatasetUsageHistory, EventType
+
+Read = tuple[int, datetime]  # dataset id, access time (naive UTC like the event times)
+
+
+@dataclass
+class _Span:
+    start: datetime
+    end: datetime
+    count: int
+    id: int | None = None  # None for a session which is not stored yet
+
+
+def _merge(spans: list[_Span], gap: timedelta) -> tuple[list[_Span], list[int]]:
+    """Merge spans less than the gap apart, return the merged spans and the stored sessions they absorbed."""
+    merged: list[_Span] = []
+    absorbed = []
+    for span in sorted(spans, key=lambda span: span.start):
+        if not merged or span.start - merged[-1].end > gap:
+            merged.append(span)
+            continue
+        current = merged[-1]
+        current.end = max(current.end, span.end)
+        current.count += span.count
+        if current.id is None:
+            current.id = span.id
+        elif span.id is not None:
+            absorbed.append(span.id)
+    return merged, absorbed
+
+
+def get_session_gap() -> timedelta:
+    return timedelta(seconds=get_settings().access_sessions.gap)
+
+
+class AccessSessionWriter:
+    def __init__(self, session: AsyncSession, gap: timedelta):
+        self.session = session
+        self.gap = gap
+
+    async def add_reads(self, reads: list[Read]) -> set[Read]:
+        """
+        Merge reads into the access sessions of their datasets, without committing.
+        Returns the reads which were counted, the others are covered by a session already.
+        """
+        if not reads:
+            return set()
+        by_dataset: dict[int, set[datetime]] = {}
+        for dataset_id, read_time in reads:
+            by_dataset.setdefault(dataset_id, set()).add(read_time)
+
+        await self._lock_datasets(by_dataset.keys())
+        stored: dict[int, list[DatasetAccessSession]] = {}
+        for access_session in await self._read_sessions(by_dataset.keys(), reads):
+            stored.setdefault(access_session.dataset_id, []).append(access_session)
+
+        counted: set[Read] = set()
+        inserted, updated, deleted = [], [], []
+        for dataset_id, read_times in by_dataset.items():
+            sessions = {access_session.id: access_session for access_session in stored.get(dataset_id, [])}
+            spans = [
+                _Span(access_session.start_time, access_session.end_time, access_session.read_count, access_session.id)
+                for access_session in sessions.values()
+            ]
+            for read_time in read_times:
+                if any(span.start <= read_time <= span.end for span in spans if span.id is not None):
+                    continue
+                counted.add((dataset_id, read_time))
+                spans.append(_Span(read_time, read_time, 1))
+
+            merged, absorbed = _merge(spans, self.gap)
+            deleted += absorbed
+            for span in merged:
+                values = {"start_time": span.start, "end_time": span.end, "read_count": span.count}
+                if span.id is None:
+                    inserted.append({"dataset_id": dataset_id, **values})
+                elif (sessions[span.id].start_time, sessions[span.id].end_time, sessions[span.id].read_count) \
+                        != (span.start, span.end, span.count):
+                    updated.append({"id": span.id, **values})
+
+        if deleted:
+            await self.session.execute(delete(DatasetAccessSession).where(DatasetAccessSession.id.in_(deleted)))
+        if updated:
+            await self.session.execute(update(DatasetAccessSession), updated)
+        if inserted:
+            await self.session.execute(insert(DatasetAccessSession), inserted)
+        return counted
+
+    async def _lock_datasets(self, dataset_ids) -> None:
+        """Lock the sessions of the datasets until the commit, in the order of their ids so writers never deadlock."""
+        dataset_id = func.unnest(array(sorted(dataset_ids))).column_valued("dataset_id")
+        await self.session.execute(select(func.pg_advisory_xact_lock(dataset_id)))
+
+    async def _read_sessions(self, dataset_ids, reads: list[Read]) -> list[DatasetAccessSession]:
+        """The sessions of the datasets a read may extend, row locked against the retention worker."""
+        first = min(read_time for _, read_time in reads) - self.gap
+        last = max(read_time for _, read_time in reads) + self.gap
+        result = await self.session.execute(
+            select(DatasetAccessSession)
+            .where(
+                DatasetAccessSession.dataset_id.in_(dataset_ids),
+                DatasetAccessSession.end_time >= first,
+                DatasetAccessSession.start_time <= last,
+            )
+            .with_for_update()
+        )
+        return list(result.scalars().all())
+
+
+async def compact_read_events(session: AsyncSession, gap: timedelta, batch_size: int) -> int:
+    """Move the oldest READ events into access sessions in one transaction, return how many were moved."""
+    result = await session.execute(
+        select(DatasetUsageHistory.id, DatasetUsageHistory.dataset_id, DatasetUsageHistory.event_time)
+        .where(DatasetUsageHistory.event_type == EventType.READ)
+        .order_by(DatasetUsageHistory.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)  # another server compacting at the same time takes other events
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+
+    await AccessSessionWriter(session, gap).add_reads([(dataset_id, event_time) for _, dataset_id, event_time in rows])
+    await session.execute(delete(DatasetUsageHistory).where(DatasetUsageHistory.id.in_([row.id for row in rows])))
+    await session.commit()
+    return len(rows)
+
+
+async def compact_read_events_periodically() -> None:
+    """Compact the stored READ events every compaction interval, until cancelled."""
+    settings = get_settings().access_sessions
+    while True:
+        await asyncio.sleep(settings.compaction_interval)
+        try:
+            compacted = 0
+            async with database_session.get_async_session() as session:
+                while True:
+                    count = await compact_read_events(session, get_session_gap(), settings.compaction_batch_size)
+                    compacted += count
+                    if count < settings.compaction_batch_size:
+                        break
+            if compacted:
+                logging.info(f"Compacted {compacted} READ events into access sessions")
+        except Exception as e:
+            logging.error(f"Couldn't compact READ events: {e}")
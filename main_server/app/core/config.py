@@ -17,7 +17,7 @@
 from functools import lru_cache
 from pathlib import Path
 
-from pydantic import AnyHttpUrl, BaseModel, SecretStr, computed_field
+from pydantic import AnyHttpUrl, BaseModel, SecretStr, computed_field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from sqlalchemy.engine.url import URL
 
@@ -40,11 +40,56 @@ class Database(BaseModel):
     password: SecretStr
     port: int = 5432
     db: str = "postgres"
+    prepared_statement_cache_size: int = 500  # per connection, the ingest statements are prepared once
+
+
+class Ingest(BaseModel):
+    host_rate: float = 5.0  # ingest requests per second a single tracker host may sustain
+    host_burst: int = 20
+    max_in_flight: int = 32  # ingest requests processed at once by this server
+    max_tracked_hosts: int = 10_000
+    relay_hosts: list[str] = []  # addresses of relay daemons, each forwarding many hosts, limited on their own
+    relay_rate: float = 50.0
+    relay_burst: int = 200
+
+
+class Heartbeat(BaseModel):
+    flush_interval: float = 30.0  # seconds heartbeats of tracker hosts are coalesced in memory before written
+    stale_after: float = 60.0  # seconds without a heartbeat after which a tracker host is stale
+    max_buffered_hosts: int = 100_000
+
+
+class AccessSessions(BaseModel):
+    gap: float = 300.0  # seconds between two reads of a dataset for them to be one access session
+    compaction_interval: float = 600.0  # seconds between compactions of READ events into access sessions
+    compaction_batch_size: int = 10_000  # READ events compacted per transaction
+
+
+STATISTIC_WINDOW_DAYS = 30  # days of raw usage history the usage statistic of a dataset counts
+
+
+class Retention(BaseModel):
+    max_age_days: float = 90.0  # usage history older than this is downsampled into daily aggregates, 0 disables
+    interval: float = 3600.0  # seconds between retention runs
+    batch_size: int = 5_000  # rows deleted per transaction, small enough to hold row locks briefly
+    batch_pause: float = 0.2  # seconds slept between two batches, leaving the table to the ingest
+
+    @field_validator("max_age_days")
+    @classmethod
+    def keep_a_month(cls, value: float) -> float:
+        # the usage statistic counts the events of its window from the raw history
+        if 0 < value < STATISTIC_WINDOW_DAYS:
+            raise ValueError(f"must be at least {STATISTIC_WINDOW_DAYS} days, or 0 to disable the retention")
+        return value
 
 
 class Settings(BaseSettings):
     security: Security
     database: Database
+    ingest: Ingest = Ingest()
+    heartbeat: Heartbeat = Heartbeat()
+    access_sessions: AccessSessions = AccessSessions()
+    retention: Retention = Retention()
 
     @computed_field  # type: ignore[prop-decorator]
     @property
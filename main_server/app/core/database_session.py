@@ -17,7 +17,7 @@ from sqlalchemy.ext.asyncio import (
 from app.core.config import get_settings
 
 
-def new_async_engine(uri: URL) -> AsyncEngine:
+def new_async_engine(uri: URL, prepared_statement_cache_size: int = 100) -> AsyncEngine:
     return create_async_engine(
         uri,
         pool_pre_ping=True,
@@ -25,10 +25,13 @@ def new_async_engine(uri: URL) -> AsyncEngine:
         max_overflow=10,
         pool_timeout=30.0,
         pool_recycle=600,
+        connect_args={"prepared_statement_cache_size": prepared_statement_cache_size},
     )
 
 
-_ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
+_ASYNC_ENGINE = new_async_engine(
+    get_settings().sqlalchemy_database_uri, get_settings().database.prepared_statement_cache_size
+)
 _ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
 
 
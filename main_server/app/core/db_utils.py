@@ -41,7 +41,8 @@ async def get_dataset_summaries(session: AsyncSession = Depends(deps.get_session
                 created_at_host=dataset.created_at_device,
                 last_read=statistic.last_read,
                 last_modified=statistic.last_modified,
-                frequency_of_use_in_month=statistic.frequency_of_use_in_month
+                frequency_of_use_in_month=statistic.frequency_of_use_in_month,
+                read_sessions_in_month=statistic.read_sessions_in_month
             )
 
 
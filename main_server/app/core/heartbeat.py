@@ -0,0 +1,102 @@
+# Registry of the file tracker daemons, fed by their heartbeats.
+#
+# Heartbeats are not written one by one: the latest heartbeat of every host is kept in memory
+# and all of them are upserted into `tracker_host` in one statement per chunk every flush interval,
+# so thousands of hosts beating every few seconds cost a write every flush interval instead.
+# A heartbeat only lost in a crash is replaced by the next one of its host.
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.models import TrackerHost
+from app.schemas.requests import HeartbeatRequest
+
+FLUSH_CHUNK_SIZE = 1000  # hosts per upsert statement, far below the bind parameter limit
+
+
+class HeartbeatBuffer:
+    def __init__(self, max_hosts: int) -> None:
+        self.max_hosts = max_hosts
+        self.received = 0
+        self.flushed = 0
+        self._pending: dict[str, dict] = {}
+
+    def record(self, heartbeat: HeartbeatRequest) -> bool:
+        """
+        Keep the heartbeat until the next flush, replacing an earlier one of the host.
+        False if the buffer is full, which happens only when flushes keep failing.
+        """
+        if heartbeat.hostname not in self._pending and len(self._pending) >= self.max_hosts:
+            return False
+
+        self._pending[heartbeat.hostname] = {
+            "host": heartbeat.hostname,
+            "version": heartbeat.version,
+            "tracked_files": heartbeat.tracked_files,
+            "upload_queue_size": heartbeat.upload_queue_size,
+            "spool_bytes": heartbeat.spool_bytes,
+            "last_seen": datetime.now(timezone.utc),
+        }
+        self.received += 1
+        return True
+
+    def last_seen(self, host: str) -> datetime | None:
+        """When a heartbeat of the host which is not flushed yet arrived."""
+        pending = self._pending.get(host)
+        return pending["last_seen"] if pending else None
+
+    async def flush(self, session: AsyncSession) -> int:
+        """Upsert the buffered heartbeats, which are put back if the write fails or is cancelled."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = list(pending.values())
+        try:
+            for i in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                stmt = insert(TrackerHost).values(rows[i:i + FLUSH_CHUNK_SIZE])
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[TrackerHost.host],
+                    set_={
+                        **{
+                            column: stmt.excluded[column]
+                            for column in ("version", "tracked_files", "upload_queue_size", "spool_bytes", "last_seen")
+                        },
+                        "update_time": func.now(),
+                    },
+                ))
+            await session.commit()
+        except BaseException:
+            # put back first, the rollback may be interrupted by a cancellation as well
+            self._pending = {**pending, **self._pending}  # heartbeats received meanwhile are newer
+            await session.rollback()
+            raise
+
+        self.flushed += len(rows)
+        return len(rows)
+
+
+@lru_cache(maxsize=1)
+def get_heartbeat_buffer() -> HeartbeatBuffer:
+    return HeartbeatBuffer(max_hosts=get_settings().heartbeat.max_buffered_hosts)
+
+
+async def flush_heartbeats_periodically() -> None:
+    """Flush the heartbeat buffer every flush interval, until cancelled."""
+    buffer = get_heartbeat_buffer()
+    interval = get_settings().heartbeat.flush_interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with database_session.get_async_session() as session:
+                await buffer.flush(session)
+        except Exception as e:
+            logging.error(f"Couldn't flush tracker heartbeats: {e}")
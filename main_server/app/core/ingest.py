@@ -0,0 +1,129 @@
+# Decoding of compressed event batches uploaded by the file tracker daemons.
+#
+# A batch is a (usually gzip-compressed) JSON object with the field names sent once:
+#
+# {
+#     "version": 2,
+#     "columns": {
+#         "handle": [...],
+#         "hostname": [...], "file_path": [...], "dataset_general_info_id": [...],
+#         "age": [...], "access_rights": [...], "last_access_date": [...],
+#         "last_modification_date": [...], "size": [...],
+#         "event_key": [...]
+#     }
+# }
+#
+# Dates are epoch milliseconds and access rights are permission bits as integers.
+#
+# A row with a null handle is a full event. A row with a handle (the dataset id returned for an earlier
+# full event of the same file) is a partial event: the hostname is the host of the dataset, which the handle
+# is checked against, the other identity columns are null and so is every field that did not change.
+# Version 1 batches have no handle column and only full events.
+#
+# The event key of a row (since version 3) is generated by the daemon from the full metadata of the event,
+# so a retried or replayed row has the same key and the events it makes are stored only once.
+
+import json
+import zlib
+from datetime import datetime, timezone
+
+from app.schemas.requests import DaemonClientRequest, DaemonClientUpdate
+
+BATCH_VERSIONS = (1, 2, 3)
+BATCH_COLUMNS = (
+    "hostname",
+    "file_path",
+    "dataset_general_info_id",
+    "age",
+    "access_rights",
+    "last_access_date",
+    "last_modification_date",
+    "size",
+)
+MAX_BATCH_BYTES = 64 * 1024 * 1024  # decompressed
+
+
+def _from_epoch_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def _decompress(body: bytes, content_encoding: str | None) -> bytes:
+    if not content_encoding or content_encoding == "identity":
+        return body
+    if content_encoding != "gzip":
+        raise ValueError(f"unsupported content encoding {content_encoding!r}")
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BATCH_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"broken gzip stream: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"batch is larger than {MAX_BATCH_BYTES} bytes")
+    return data
+
+
+def _decode_row(
+        handle, hostname, file_path, dataset_general_info_id, age, mode, last_access, last_modification, size,
+        event_key
+) -> DaemonClientRequest | DaemonClientUpdate:
+    if handle is None:
+        return DaemonClientRequest(
+            hostname=hostname,
+            file_path=file_path,
+            dataset_general_info_id=dataset_general_info_id,
+            age=_from_epoch_ms(age),
+            access_rights=f"{mode:03o}",
+            last_access_date=_from_epoch_ms(last_access),
+            last_modification_date=_from_epoch_ms(last_modification),
+            size=size,
+            event_key=event_key,
+        )
+
+    return DaemonClientUpdate(
+        handle=handle,
+        hostname=hostname,
+        age=_from_epoch_ms(age) if age is not None else None,
+        access_rights=f"{mode:03o}" if mode is not None else None,
+        last_access_date=_from_epoch_ms(last_access) if last_access is not None else None,
+        last_modification_date=_from_epoch_ms(last_modification) if last_modification is not None else None,
+        size=size,
+        event_key=event_key,
+    )
+
+
+def decode_event_batch(
+        body: bytes,
+        content_encoding: str | None = None
+) -> list[DaemonClientRequest | DaemonClientUpdate]:
+    """Turn an uploaded batch into full events, as the single-event endpoint receives them, and partial ones.
+
+    Raises ValueError if the batch is malformed.
+    """
+    try:
+        batch = json.loads(_decompress(body, content_encoding))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+
+    if not isinstance(batch, dict) or batch.get("version") not in BATCH_VERSIONS:
+        raise ValueError(f"expected a batch of version {' or '.join(map(str, BATCH_VERSIONS))}")
+
+    columns = batch.get("columns")
+    if not isinstance(columns, dict) or any(not isinstance(columns.get(name), list) for name in BATCH_COLUMNS):
+        raise ValueError(f"a batch must have the columns {', '.join(BATCH_COLUMNS)}")
+
+    count = len(columns["file_path"])
+    handles = columns.get("handle", [None] * count)
+    event_keys = columns.get("event_key", [None] * count)
+    if not isinstance(handles, list) or not isinstance(event_keys, list) or any(
+        len(column) != count for column in (handles, event_keys, *(columns[name] for name in BATCH_COLUMNS))
+    ):
+        raise ValueError("columns have different lengths")
+
+    try:
+        return [
+            _decode_row(*row)
+            for row in zip(handles, *(columns[name] for name in BATCH_COLUMNS), event_keys)
+        ]
+    except (TypeError, ValueError, OverflowError, OSError) as e:
+        raise ValueError(f"invalid event: {e}") from e
@@ -0,0 +1,273 @@
+# Writing of ingested usage events as one unit of work.
+#
+# A batch of events is written in one transaction with a fixed number of round trips, whatever its size:
+#
+# 1. the dataset infos of full events are checked and the datasets the batch refers to are read,
+#    to know which fields of the datasets the events change,
+# 2. every dataset of the batch is upserted by `INSERT ... ON CONFLICT (host, file_path, dataset_general_info_id)
+#    DO UPDATE ... RETURNING id`, all of them in one executemany,
+# 3. READ events are merged into the access sessions of their datasets (see `access_sessions`),
+#    the other usage events are inserted in one executemany, skipping the ones stored already.
+#
+# An event of a row with an event key is keyed by it and its type: a retried batch, or rows replayed
+# from a daemon's spool after newer ones, make events with keys that exist and nothing is inserted for them.
+#
+# The upsert and the event insert have the same text for every batch, so their prepared statements are reused
+# (see `prepared_statement_cache_size` of the database settings). Concurrent batches for a new file cannot
+# create two datasets, the unique key makes the second one update the first.
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, case, func, literal_column, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.access_sessions import AccessSessionWriter, get_session_gap
+from app.models import Dataset, DatasetGeneralInfo, DatasetUsageHistory, EventType
+from app.schemas.requests import DaemonClientRequest, DaemonClientUpdate
+
+DatasetKey = tuple[str, str, int]  # host, file_path, dataset_general_info_id
+
+_DATASET_UPSERT = insert(Dataset)
+# a row older than the stored state, like one replayed from a spool after newer ones, leaves the state as it is;
+# the columns are kept by CASE rather than a WHERE, so RETURNING still has a row for every parameter set
+_IS_NEWER = and_(
+    or_(
+        Dataset.last_modification_date.is_(None),
+        _DATASET_UPSERT.excluded.last_modification_date >= Dataset.last_modification_date,
+    ),
+    or_(Dataset.last_access_date.is_(None), _DATASET_UPSERT.excluded.last_access_date >= Dataset.last_access_date),
+)
+_DATASET_UPSERT = _DATASET_UPSERT.on_conflict_do_update(
+    index_elements=[Dataset.host, Dataset.file_path, Dataset.dataset_general_info_id],
+    set_={
+        **{
+            column: case((_IS_NEWER, _DATASET_UPSERT.excluded[column]), else_=Dataset.__table__.c[column])
+            for column in ("access_rights", "size", "last_access_date", "last_modification_date")
+        },
+        "update_time": func.now(),
+    },
+).returning(Dataset.id, literal_column("xmax = 0").label("inserted"), sort_by_parameter_order=True)
+_USAGE_EVENT_INSERT = insert(DatasetUsageHistory).on_conflict_do_nothing(
+    index_elements=[DatasetUsageHistory.event_key, DatasetUsageHistory.event_type]
+).returning(DatasetUsageHistory.event_key, DatasetUsageHistory.event_type)
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc) if value else None
+    return value.astimezone(timezone.utc)
+
+
+@dataclass
+class DatasetState:
+    id: int | None  # None until the dataset is written
+    key: DatasetKey
+    created_at_device: datetime
+    access_rights: str
+    size: int
+    last_access_date: datetime | None
+    last_modification_date: datetime | None
+
+    @staticmethod
+    def from_dataset(dataset: Dataset) -> "DatasetState":
+        return DatasetState(
+            id=dataset.id,
+            key=(dataset.host, dataset.file_path, dataset.dataset_general_info_id),
+            created_at_device=_utc(dataset.created_at_device),
+            access_rights=dataset.access_rights,
+            size=dataset.size,
+            last_access_date=_utc(dataset.last_access_date),
+            last_modification_date=_utc(dataset.last_modification_date),
+        )
+
+
+class UsageEventWriter:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.access_sessions = AccessSessionWriter(session, get_session_gap())
+
+    async def write(
+        self,
+        rows: list[DaemonClientRequest | DaemonClientUpdate]
+    ) -> tuple[list[int | None], list[list[EventType]], set[int]]:
+        """
+        Write a batch of full and partial events and commit it.
+        Returns the dataset id of every row (None for a rejected row), the events added for every row
+        and the unknown dataset info ids full events referred to.
+        """
+        full_keys = {
+            (row.hostname, row.file_path, row.dataset_general_info_id)
+            for row in rows if isinstance(row, DaemonClientRequest)
+        }
+        # a handle is only resolved within the host it was handed out to
+        handles = {
+            (row.handle, row.hostname) for row in rows if isinstance(row, DaemonClientUpdate) and row.hostname
+        }
+        known_info_ids = await self._known_dataset_info_ids({key[2] for key in full_keys})
+        states: dict[DatasetKey, DatasetState] = {}
+        by_handle: dict[int, DatasetState] = {}
+        for state in await self._read_states(full_keys, handles):
+            states[state.key] = by_handle[state.id] = state
+
+        row_keys: list[DatasetKey | None] = []
+        row_events: list[list[tuple[EventType, datetime]]] = []
+        for received in rows:
+            if isinstance(received, DaemonClientUpdate):
+                state = by_handle.get(received.handle)
+                if state is None or state.key[0] != received.hostname:  # the dataset was deleted or is of another host
+                    row_keys.append(None)
+                    row_events.append([])
+                    continue
+                row = self._merge(state, received)
+            else:
+                row = received
+
+            key = (row.hostname, row.file_path, row.dataset_general_info_id)
+            if row.dataset_general_info_id not in known_info_ids and key not in states:
+                row_keys.append(None)
+                row_events.append([])
+                continue
+
+            row_keys.append(key)
+            row_events.append(self._apply(states, key, row))
+
+        dataset_ids, inserted = await self._upsert(states)
+        # a dataset another batch inserted first already has its CREATE event
+        row_events = [
+            [(event_type, event_time) for event_type, event_time in events
+             if event_type != EventType.CREATE or inserted[key]]
+            for key, events in zip(row_keys, row_events)
+        ]
+        counted_reads = await self.access_sessions.add_reads([
+            (dataset_ids[key], event_time.replace(tzinfo=None))
+            for key, events in zip(row_keys, row_events) if key is not None
+            for event_type, event_time in events if event_type == EventType.READ
+        ])
+        stored = await self._insert_events([
+            {
+                "dataset_id": dataset_ids[key],
+                "event_type": event_type,
+                "event_time": event_time.replace(tzinfo=None),
+                "event_key": row.event_key,
+            }
+            for row, key, events in zip(rows, row_keys, row_events) if key is not None
+            for event_type, event_time in events if event_type != EventType.READ
+        ])
+        await self.session.commit()
+
+        def added(row, key: DatasetKey, event_type: EventType, event_time: datetime) -> bool:
+            if event_type == EventType.READ:
+                return (dataset_ids[key], event_time.replace(tzinfo=None)) in counted_reads
+            return row.event_key is None or (row.event_key, event_type) in stored
+
+        return (
+            [dataset_ids[key] if key is not None else None for key in row_keys],
+            [
+                [event_type for event_type, event_time in events if added(row, key, event_type, event_time)]
+                for row, key, events in zip(rows, row_keys, row_events)
+            ],
+            {key[2] for key in full_keys} - known_info_ids,
+        )
+
+    async def _known_dataset_info_ids(self, info_ids: set[int]) -> set[int]:
+        if not info_ids:
+            return set()
+        result = await self.session.execute(
+            select(DatasetGeneralInfo.id).where(DatasetGeneralInfo.id.in_(info_ids))
+        )
+        return set(result.scalars().all())
+
+    async def _read_states(self, keys: set[DatasetKey], handles: set[tuple[int, str]]) -> list[DatasetState]:
+        if not keys and not handles:
+            return []
+        conditions = []
+        if keys:
+            conditions.append(tuple_(Dataset.host, Dataset.file_path, Dataset.dataset_general_info_id).in_(keys))
+        if handles:
+            conditions.append(tuple_(Dataset.id, Dataset.host).in_(handles))
+        result = await self.session.execute(select(Dataset).where(or_(*conditions)))
+        return [DatasetState.from_dataset(dataset) for dataset in result.scalars().all()]
+
+    @staticmethod
+    def _merge(state: DatasetState, update: DaemonClientUpdate) -> DaemonClientRequest:
+        """The full event of a partial one: the fields it does not carry did not change."""
+        host, file_path, dataset_general_info_id = state.key
+        return DaemonClientRequest(
+            dataset_general_info_id=dataset_general_info_id,
+            hostname=host,
+            file_path=file_path,
+            age=update.age or state.created_at_device,
+            access_rights=update.access_rights or state.access_rights,
+            last_access_date=update.last_access_date or state.last_access_date or state.created_at_device,
+            last_modification_date=update.last_modification_date or state.last_modification_date
+            or state.created_at_device,
+            size=state.size if update.size is None else update.size,
+            event_key=update.event_key,
+        )
+
+    @staticmethod
+    def _apply(
+        states: dict[DatasetKey, DatasetState],
+        key: DatasetKey,
+        row: DaemonClientRequest
+    ) -> list[tuple[EventType, datetime]]:
+        """Update the state of the dataset by a full event unless it is older, return the usage events it makes."""
+        last_access, last_modification = _utc(row.last_access_date), _utc(row.last_modification_date)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = DatasetState(None, key, _utc(row.age), row.access_rights, row.size, None, None)
+            events = [(EventType.CREATE, state.created_at_device)]
+        else:
+            events = []
+        if last_access != state.last_access_date:
+            events.append((EventType.READ, last_access))
+        if last_modification != state.last_modification_date:
+            events.append((EventType.MODIFY, last_modification))
+
+        if (state.last_modification_date is not None and last_modification < state.last_modification_date) \
+                or (state.last_access_date is not None and last_access < state.last_access_date):
+            return events  # an older state, its events are recorded but the dataset keeps the newer one
+        state.access_rights = row.access_rights
+        state.size = row.size
+        state.last_access_date = last_access
+        state.last_modification_date = last_modification
+        return events
+
+    async def _insert_events(self, usage_events: list[dict]) -> set[tuple[str, EventType]]:
+        """Insert the usage events whose keys are new, return the keys of the inserted ones."""
+        if not usage_events:
+            return set()
+        result = await self.session.execute(_USAGE_EVENT_INSERT, usage_events)
+        return {(event_key, event_type) for event_key, event_type in result.all() if event_key is not None}
+
+    async def _upsert(
+        self,
+        states: dict[DatasetKey, DatasetState]
+    ) -> tuple[dict[DatasetKey, int], dict[DatasetKey, bool]]:
+        """Write the final state of every dataset of the batch, return their ids and which ones were inserted."""
+        if not states:
+            return {}, {}
+        keys = list(states.keys())
+        result = await self.session.execute(
+            _DATASET_UPSERT,
+            [
+                {
+                    "host": state.key[0],
+                    "file_path": state.key[1],
+                    "dataset_general_info_id": state.key[2],
+                    "access_rights": state.access_rights,
+                    "size": state.size,
+                    "created_at_device": state.created_at_device,
+                    "last_access_date": state.last_access_date,
+                    "last_modification_date": state.last_modification_date,
+                }
+                for state in states.values()
+            ],
+        )
+        dataset_ids, inserted = {}, {}
+        for key, (dataset_id, was_inserted) in zip(keys, result.all()):
+            dataset_ids[key] = dataset_id
+            inserted[key] = was_inserted
+        return dataset_ids, inserted
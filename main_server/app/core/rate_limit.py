@@ -0,0 +1,101 @@
+# Admission control for the ingest routes the file tracker daemons post to.
+#
+# Every host gets a token bucket (one token per request) and the number of ingest requests
+# being processed at once is capped for the whole server. Rejected requests get the number
+# of seconds to wait, which the routes send back as `Retry-After`.
+#
+# Hosts are told apart by peer address, so the shards of one daemon share its bucket. A relay
+# daemon forwards the batches of many hosts from one address, so the configured relay addresses
+# get buckets of their own, sized by `relay_rate` and `relay_burst` and never evicted.
+
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Collection
+from functools import lru_cache
+
+from app.core.config import get_settings
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class IngestLimiter:
+    def __init__(
+        self,
+        host_rate: float,
+        host_burst: int,
+        max_in_flight: int,
+        max_hosts: int,
+        relay_hosts: Collection[str] = (),
+        relay_rate: float = 0.0,
+        relay_burst: int = 0,
+    ) -> None:
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.max_in_flight = max_in_flight
+        self.max_hosts = max_hosts
+        self.relay_rate = relay_rate
+        self.relay_burst = relay_burst
+        self.in_flight = 0
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()  # least recently seen host first
+        self._relay_buckets = {relay: TokenBucket(relay_burst, time.monotonic()) for relay in relay_hosts}
+
+    @staticmethod
+    def _refill(bucket: TokenBucket, now: float, rate: float, burst: int) -> None:
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+
+    def _host_bucket(self, host: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            while len(self._buckets) >= self.max_hosts:
+                self._buckets.popitem(last=False)  # the host seen longest ago, most likely with a full bucket
+            bucket = self._buckets[host] = TokenBucket(self.host_burst, now)
+        else:
+            self._refill(bucket, now, self.host_rate, self.host_burst)
+            self._buckets.move_to_end(host)
+        return bucket
+
+    def try_acquire(self, host: str) -> tuple[int, int] | None:
+        """Take a request slot for the host, or return (status code, retry after seconds) to reject it."""
+        if self.in_flight >= self.max_in_flight:
+            return 503, 1
+
+        now = time.monotonic()
+        bucket = self._relay_buckets.get(host)
+        if bucket is not None:
+            rate = self.relay_rate
+            self._refill(bucket, now, rate, self.relay_burst)
+        else:
+            rate = self.host_rate
+            bucket = self._host_bucket(host, now)
+
+        if bucket.tokens < 1:
+            return 429, math.ceil((1 - bucket.tokens) / rate)
+
+        bucket.tokens -= 1
+        self.in_flight += 1
+        return None
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+
+@lru_cache(maxsize=1)
+def get_ingest_limiter() -> IngestLimiter:
+    settings = get_settings().ingest
+    return IngestLimiter(
+        host_rate=settings.host_rate,
+        host_burst=settings.host_burst,
+        max_in_flight=settings.max_in_flight,
+        max_hosts=settings.max_tracked_hosts,
+        relay_hosts=settings.relay_hosts,
+        relay_rate=settings.relay_rate,
+        relay_burst=settings.relay_burst,
+    )
@@ -1,14 +1,18 @@
-from datetime import datetime, timedelta, timezone
+import hashlib
+from datetime import date, datetime, timedelta
 from typing import Optional, Sequence, List
 
 from sqlalchemy import func, desc
 from sqlalchemy import update, delete
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
-from app.models import Dataset, DatasetUsageHistory, EventType, Link, DatasetGeneralInfo
-from app.schemas.requests import DaemonClientRequest, LinkDescriptionUpdateRequest
+from app.core.config import STATISTIC_WINDOW_DAYS
+from app.models import Dataset, DatasetAccessSession, DatasetUsageAggregate, DatasetUsageHistory, EventType, Link, \
+    DatasetGeneralInfo, TrackedPath, TrackerHost
+from app.schemas.requests import LinkDescriptionUpdateRequest, TrackedPathRequest
 from app.schemas.responses import Statistic, DatasetsSummary
 
 
@@ -128,88 +132,88 @@ class DatasetUsageHistoryRepository:
         )
         return result.scalars().all()
 
-    async def delete_events_older_than(self, timestamp: datetime):
-        await self.session.execute(
-            delete(DatasetUsageHistory).where(DatasetUsageHistory.event_time < timestamp)
+    async def downsample_events_older_than(self, timestamp: datetime, batch_size: int) -> tuple[int, datetime | None]:
+        """
+        Delete up to batch_size of the oldest events older than timestamp, adding them to the daily aggregates,
+        and commit. Returns how many were deleted and the time of the newest one.
+        """
+        batch = select(DatasetUsageHistory.id).where(
+            DatasetUsageHistory.event_time < timestamp
+        ).order_by(DatasetUsageHistory.event_time).limit(batch_size).with_for_update(skip_locked=True)
+        result = await self.session.execute(
+            delete(DatasetUsageHistory)
+            .where(DatasetUsageHistory.id.in_(batch.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+            .returning(DatasetUsageHistory.dataset_id, DatasetUsageHistory.event_type, DatasetUsageHistory.event_time)
         )
-        await self.session.commit()
-
-    async def add_event(self, dataset_id, client_request: DaemonClientRequest):
-        event_types = [
-            EventType.READ,
-            EventType.MODIFY,
-            EventType.CREATE
-        ]
-        event_times = [
-            client_request.last_access_date,
-            client_request.last_modification_date,
-            client_request.age
-        ]
-        events = []
-
-        stmt = select(DatasetUsageHistory).filter(
-            DatasetUsageHistory.dataset_id == dataset_id
+        rows = [(dataset_id, event_type, event_time, 1) for dataset_id, event_type, event_time in result.all()]
+        return await self._aggregate(rows)
+
+    async def downsample_access_sessions_older_than(
+        self,
+        timestamp: datetime,
+        batch_size: int
+    ) -> tuple[int, datetime | None]:
+        """The same for access sessions which ended before timestamp, their reads are aggregated at their start."""
+        batch = select(DatasetAccessSession.id).where(
+            DatasetAccessSession.end_time < timestamp
+        ).order_by(DatasetAccessSession.end_time).limit(batch_size).with_for_update(skip_locked=True)
+        result = await self.session.execute(
+            delete(DatasetAccessSession)
+            .where(DatasetAccessSession.id.in_(batch.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+            .returning(DatasetAccessSession.dataset_id, DatasetAccessSession.start_time,
+                       DatasetAccessSession.read_count)
         )
-        result = await self.session.execute(stmt)
-        existing_records = result.scalars().all()
-
-        latest_records = {}
-        for record in existing_records:
-            if record.event_type not in latest_records or record.event_time > latest_records[
-                record.event_type].event_time:
-                latest_records[record.event_type] = record
-
-        for event_type, event_time in zip(event_types, event_times):
-            normalized_time = self._normalize_event_time(event_time)
-            if event_type in latest_records:
-                latest_event = latest_records[event_type]
-                if event_type == EventType.READ and latest_event.event_time != normalized_time:
-                    new_event = DatasetUsageHistory(
-                        dataset_id=dataset_id,
-                        event_type=EventType.READ,
-                        event_time=normalized_time
-                    )
-                    self.session.add(new_event)
-                    events.append(EventType.READ)
-
-                elif event_type == EventType.MODIFY and latest_event.event_time != normalized_time:
-                    new_event = DatasetUsageHistory(
-                        dataset_id=dataset_id,
-                        event_type=EventType.MODIFY,
-                        event_time=normalized_time
-                    )
-                    self.session.add(new_event)
-                    events.append(EventType.MODIFY)
+        rows = [
+            (dataset_id, EventType.READ, start_time, read_count) for dataset_id, start_time, read_count in result.all()
+        ]
+        return await self._aggregate(rows)
+
+    async def _aggregate(self, rows: list[tuple[int, EventType, datetime, int]]) -> tuple[int, datetime | None]:
+        aggregates: dict[tuple[int, EventType, date], dict] = {}
+        for dataset_id, event_type, event_time, count in rows:
+            aggregate = aggregates.get((dataset_id, event_type, event_time.date()))
+            if aggregate is None:
+                aggregates[(dataset_id, event_type, event_time.date())] = {
+                    "dataset_id": dataset_id,
+                    "event_type": event_type,
+                    "day": event_time.date(),
+                    "event_count": count,
+                    "first_event_time": event_time,
+                    "last_event_time": event_time,
+                }
             else:
-                new_event = DatasetUsageHistory(
-                    dataset_id=dataset_id,
-                    event_type=event_type,
-                    event_time=normalized_time
-                )
-                self.session.add(new_event)
-                events.append(event_type)
-
-        if not existing_records:
-            create_event = DatasetUsageHistory(
-                dataset_id=dataset_id,
-                event_type=EventType.CREATE,
-                event_time=self._normalize_event_time(client_request.age)
+                aggregate["event_count"] += count
+                aggregate["first_event_time"] = min(aggregate["first_event_time"], event_time)
+                aggregate["last_event_time"] = max(aggregate["last_event_time"], event_time)
+
+        if aggregates:
+            stmt = insert(DatasetUsageAggregate)
+            await self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[
+                        DatasetUsageAggregate.dataset_id, DatasetUsageAggregate.event_type, DatasetUsageAggregate.day
+                    ],
+                    set_={
+                        "event_count": DatasetUsageAggregate.event_count + stmt.excluded.event_count,
+                        "first_event_time": func.least(
+                            DatasetUsageAggregate.first_event_time, stmt.excluded.first_event_time
+                        ),
+                        "last_event_time": func.greatest(
+                            DatasetUsageAggregate.last_event_time, stmt.excluded.last_event_time
+                        ),
+                        "update_time": func.now(),
+                    },
+                ),
+                list(aggregates.values()),
             )
-            self.session.add(create_event)
-            events.append(EventType.CREATE)
-
         await self.session.commit()
-        return events
-
-    def _normalize_event_time(self, event_time):
-        return (
-            datetime.fromtimestamp(event_time, tz=timezone.utc).replace(tzinfo=None)
-            if isinstance(event_time, float)
-            else event_time.replace(tzinfo=None) if isinstance(event_time, datetime) and event_time.tzinfo
-            else event_time
-        )
+        return len(rows), max((event_time for _, _, event_time, _ in rows), default=None)
 
-    async def get_events_statistic_by_time(self, dataset_id, timestamp: timedelta = timedelta(days=30)):
+    async def get_events_statistic_by_time(
+        self, dataset_id, timestamp: timedelta = timedelta(days=STATISTIC_WINDOW_DAYS)
+    ):
         stmt_count = select(
             DatasetUsageHistory.event_type,
             func.count(DatasetUsageHistory.event_type).label('event_count')
@@ -228,20 +232,45 @@ class DatasetUsageHistoryRepository:
             DatasetUsageHistory.event_type == EventType.MODIFY
         ).order_by(desc(DatasetUsageHistory.event_time)).limit(1)
 
+        # events and sessions past the retention age only remain as daily aggregates
+        stmt_last_aggregated = select(
+            DatasetUsageAggregate.event_type,
+            func.max(DatasetUsageAggregate.last_event_time)
+        ).filter(
+            DatasetUsageAggregate.dataset_id == dataset_id
+        ).group_by(DatasetUsageAggregate.event_type)
+
+        # reads are stored as access sessions, READ events only until they are compacted
+        in_time = datetime.now() - DatasetAccessSession.end_time <= timestamp
+        stmt_sessions = select(
+            func.count().filter(in_time).label('session_count'),
+            func.coalesce(func.sum(DatasetAccessSession.read_count).filter(in_time), 0).label('read_count'),
+            func.max(DatasetAccessSession.end_time).label('last_read')
+        ).filter(DatasetAccessSession.dataset_id == dataset_id)
+
         result_count = await self.session.execute(stmt_count)
         last_read_result = await self.session.execute(stmt_last_read)
         last_modified_result = await self.session.execute(stmt_last_modified)
+        sessions = (await self.session.execute(stmt_sessions)).one()
+        last_aggregated = dict((await self.session.execute(stmt_last_aggregated)).fetchall())
 
         event_statistics = {event_type: count for event_type, count in result_count.fetchall()}
-        last_read = last_read_result.scalar()
-        last_modified = last_modified_result.scalar()
+        last_read = max(
+            (
+                read for read in (last_read_result.scalar(), sessions.last_read, last_aggregated.get(EventType.READ))
+                if read is not None
+            ),
+            default=None
+        )
+        last_modified = last_modified_result.scalar() or last_aggregated.get(EventType.MODIFY)
 
-        frequency_of_use = sum(event_statistics.values())
+        frequency_of_use = sum(event_statistics.values()) + sessions.read_count
 
         return Statistic(
             last_read=last_read,
             last_modified=last_modified,
-            frequency_of_use_in_month=frequency_of_use
+            frequency_of_use_in_month=frequency_of_use,
+            read_sessions_in_month=sessions.session_count + event_statistics.get(EventType.READ, 0)
         )
 
     async def get_latest_events(self, dataset_id) -> dict:
@@ -290,3 +319,77 @@ class LinkRepository:
         await self.session.execute(stmt)
         await self.session.commit()
         return await self.get_all_urls()
+
+
+class TrackedPathRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_version(self, host: str) -> str:
+        """
+        Version of the desired state of a host, changed by every insert, update and delete of its paths.
+        Computed from aggregates of the host's rows, so an unchanged state is recognized without sending the paths.
+        """
+        stmt = select(
+            func.count(TrackedPath.id),
+            func.coalesce(func.sum(TrackedPath.id), 0),
+            func.coalesce(func.sum(TrackedPath.dataset_general_info_id), 0),
+            func.max(TrackedPath.update_time),
+        ).where(TrackedPath.host == host)
+        count, id_sum, dataset_id_sum, last_update = (await self.session.execute(stmt)).one()
+        state = f"{count}:{id_sum}:{dataset_id_sum}:{last_update.timestamp() if last_update else 0}"
+        return hashlib.blake2b(state.encode(), digest_size=8).hexdigest()
+
+    async def get_by_host(self, host: str) -> Sequence[TrackedPath]:
+        stmt = select(TrackedPath).where(TrackedPath.host == host).order_by(TrackedPath.path)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def get_desired_state(self, host: str) -> tuple[list[list], list[list]]:
+        """Files and directories a host should track, as [path, dataset_general_info_id] pairs."""
+        stmt = (
+            select(TrackedPath.path, TrackedPath.dataset_general_info_id, TrackedPath.is_directory)
+            .where(TrackedPath.host == host)
+        )
+        files, directories = [], []
+        for path, dataset_general_info_id, is_directory in await self.session.execute(stmt):
+            (directories if is_directory else files).append([path, dataset_general_info_id])
+        return files, directories
+
+    async def add_or_update(self, request: TrackedPathRequest) -> Sequence[TrackedPath] | None:
+        """Register a path of a host, None if the dataset info is unknown."""
+        if await self.session.get(DatasetGeneralInfo, request.dataset_general_info_id) is None:
+            return None
+
+        stmt = select(TrackedPath).where(TrackedPath.host == request.host, TrackedPath.path == request.path)
+        result = await self.session.execute(stmt)
+        tracked_path = result.scalars().first()
+
+        if tracked_path:
+            tracked_path.dataset_general_info_id = request.dataset_general_info_id
+            tracked_path.is_directory = request.is_directory
+        else:
+            self.session.add(TrackedPath(
+                host=request.host,
+                path=request.path,
+                dataset_general_info_id=request.dataset_general_info_id,
+                is_directory=request.is_directory
+            ))
+
+        await self.session.commit()
+        return await self.get_by_host(request.host)
+
+    async def delete(self, host: str, path: str) -> Sequence[TrackedPath]:
+        await self.session.execute(delete(TrackedPath).where(TrackedPath.host == host, TrackedPath.path == path))
+        await self.session.commit()
+        return await self.get_by_host(host)
+
+
+class TrackerHostRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_not_seen_since(self, timestamp: datetime) -> Sequence[TrackerHost]:
+        stmt = select(TrackerHost).where(TrackerHost.last_seen < timestamp).order_by(TrackerHost.last_seen)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
@@ -0,0 +1,65 @@
+# Retention of the usage history.
+#
+# Events and access sessions older than the retention age are downsampled into `dataset_usage_aggregate`,
+# one row per dataset, event type and day, and deleted. The worker deletes the oldest rows in small batches
+# driven by the index on their time, one short transaction each, and sleeps between batches,
+# so the ingest writing the same tables is never blocked for long.
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.repository import DatasetUsageHistoryRepository
+
+PROGRESS_LOG_INTERVAL = 30.0  # seconds
+
+
+async def downsample_usage_history(cutoff: datetime) -> int:
+    """Downsample all events and access sessions older than cutoff, return how many rows were deleted."""
+    settings = get_settings().retention
+    processed = 0
+    start = last_log = time.monotonic()
+    async with database_session.get_async_session() as session:
+        repository = DatasetUsageHistoryRepository(session)
+        for kind, downsample in (
+            ("usage events", repository.downsample_events_older_than),
+            ("access sessions", repository.downsample_access_sessions_older_than),
+        ):
+            while True:
+                count, reached = await downsample(cutoff, settings.batch_size)
+                processed += count
+                if time.monotonic() - last_log >= PROGRESS_LOG_INTERVAL:
+                    last_log = time.monotonic()
+                    logging.info(
+                        f"Usage history retention: {processed} rows downsampled, {kind} up to {reached}, "
+                        f"{processed / (last_log - start):.0f} rows/s"
+                    )
+                if count < settings.batch_size:
+                    break
+                await asyncio.sleep(settings.batch_pause)
+
+    elapsed = time.monotonic() - start
+    if processed:
+        logging.info(
+            f"Usage history retention: downsampled {processed} rows older than {cutoff} in {elapsed:.1f}s, "
+            f"{processed / elapsed:.0f} rows/s"
+        )
+    return processed
+
+
+async def downsample_usage_history_periodically() -> None:
+    """Downsample the usage history past the retention age every retention interval, until cancelled."""
+    settings = get_settings().retention
+    if settings.max_age_days <= 0:
+        return
+    while True:
+        await asyncio.sleep(settings.interval)
+        # event times are stored as naive UTC
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=settings.max_age_days)
+        try:
+            await downsample_usage_history(cutoff)
+        except Exception as e:
+            logging.error(f"Couldn't downsample the usage history: {e}")
@@ -1,9 +1,37 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from app.api.api_router import api_router, auth_router
+from app.core import database_session
+from app.core.access_sessions import compact_read_events_periodically
 from app.core.config import get_settings
+from app.core.heartbeat import flush_heartbeats_periodically, get_heartbeat_buffer
+from app.core.retention import downsample_usage_history_periodically
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    heartbeat_flusher = asyncio.create_task(flush_heartbeats_periodically())
+    read_event_compactor = asyncio.create_task(compact_read_events_periodically())
+    retention_worker = asyncio.create_task(downsample_usage_history_periodically())
+    yield
+    workers = (retention_worker, read_event_compactor, heartbeat_flusher)
+    for worker in workers:
+        worker.cancel()
+    # a flush interrupted by the cancellation puts its heartbeats back for the final one
+    await asyncio.gather(*workers, return_exceptions=True)
+    try:
+        async with database_session.get_async_session() as session:
+            await get_heartbeat_buffer().flush(session)
+    except Exception as e:
+        logging.error(f"Couldn't flush tracker heartbeats on shutdown: {e}")
+
 
 app = FastAPI(
     title="EbaDataset",
@@ -11,6 +39,7 @@ app = FastAPI(
     description="Dataset Manager Tool",
     openapi_url="/openapi.json",
     docs_url="/",
+    lifespan=lifespan,
 )
 
 app.include_router(api_router)
@@ -14,11 +14,11 @@
 
 
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum as PyEnum
 from typing import List
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, String, Uuid, func
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, ForeignKey, Index, String, UniqueConstraint, Uuid, func
 from sqlalchemy import Enum, TIMESTAMP
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -86,6 +86,8 @@ class DatasetGeneralInfo(Base):
 
 class Dataset(Base):
     __tablename__ = "dataset"
+    # the key events are upserted by, one dataset per file of a host and dataset info
+    __table_args__ = (UniqueConstraint("host", "file_path", "dataset_general_info_id"),)
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     file_path: Mapped[str] = mapped_column(String(256), nullable=False)
@@ -98,6 +100,8 @@ class Dataset(Base):
     created_at_server: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=func.now()
     )
+    last_access_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_modification_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
 
     dataset_general_info_id: Mapped[int] = mapped_column(
         ForeignKey("dataset_general_info.id"), nullable=False
@@ -107,8 +111,39 @@ class Dataset(Base):
     )
 
 
+class TrackedPath(Base):
+    # a file or directory tree a tracker host should track for a dataset, polled by the daemons
+    __tablename__ = "tracked_path"
+    __table_args__ = (UniqueConstraint("host", "path"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    host: Mapped[str] = mapped_column(String(256), nullable=False, index=True)
+    path: Mapped[str] = mapped_column(String(1024), nullable=False)
+    is_directory: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    dataset_general_info_id: Mapped[int] = mapped_column(
+        ForeignKey("dataset_general_info.id", ondelete="CASCADE"), nullable=False
+    )
+
+
+class TrackerHost(Base):
+    # a file tracker daemon as of its last heartbeat
+    __tablename__ = "tracker_host"
+
+    host: Mapped[str] = mapped_column(String(256), primary_key=True)
+    version: Mapped[str] = mapped_column(String(64), nullable=True)
+    tracked_files: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    upload_queue_size: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    spool_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+
 class DatasetUsageHistory(Base):
     __tablename__ = "dataset_usage_history"
+    # a retried upload makes the same events with the same keys, which are then skipped on insert
+    __table_args__ = (
+        Index("ix_dataset_usage_history_event_key", "event_key", "event_type", unique=True),
+        Index("ix_dataset_usage_history_event_time", "event_time"),  # the retention worker deletes by age
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     dataset_id: Mapped[int] = mapped_column()
@@ -116,3 +151,36 @@ class DatasetUsageHistory(Base):
         Enum(EventType), nullable=False
     )
     event_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False)
+    # generated by the daemon per uploaded state of a file, null for events of clients which send none
+    event_key: Mapped[str] = mapped_column(String(64), nullable=True)
+
+
+class DatasetAccessSession(Base):
+    # reads of a dataset less than the session gap apart, stored as one row instead of a READ event per read
+    __tablename__ = "dataset_access_session"
+    __table_args__ = (
+        Index("ix_dataset_access_session_dataset_id_end_time", "dataset_id", "end_time"),
+        Index("ix_dataset_access_session_end_time", "end_time"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    dataset_id: Mapped[int] = mapped_column(nullable=False)
+    start_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False)
+    end_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False)
+    read_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=1)
+
+
+class DatasetUsageAggregate(Base):
+    # usage of a dataset per event type and day, all that is kept of events and sessions past the retention age
+    __tablename__ = "dataset_usage_aggregate"
+    __table_args__ = (UniqueConstraint("dataset_id", "event_type", "day"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    dataset_id: Mapped[int] = mapped_column(nullable=False)
+    event_type: Mapped[EventType] = mapped_column(
+        Enum(EventType), nullable=False
+    )
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    event_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    first_event_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False)
+    last_event_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False)
@@ -1,9 +1,11 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic import EmailStr, HttpUrl
 
+EVENT_KEY_MAX_LENGTH = 64  # the length of the event_key column
+
 
 class BaseRequest(BaseModel):
     # may define additional fields or config shared across requests
@@ -32,6 +34,27 @@ class DaemonClientRequest(BaseRequest):
     last_access_date: datetime
     last_modification_date: datetime
     size: int
+    event_key: Optional[str] = Field(default=None, max_length=EVENT_KEY_MAX_LENGTH)
+
+
+class DaemonClientUpdate(BaseRequest):
+    # partial event of a known dataset: handle is the dataset id, missing fields did not change
+    handle: int
+    hostname: Optional[str] = None  # the host the dataset must belong to, a handle without it is rejected
+    age: Optional[datetime] = None
+    access_rights: Optional[str] = None
+    last_access_date: Optional[datetime] = None
+    last_modification_date: Optional[datetime] = None
+    size: Optional[int] = None
+    event_key: Optional[str] = Field(default=None, max_length=EVENT_KEY_MAX_LENGTH)
+
+
+class HeartbeatRequest(BaseRequest):
+    hostname: str
+    version: Optional[str] = None
+    tracked_files: int = 0
+    upload_queue_size: int = 0
+    spool_bytes: int = 0
 
 
 class LinkDescriptionUpdateRequest(BaseModel):
@@ -48,4 +71,11 @@ class DatasetInfoUpdateRequest(BaseRequest):
 
 class DatasetInfoCreateRequest(BaseRequest):
     name: str
-    description: Optional[str] = None
\ No newline at end of file
+    description: Optional[str] = None
+
+
+class TrackedPathRequest(BaseRequest):
+    host: str
+    path: str
+    dataset_general_info_id: int
+    is_directory: bool = False
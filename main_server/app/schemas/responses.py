@@ -12,6 +12,7 @@ class Statistic(BaseModel):
     last_read: Optional[datetime]
     last_modified: Optional[datetime]
     frequency_of_use_in_month: int
+    read_sessions_in_month: int = 0
 
 
 class AccessTokenResponse(BaseResponse):
@@ -37,6 +38,22 @@ class LinkResponse(BaseResponse):
     description: str
 
 
+class TrackedPathResponse(BaseResponse):
+    host: str
+    path: str
+    dataset_general_info_id: int
+    is_directory: bool
+
+
+class TrackerHostResponse(BaseResponse):
+    host: str
+    version: Optional[str] = None
+    tracked_files: int
+    upload_queue_size: int
+    spool_bytes: int
+    last_seen: datetime
+
+
 class DatasetInfo(BaseResponse):
     id: int
     file_path: str
@@ -47,6 +64,7 @@ class DatasetInfo(BaseResponse):
     last_read: Optional[datetime] = None
     last_modified: Optional[datetime] = None
     frequency_of_use_in_month: Optional[int] = None
+    read_sessions_in_month: Optional[int] = None
 
 class DatasetsSummary(BaseModel):
     dataset_general_info_id: int
@@ -1,6 +1,6 @@
 import logging
 import os
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Generator
 
 import pytest
 import pytest_asyncio
@@ -13,6 +13,7 @@ from sqlalchemy.ext.asyncio import (
 
 from app.core import database_session
 from app.core.config import get_settings
+from app.core.heartbeat import HeartbeatBuffer, get_heartbeat_buffer
 from app.core.security.jwt import create_jwt_token
 from app.core.security.password import get_password_hash
 from app.main import app as fastapi_app
@@ -82,6 +83,15 @@ async def fixture_clean_get_settings_between_tests() -> AsyncGenerator[None, Non
     get_settings.cache_clear()
 
 
+@pytest.fixture(name="heartbeat_buffer", scope="function")
+def fixture_heartbeat_buffer() -> Generator[HeartbeatBuffer, None, None]:
+    get_heartbeat_buffer.cache_clear()
+
+    yield get_heartbeat_buffer()
+
+    get_heartbeat_buffer.cache_clear()
+
+
 @pytest_asyncio.fixture(name="default_hashed_password", scope="session")
 async def fixture_default_hashed_password() -> str:
     return get_password_hash(default_user_password)
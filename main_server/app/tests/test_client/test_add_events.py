@@ -0,0 +1,188 @@
+import gzip
+import json
+
+import pytest
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.main import app
+from app.models import Dataset, DatasetAccessSession, DatasetGeneralInfo, DatasetUsageHistory
+
+HOST = "ingest-host"
+DAY_MS = 24 * 3600 * 1000
+START_MS = 1_700_000_000_000
+
+
+def make_batch(rows: list[dict]) -> bytes:
+    columns: dict[str, list] = {
+        name: [] for name in (
+            "handle", "hostname", "file_path", "dataset_general_info_id", "age", "access_rights",
+            "last_access_date", "last_modification_date", "size", "event_key",
+        )
+    }
+    for row in rows:
+        for name, column in columns.items():
+            column.append(row.get(name))
+    return gzip.compress(json.dumps({"version": 3, "columns": columns}).encode())
+
+
+def full_row(dataset_general_info_id: int, last_access: int, last_modification: int, event_key: str) -> dict:
+    return {
+        "hostname": HOST,
+        "file_path": "/data/file",
+        "dataset_general_info_id": dataset_general_info_id,
+        "age": START_MS,
+        "access_rights": 0o644,
+        "last_access_date": last_access,
+        "last_modification_date": last_modification,
+        "size": 10,
+        "event_key": event_key,
+    }
+
+
+async def post_batch(client: AsyncClient, rows: list[dict]) -> dict:
+    response = await client.post(
+        app.url_path_for("add_usage_events"),
+        content=make_batch(rows),
+        headers={"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+
+async def stored_rows(session: AsyncSession) -> tuple[int, int]:
+    events = await session.scalar(select(func.count()).select_from(DatasetUsageHistory))
+    reads = await session.scalar(select(func.coalesce(func.sum(DatasetAccessSession.read_count), 0)))
+    return events, reads
+
+
+@pytest_asyncio.fixture(name="dataset_info", scope="function")
+async def fixture_dataset_info(session: AsyncSession) -> DatasetGeneralInfo:
+    dataset_info = DatasetGeneralInfo(name="ingest", description="")
+    session.add(dataset_info)
+    await session.commit()
+    return dataset_info
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_stores_the_events_of_known_dataset_infos(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    unknown_id = dataset_info.id + 1000
+
+    result = await post_batch(client, [
+        full_row(dataset_info.id, START_MS + DAY_MS, START_MS + DAY_MS, "key-1"),
+        full_row(unknown_id, START_MS + DAY_MS, START_MS + DAY_MS, "key-2"),
+    ])
+
+    assert (result["accepted"], result["rejected"]) == (1, 1)
+    assert result["unknown_dataset_general_info_ids"] == [unknown_id]
+    assert await session.scalar(select(Dataset.size).where(Dataset.host == HOST)) == 10
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_applies_partial_rows_to_the_handle_of_a_full_event(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    [handle] = (await post_batch(client, [full_row(dataset_info.id, START_MS, START_MS, "key-1")]))["handles"]
+
+    result = await post_batch(client, [
+        {"handle": handle, "hostname": HOST, "size": 20, "event_key": "key-2"},
+        {"handle": handle + 1000, "hostname": HOST, "size": 30, "event_key": "key-3"},
+    ])
+
+    assert result["handles"] == [handle, None]
+    dataset = await session.get(Dataset, handle)
+    await session.refresh(dataset)
+    assert dataset.size == 20
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_rejects_a_malformed_batch(client: AsyncClient) -> None:
+    response = await client.post(
+        app.url_path_for("add_usage_events"),
+        content=b"not gzip",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["message"].startswith("Malformed event batch")
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_same_batch_twice_stores_nothing(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    rows = [full_row(dataset_info.id, START_MS + DAY_MS, START_MS + DAY_MS, "key-1")]
+
+    first = await post_batch(client, rows)
+    stored = await stored_rows(session)
+    second = await post_batch(client, rows)
+
+    assert first["accepted"] == second["accepted"] == 1
+    assert second["handles"] == first["handles"]
+    assert stored == (2, 1)  # CREATE and MODIFY events, one read
+    assert await stored_rows(session) == stored
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_replayed_older_row_stores_nothing(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    older = full_row(dataset_info.id, START_MS + DAY_MS, START_MS + DAY_MS, "key-1")
+    newer = full_row(dataset_info.id, START_MS + 2 * DAY_MS, START_MS + 2 * DAY_MS, "key-2")
+
+    await post_batch(client, [older])
+    await post_batch(client, [newer])
+    stored = await stored_rows(session)
+    await post_batch(client, [older])
+
+    assert stored == (3, 2)  # CREATE, two MODIFY events and two reads
+    assert await stored_rows(session) == stored
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_partial_row_is_resolved_within_its_host(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    first = await post_batch(client, [full_row(dataset_info.id, START_MS + DAY_MS, START_MS + DAY_MS, "key-1")])
+    handle = first["handles"][0]
+
+    foreign = await post_batch(client, [{"handle": handle, "hostname": "other-host", "size": 0, "event_key": "key-2"}])
+    anonymous = await post_batch(client, [{"handle": handle, "size": 0, "event_key": "key-3"}])
+    assert await session.scalar(select(Dataset.size).where(Dataset.id == handle)) == 10
+    own = await post_batch(client, [{"handle": handle, "hostname": HOST, "size": 20, "event_key": "key-4"}])
+
+    assert foreign["handles"] == anonymous["handles"] == [None]
+    assert own["handles"] == [handle]
+    assert await session.scalar(select(Dataset.size).where(Dataset.id == handle)) == 20
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_events_older_row_does_not_roll_back_the_dataset(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    older = full_row(dataset_info.id, START_MS + DAY_MS, START_MS + DAY_MS, "key-1")
+    newer = {**full_row(dataset_info.id, START_MS + 2 * DAY_MS, START_MS + 2 * DAY_MS, "key-2"), "size": 20}
+
+    await post_batch(client, [newer])
+    await post_batch(client, [older])
+
+    dataset = (await session.execute(select(Dataset.size, Dataset.last_modification_date))).one()
+    assert dataset.size == 20
+    assert dataset.last_modification_date.timestamp() * 1000 == START_MS + 2 * DAY_MS
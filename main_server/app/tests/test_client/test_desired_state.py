@@ -0,0 +1,74 @@
+import pytest
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.main import app
+from app.models import DatasetGeneralInfo, TrackedPath
+
+HOST = "tracked-host"
+
+
+async def get_desired_state(client: AsyncClient, headers: dict[str, str] | None = None):
+    return await client.get(app.url_path_for("get_desired_state"), params={"host": HOST}, headers=headers)
+
+
+@pytest_asyncio.fixture(name="dataset_info", scope="function")
+async def fixture_dataset_info(session: AsyncSession) -> DatasetGeneralInfo:
+    dataset_info = DatasetGeneralInfo(name="tracked", description="")
+    session.add(dataset_info)
+    await session.commit()
+    session.add_all([
+        TrackedPath(host=HOST, path="/data/file", dataset_general_info_id=dataset_info.id),
+        TrackedPath(host=HOST, path="/data/tree", is_directory=True, dataset_general_info_id=dataset_info.id),
+        TrackedPath(host="other-host", path="/data/other", dataset_general_info_id=dataset_info.id),
+    ])
+    await session.commit()
+    return dataset_info
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_desired_state_returns_the_paths_of_the_host(
+    client: AsyncClient,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    response = await get_desired_state(client, {"Accept-Encoding": "gzip"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    state = response.json()
+    assert state["files"] == [["/data/file", dataset_info.id]]
+    assert state["directories"] == [["/data/tree", dataset_info.id]]
+    assert response.headers["ETag"] == f'"{state["etag"]}"'
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_desired_state_is_not_sent_again_while_unchanged(
+    client: AsyncClient,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    etag = (await get_desired_state(client)).headers["ETag"]
+
+    for if_none_match in (etag, f'"other", W/{etag}', "*"):
+        response = await get_desired_state(client, {"If-None-Match": if_none_match})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_desired_state_is_sent_again_once_changed(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    etag = (await get_desired_state(client)).headers["ETag"]
+    session.add(TrackedPath(host=HOST, path="/data/new", dataset_general_info_id=dataset_info.id))
+    await session.commit()
+
+    response = await get_desired_state(client, {"If-None-Match": etag})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert ["/data/new", dataset_info.id] in response.json()["files"]
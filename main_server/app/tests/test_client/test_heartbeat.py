@@ -0,0 +1,27 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.core.heartbeat import HeartbeatBuffer
+from app.main import app
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_heartbeat_is_buffered(client: AsyncClient, heartbeat_buffer: HeartbeatBuffer) -> None:
+    response = await client.post(
+        app.url_path_for("add_heartbeat"),
+        json={"hostname": "host-a", "version": "1.0", "tracked_files": 3},
+    )
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert heartbeat_buffer._pending["host-a"]["tracked_files"] == 3
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_heartbeat_when_the_buffer_is_full(client: AsyncClient, heartbeat_buffer: HeartbeatBuffer) -> None:
+    heartbeat_buffer.max_hosts = 0
+
+    response = await client.post(app.url_path_for("add_heartbeat"), json={"hostname": "host-a"})
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "30"
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.access_sessions import (
+    AccessSessionWriter,
+    _merge,
+    _Span,
+    compact_read_events,
+    compact_read_events_periodically,
+)
+from app.core.config import get_settings
+from app.models import DatasetAccessSession, DatasetUsageHistory, EventType
+
+GAP = timedelta(minutes=5)
+START = datetime(2024, 1, 1, 12, 0)
+DATASET_ID = 1
+
+
+def at(minutes: float) -> datetime:
+    return START + timedelta(minutes=minutes)
+
+
+async def stored_sessions(session: AsyncSession) -> list[tuple[datetime, datetime, int]]:
+    result = await session.execute(
+        select(DatasetAccessSession.start_time, DatasetAccessSession.end_time, DatasetAccessSession.read_count)
+        .where(DatasetAccessSession.dataset_id == DATASET_ID)
+        .order_by(DatasetAccessSession.start_time)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def add_events(session: AsyncSession, *events: tuple[EventType, float]) -> None:
+    session.add_all([
+        DatasetUsageHistory(dataset_id=DATASET_ID, event_type=event_type, event_time=at(minutes))
+        for event_type, minutes in events
+    ])
+    await session.commit()
+
+
+async def stored_event_types(session: AsyncSession) -> list[EventType]:
+    return list((await session.execute(select(DatasetUsageHistory.event_type))).scalars().all())
+
+
+def test_merge_joins_spans_less_than_the_gap_apart() -> None:
+    merged, absorbed = _merge([_Span(at(20), at(20), 1), _Span(at(0), at(1), 2), _Span(at(4), at(4), 1)], GAP)
+
+    assert merged == [_Span(at(0), at(4), 3), _Span(at(20), at(20), 1)]
+    assert absorbed == []
+
+
+def test_merge_keeps_a_stored_session_and_absorbs_the_others() -> None:
+    spans = [_Span(at(0), at(0), 1), _Span(at(3), at(4), 2, id=10), _Span(at(8), at(9), 3, id=11)]
+
+    merged, absorbed = _merge(spans, GAP)
+
+    assert merged == [_Span(at(0), at(9), 6, id=10)]
+    assert absorbed == [11]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_reads_merges_reads_into_sessions(session: AsyncSession) -> None:
+    writer = AccessSessionWriter(session, GAP)
+
+    counted = await writer.add_reads([(DATASET_ID, at(0)), (DATASET_ID, at(2)), (DATASET_ID, at(20))])
+
+    assert counted == {(DATASET_ID, at(0)), (DATASET_ID, at(2)), (DATASET_ID, at(20))}
+    assert await stored_sessions(session) == [(at(0), at(2), 2), (at(20), at(20), 1)]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_reads_does_not_count_a_read_twice(session: AsyncSession) -> None:
+    writer = AccessSessionWriter(session, GAP)
+    await writer.add_reads([(DATASET_ID, at(0)), (DATASET_ID, at(2))])
+
+    counted = await writer.add_reads([(DATASET_ID, at(2)), (DATASET_ID, at(4))])
+
+    assert counted == {(DATASET_ID, at(4))}
+    assert await stored_sessions(session) == [(at(0), at(4), 3)]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_reads_joins_the_sessions_a_read_bridges(session: AsyncSession) -> None:
+    writer = AccessSessionWriter(session, GAP)
+    await writer.add_reads([(DATASET_ID, at(0)), (DATASET_ID, at(8))])
+
+    await writer.add_reads([(DATASET_ID, at(4))])
+
+    assert await stored_sessions(session) == [(at(0), at(8), 3)]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_compact_read_events_moves_reads_into_sessions(session: AsyncSession) -> None:
+    await add_events(session, (EventType.READ, 0), (EventType.MODIFY, 1), (EventType.READ, 2), (EventType.READ, 20))
+
+    counts = [await compact_read_events(session, GAP, batch_size=2) for _ in range(3)]
+
+    assert counts == [2, 1, 0]
+    assert await stored_sessions(session) == [(at(0), at(2), 2), (at(20), at(20), 1)]
+    assert await stored_event_types(session) == [EventType.MODIFY]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_compact_read_events_periodically_keeps_compacting_after_a_failure(
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.INFO)
+    monkeypatch.setenv("ACCESS_SESSIONS__COMPACTION_INTERVAL", "0")
+    monkeypatch.setenv("ACCESS_SESSIONS__COMPACTION_BATCH_SIZE", "2")
+    get_settings.cache_clear()
+    await add_events(session, (EventType.READ, 0), (EventType.READ, 2), (EventType.READ, 20))
+    calls = 0
+
+    def get_async_session() -> AsyncSession:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("database is gone")
+        return session
+
+    monkeypatch.setattr(database_session, "get_async_session", get_async_session)
+
+    compactor = asyncio.create_task(compact_read_events_periodically())
+    async with asyncio.timeout(5):
+        while "Compacted" not in caplog.text:
+            await asyncio.sleep(0)
+    compactor.cancel()
+    await asyncio.gather(compactor, return_exceptions=True)
+
+    assert "Couldn't compact READ events: database is gone" in caplog.text
+    assert "Compacted 3 READ events into access sessions" in caplog.text
+    assert await stored_event_types(session) == []
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.heartbeat import HeartbeatBuffer, flush_heartbeats_periodically
+from app.models import TrackerHost
+from app.schemas.requests import HeartbeatRequest
+
+
+class InterruptedSession:
+    """A session whose write fails after a newer heartbeat of host-a arrived."""
+    def __init__(self, buffer: HeartbeatBuffer, error: BaseException) -> None:
+        self.buffer = buffer
+        self.error = error
+        self.rolled_back = False
+
+    async def execute(self, *args, **kwargs) -> None:
+        self.buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=2))
+        raise self.error
+
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        self.rolled_back = True
+
+
+def pending_files(buffer: HeartbeatBuffer) -> dict[str, int]:
+    return {host: heartbeat["tracked_files"] for host, heartbeat in buffer._pending.items()}
+
+
+def test_heartbeat_buffer_keeps_the_latest_heartbeat_of_a_host() -> None:
+    buffer = HeartbeatBuffer(max_hosts=2)
+
+    assert buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=1))
+    assert buffer.record(HeartbeatRequest(hostname="host-b"))
+    assert buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=2))
+    assert not buffer.record(HeartbeatRequest(hostname="host-c"))
+
+    assert pending_files(buffer) == {"host-a": 2, "host-b": 0}
+    assert buffer.last_seen("host-a") is not None
+    assert buffer.last_seen("host-c") is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_heartbeat_buffer_flush_upserts_the_hosts(session: AsyncSession) -> None:
+    buffer = HeartbeatBuffer(max_hosts=10)
+    buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=1))
+    assert await buffer.flush(session) == 1
+    buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=5))
+    buffer.record(HeartbeatRequest(hostname="host-b", tracked_files=3))
+    assert await buffer.flush(session) == 2
+
+    hosts = (await session.execute(select(TrackerHost.host, TrackerHost.tracked_files))).all()
+    assert sorted(hosts) == [("host-a", 5), ("host-b", 3)]
+    assert pending_files(buffer) == {}
+    assert await buffer.flush(session) == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+@pytest.mark.parametrize("error", [ConnectionError("database is gone"), asyncio.CancelledError()])
+async def test_heartbeat_buffer_flush_requeues_heartbeats_it_could_not_write(error: BaseException) -> None:
+    buffer = HeartbeatBuffer(max_hosts=10)
+    buffer.record(HeartbeatRequest(hostname="host-a", tracked_files=1))
+    buffer.record(HeartbeatRequest(hostname="host-b", tracked_files=1))
+    session = InterruptedSession(buffer, error)
+
+    with pytest.raises(type(error)):
+        await buffer.flush(session)  # type: ignore[arg-type]
+
+    assert session.rolled_back
+    assert pending_files(buffer) == {"host-a": 2, "host-b": 1}  # the heartbeat received meanwhile is kept
+    assert buffer.flushed == 0
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_flush_heartbeats_periodically_keeps_flushing_after_a_failure(
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    heartbeat_buffer: HeartbeatBuffer,
+) -> None:
+    monkeypatch.setenv("HEARTBEAT__FLUSH_INTERVAL", "0")
+    get_settings.cache_clear()
+    sessions = iter([None, session])
+
+    def get_async_session() -> AsyncSession:
+        next_session = next(sessions)
+        if next_session is None:
+            raise ConnectionError("database is gone")
+        return next_session
+
+    monkeypatch.setattr(database_session, "get_async_session", get_async_session)
+    heartbeat_buffer.record(HeartbeatRequest(hostname="host-a"))
+
+    flusher = asyncio.create_task(flush_heartbeats_periodically())
+    async with asyncio.timeout(5):
+        while not heartbeat_buffer.flushed:
+            await asyncio.sleep(0)
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+
+    assert "Couldn't flush tracker heartbeats: database is gone" in caplog.text
+    assert await session.scalar(select(TrackerHost.host)) == "host-a"
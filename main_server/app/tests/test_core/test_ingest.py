@@ -0,0 +1,90 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.ingest import MAX_BATCH_BYTES, decode_event_batch
+from app.schemas.requests import DaemonClientRequest, DaemonClientUpdate
+
+AGE_MS = 1_700_000_000_000
+COLUMNS = (
+    "hostname", "file_path", "dataset_general_info_id", "age", "access_rights",
+    "last_access_date", "last_modification_date", "size",
+)
+
+
+def make_body(version: int, rows: list[dict], extra_columns: tuple[str, ...] = ()) -> bytes:
+    columns = {name: [row.get(name) for row in rows] for name in (*COLUMNS, *extra_columns)}
+    return json.dumps({"version": version, "columns": columns}).encode()
+
+
+def full_row(**fields) -> dict:
+    return {
+        "hostname": "host",
+        "file_path": "/data/file",
+        "dataset_general_info_id": 1,
+        "age": AGE_MS,
+        "access_rights": 0o644,
+        "last_access_date": AGE_MS + 1000,
+        "last_modification_date": AGE_MS + 2000,
+        "size": 10,
+        **fields,
+    }
+
+
+def test_decode_event_batch_version_1_full_events() -> None:
+    rows = decode_event_batch(gzip.compress(make_body(1, [full_row()])), "gzip")
+
+    assert rows == [
+        DaemonClientRequest(
+            hostname="host",
+            file_path="/data/file",
+            dataset_general_info_id=1,
+            age=datetime.fromtimestamp(AGE_MS / 1000, tz=timezone.utc),
+            access_rights="644",
+            last_access_date=datetime.fromtimestamp((AGE_MS + 1000) / 1000, tz=timezone.utc),
+            last_modification_date=datetime.fromtimestamp((AGE_MS + 2000) / 1000, tz=timezone.utc),
+            size=10,
+        )
+    ]
+
+
+def test_decode_event_batch_version_2_partial_rows() -> None:
+    partial = {"handle": 7, "hostname": "host", "last_access_date": AGE_MS + 5000}
+
+    rows = decode_event_batch(make_body(2, [full_row(), partial], ("handle",)))
+
+    assert isinstance(rows[0], DaemonClientRequest)
+    assert rows[1] == DaemonClientUpdate(
+        handle=7,
+        hostname="host",
+        last_access_date=datetime.fromtimestamp((AGE_MS + 5000) / 1000, tz=timezone.utc),
+    )
+
+
+def test_decode_event_batch_version_3_event_keys() -> None:
+    body = make_body(3, [full_row(event_key="a"), {"handle": 7, "event_key": "b"}], ("handle", "event_key"))
+
+    rows = decode_event_batch(body, "identity")
+
+    assert [row.event_key for row in rows] == ["a", "b"]
+
+
+@pytest.mark.parametrize(
+    "body, content_encoding, message",
+    [
+        (b"{}", "br", "unsupported content encoding"),
+        (b"not gzip", "gzip", "broken gzip stream"),
+        (gzip.compress(b" " * (MAX_BATCH_BYTES + 1)), "gzip", "batch is larger than"),
+        (b"[1, 2", None, "invalid JSON"),
+        (json.dumps({"version": 4, "columns": {}}).encode(), None, "expected a batch of version"),
+        (json.dumps({"version": 1, "columns": {"file_path": []}}).encode(), None, "a batch must have the columns"),
+        (make_body(1, [full_row()]).replace(b'"size": [10]', b'"size": []'), None, "columns have different lengths"),
+        (make_body(1, [full_row(age="yesterday")]), None, "invalid event"),
+        (make_body(3, [full_row(event_key="k" * 65)], ("event_key",)), None, "invalid event"),
+    ],
+)
+def test_decode_event_batch_rejects_malformed_batches(body: bytes, content_encoding: str | None, message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        decode_event_batch(body, content_encoding)
@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.ingest_writer import UsageEventWriter
+from app.models import Dataset, DatasetGeneralInfo
+from app.schemas.requests import DaemonClientRequest
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_usage_event_writer_empty_batch(session: AsyncSession) -> None:
+    assert await UsageEventWriter(session).write([]) == ([], [], set())
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_usage_event_writer_takes_naive_dates_as_utc(session: AsyncSession) -> None:
+    dataset_info = DatasetGeneralInfo(name="naive", description="")
+    session.add(dataset_info)
+    await session.commit()
+    accessed = datetime(2024, 1, 2, 3, 4, 5)
+
+    await UsageEventWriter(session).write([DaemonClientRequest(
+        dataset_general_info_id=dataset_info.id,
+        hostname="host",
+        file_path="/data/file",
+        age=datetime(2024, 1, 1),
+        access_rights="644",
+        last_access_date=accessed,
+        last_modification_date=accessed,
+        size=10,
+    )])
+
+    last_access = await session.scalar(select(Dataset.last_access_date))
+    assert last_access == accessed.replace(tzinfo=timezone.utc)
@@ -0,0 +1,98 @@
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.core import rate_limit
+from app.core.rate_limit import IngestLimiter, get_ingest_limiter
+from app.main import app
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def make_limiter(max_in_flight: int = 10, max_hosts: int = 10) -> IngestLimiter:
+    return IngestLimiter(host_rate=2.0, host_burst=2, max_in_flight=max_in_flight, max_hosts=max_hosts)
+
+
+def drain(limiter: IngestLimiter, host: str) -> None:
+    while limiter.try_acquire(host) is None:
+        limiter.release()
+
+
+def test_ingest_limiter_rejects_a_host_past_its_burst_until_refilled(clock: FakeClock) -> None:
+    limiter = make_limiter()
+
+    assert limiter.try_acquire("a") is None
+    assert limiter.try_acquire("a") is None
+    assert limiter.try_acquire("a") == (429, 1)
+    assert limiter.try_acquire("b") is None
+    clock.now += 0.5
+    assert limiter.try_acquire("a") is None
+
+
+def test_ingest_limiter_caps_requests_in_flight(clock: FakeClock) -> None:
+    limiter = make_limiter(max_in_flight=1)
+
+    assert limiter.try_acquire("a") is None
+    assert limiter.try_acquire("b") == (503, 1)
+    limiter.release()
+    assert limiter.try_acquire("b") is None
+
+
+def test_ingest_limiter_evicts_the_least_recently_seen_host(clock: FakeClock) -> None:
+    limiter = make_limiter(max_hosts=2)
+    drain(limiter, "a")
+    drain(limiter, "b")
+
+    assert limiter.try_acquire("a") == (429, 1)  # seen after b
+    assert limiter.try_acquire("c") is None
+    limiter.release()
+
+    assert limiter.try_acquire("a") == (429, 1)
+    assert limiter.try_acquire("b") is None  # forgotten, so its bucket is full again
+
+
+def test_ingest_limiter_gives_relays_their_own_bucket(clock: FakeClock) -> None:
+    limiter = IngestLimiter(
+        host_rate=2.0, host_burst=1, max_in_flight=10, max_hosts=1, relay_hosts=["r"], relay_rate=1.0, relay_burst=3,
+    )
+
+    for _ in range(3):
+        assert limiter.try_acquire("r") is None
+        limiter.release()
+    assert limiter.try_acquire("r") == (429, 1)
+    drain(limiter, "a")  # evicts no relay
+    clock.now += 1
+    assert limiter.try_acquire("r") is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_ingest_limiter_ignores_the_tracker_host_header(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("INGEST__HOST_BURST", "1")
+    monkeypatch.setenv("INGEST__HOST_RATE", "0.001")
+    get_ingest_limiter.cache_clear()
+    try:
+        responses = [
+            await client.post(app.url_path_for("add_usage_events"), content=b"{}", headers={"X-Tracker-Host": host})
+            for host in ("a", "b")
+        ]
+    finally:
+        get_ingest_limiter.cache_clear()
+
+    assert responses[0].status_code == status.HTTP_400_BAD_REQUEST
+    assert responses[1].status_code == status.HTTP_429_TOO_MANY_REQUESTS
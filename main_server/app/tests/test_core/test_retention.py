@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session, retention
+from app.core.config import Retention, get_settings
+from app.core.retention import downsample_usage_history, downsample_usage_history_periodically
+from app.models import DatasetAccessSession, DatasetUsageAggregate, DatasetUsageHistory, EventType
+
+CUTOFF = datetime(2024, 3, 1)
+DATASET_ID = 1
+
+
+def modify_event(event_time: datetime) -> DatasetUsageHistory:
+    return DatasetUsageHistory(dataset_id=DATASET_ID, event_type=EventType.MODIFY, event_time=event_time)
+
+
+def access_session(start_time: datetime, end_time: datetime, read_count: int) -> DatasetAccessSession:
+    return DatasetAccessSession(
+        dataset_id=DATASET_ID, start_time=start_time, end_time=end_time, read_count=read_count
+    )
+
+
+@pytest.fixture(autouse=True)
+def fixture_small_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETENTION__BATCH_SIZE", "2")
+    monkeypatch.setenv("RETENTION__BATCH_PAUSE", "0")
+    get_settings.cache_clear()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_downsample_usage_history_aggregates_old_rows_in_batches(
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(retention, "PROGRESS_LOG_INTERVAL", 0.0)
+    old_day = CUTOFF - timedelta(days=10)
+    session.add_all([
+        *(modify_event(old_day + timedelta(hours=hour)) for hour in range(5)),
+        modify_event(CUTOFF + timedelta(hours=1)),
+        access_session(old_day, old_day + timedelta(minutes=3), 4),
+        access_session(CUTOFF, CUTOFF + timedelta(minutes=1), 2),
+    ])
+    await session.commit()
+
+    assert await downsample_usage_history(CUTOFF) == 6
+    assert "Usage history retention: 6 rows downsampled, access sessions up to" in caplog.text
+
+    aggregates = (await session.execute(
+        select(
+            DatasetUsageAggregate.event_type,
+            DatasetUsageAggregate.day,
+            DatasetUsageAggregate.event_count,
+            DatasetUsageAggregate.first_event_time,
+            DatasetUsageAggregate.last_event_time,
+        ).order_by(DatasetUsageAggregate.event_type)
+    )).all()
+    assert [tuple(aggregate) for aggregate in aggregates] == [
+        (EventType.MODIFY, date(2024, 2, 20), 5, old_day, old_day + timedelta(hours=4)),
+        (EventType.READ, date(2024, 2, 20), 4, old_day, old_day),  # sessions count at their start
+    ]
+    assert await session.scalar(select(func.count()).select_from(DatasetUsageHistory)) == 1
+    assert await session.scalar(select(func.count()).select_from(DatasetAccessSession)) == 1
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_downsample_usage_history_adds_to_existing_aggregates(session: AsyncSession) -> None:
+    old_time = CUTOFF - timedelta(days=1)
+    for offset in (timedelta(hours=2), timedelta(hours=1)):
+        session.add(modify_event(old_time + offset))
+        await session.commit()
+        await downsample_usage_history(CUTOFF)
+
+    aggregate = (await session.execute(select(DatasetUsageAggregate))).scalar_one()
+    assert aggregate.event_count == 2
+    assert (aggregate.first_event_time, aggregate.last_event_time) == (
+        old_time + timedelta(hours=1), old_time + timedelta(hours=2)
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_downsample_usage_history_periodically_keeps_running_after_a_failure(
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.INFO)
+    monkeypatch.setenv("RETENTION__INTERVAL", "0")
+    get_settings.cache_clear()
+    session.add(modify_event(CUTOFF))
+    await session.commit()
+    calls = 0
+
+    def get_async_session() -> AsyncSession:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("database is gone")
+        return session
+
+    monkeypatch.setattr(database_session, "get_async_session", get_async_session)
+
+    worker = asyncio.create_task(downsample_usage_history_periodically())
+    async with asyncio.timeout(5):
+        while "downsampled 1 rows" not in caplog.text:
+            await asyncio.sleep(0)
+    worker.cancel()
+    await asyncio.gather(worker, return_exceptions=True)
+
+    assert "Couldn't downsample the usage history: database is gone" in caplog.text
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_downsample_usage_history_periodically_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("RETENTION__MAX_AGE_DAYS", "0")
+    get_settings.cache_clear()
+
+    async with asyncio.timeout(5):
+        await downsample_usage_history_periodically()
+
+
+@pytest.mark.parametrize("max_age_days", [0, 30, 365])
+def test_retention_keeps_at_least_a_month(max_age_days: float) -> None:
+    assert Retention(max_age_days=max_age_days).max_age_days == max_age_days
+
+
+def test_retention_of_less_than_a_month() -> None:
+    with pytest.raises(ValidationError, match="must be at least 30 days"):
+        Retention(max_age_days=29)
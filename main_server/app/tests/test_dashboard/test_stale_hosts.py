@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.heartbeat import HeartbeatBuffer
+from app.main import app
+from app.models import TrackerHost
+from app.schemas.requests import HeartbeatRequest
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_stale_hosts(client: AsyncClient, session: AsyncSession, heartbeat_buffer: HeartbeatBuffer) -> None:
+    now = datetime.now(timezone.utc)
+    session.add_all([
+        TrackerHost(host=f"host-{age}", last_seen=now - timedelta(seconds=age)) for age in (10, 120, 600, 3600)
+    ])
+    await session.commit()
+    heartbeat_buffer.record(HeartbeatRequest(hostname="host-600"))  # not flushed yet
+
+    default = await client.get(app.url_path_for("get_stale_hosts"))
+    longer = await client.get(app.url_path_for("get_stale_hosts"), params={"stale_after": 1800})
+
+    assert default.status_code == status.HTTP_200_OK
+    assert [host["host"] for host in default.json()] == ["host-3600", "host-120"]
+    assert [host["host"] for host in longer.json()] == ["host-3600"]
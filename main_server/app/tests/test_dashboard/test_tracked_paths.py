@@ -0,0 +1,55 @@
+import pytest
+import pytest_asyncio
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.main import app
+from app.models import DatasetGeneralInfo
+
+HOST = "dashboard-host"
+
+
+def tracked_path(dataset_info: DatasetGeneralInfo, path: str, is_directory: bool = False) -> dict:
+    return {"host": HOST, "path": path, "dataset_general_info_id": dataset_info.id, "is_directory": is_directory}
+
+
+@pytest_asyncio.fixture(name="dataset_info", scope="function")
+async def fixture_dataset_info(session: AsyncSession) -> DatasetGeneralInfo:
+    dataset_info = DatasetGeneralInfo(name="dashboard", description="")
+    session.add(dataset_info)
+    await session.commit()
+    return dataset_info
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_or_update_tracked_path(client: AsyncClient, dataset_info: DatasetGeneralInfo) -> None:
+    url = app.url_path_for("add_or_update_tracked_path")
+    await client.post(url, json=tracked_path(dataset_info, "/data/b"))
+    await client.post(url, json=tracked_path(dataset_info, "/data/a"))
+
+    response = await client.post(url, json=tracked_path(dataset_info, "/data/b", is_directory=True))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [tracked_path(dataset_info, "/data/a"), tracked_path(dataset_info, "/data/b", True)]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_add_tracked_path_of_unknown_dataset_info(client: AsyncClient, dataset_info: DatasetGeneralInfo) -> None:
+    request = {**tracked_path(dataset_info, "/data/a"), "dataset_general_info_id": dataset_info.id + 1000}
+
+    response = await client.post(app.url_path_for("add_or_update_tracked_path"), json=request)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_and_delete_tracked_paths(client: AsyncClient, dataset_info: DatasetGeneralInfo) -> None:
+    for path in ("/data/a", "/data/b"):
+        await client.post(app.url_path_for("add_or_update_tracked_path"), json=tracked_path(dataset_info, path))
+
+    deleted = await client.delete(app.url_path_for("delete_tracked_path"), params={"host": HOST, "path": "/data/a"})
+    response = await client.get(app.url_path_for("get_tracked_paths"), params={"host": HOST})
+
+    assert deleted.json() == [tracked_path(dataset_info, "/data/b")]
+    assert response.json() == [tracked_path(dataset_info, "/data/b")]
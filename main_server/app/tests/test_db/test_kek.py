@@ -1,115 +1,79 @@
-from datetime import datetime, timezone
-import json
+from datetime import datetime, timedelta, timezone
 
 import pytest
-import sqlalchemy
+import pytest_asyncio
 from fastapi import status
 from httpx import AsyncClient
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import EventType
 from app.main import app
-from app.models import DatasetUsageHistory
+from app.models import DatasetAccessSession, DatasetGeneralInfo, DatasetUsageHistory
 
 
-@pytest.mark.asyncio(loop_scope="session")
-async def test_get_statistic(client: AsyncClient, session: AsyncSession, default_user_headers: dict[str, str],) -> None:
-    dataset_name = "test_dataset"
-    host_name = "test_host"
-
-    new_event = DatasetUsageHistory(
-        id=15,
-        host_name=host_name,
-        dataset_name=dataset_name,
-        event_type=EventType.READ,
-        event_time=datetime.now(),
-    )
-    session.add(new_event)
+@pytest_asyncio.fixture(name="dataset_info", scope="function")
+async def fixture_dataset_info(session: AsyncSession) -> DatasetGeneralInfo:
+    dataset_info = DatasetGeneralInfo(name="test_dataset", description="")
+    session.add(dataset_info)
     await session.commit()
-
-    result = await session.execute(sqlalchemy.select(DatasetUsageHistory).filter_by(id=15))
-    retrieved_event = result.scalar_one_or_none()
-    assert retrieved_event is not None
-    assert retrieved_event.dataset_name == dataset_name
-    assert retrieved_event.host_name == host_name
-
-    client_request = {
-        "hostname": "string",
-        "dataset_name": "string",
-        "age": "2024-11-23T17:25:50.481Z",
-        "access_rights": "public",
-        "last_access_date": "2024-11-23T17:25:50.481Z",
-        "last_modification_date": "2024-11-23T17:25:50.481Z"
+    return dataset_info
+
+
+def make_client_request(dataset_info: DatasetGeneralInfo) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "dataset_general_info_id": dataset_info.id,
+        "hostname": "test_host",
+        "file_path": "/data/file",
+        "age": (now - timedelta(days=2)).isoformat(),
+        "access_rights": "644",
+        "last_access_date": (now - timedelta(hours=1)).isoformat(),
+        "last_modification_date": (now - timedelta(days=1)).isoformat(),
+        "size": 10,
     }
 
-    response = await client.put(
-        app.url_path_for("add_usage_event"),
-        headers=default_user_headers,
-        json=client_request,
-    )
 
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_statistic(
+    client: AsyncClient,
+    dataset_info: DatasetGeneralInfo,
+    default_user_headers: dict[str, str],
+) -> None:
+    response = await client.post(app.url_path_for("add_usage_event"), json=make_client_request(dataset_info))
     assert response.status_code == status.HTTP_200_OK
 
-    response = await client.post(
-        app.url_path_for("get_events_statistic"),
-        headers=default_user_headers,
-        json=client_request,
-    )
+    response = await client.get(app.url_path_for("get_datasets_info"), headers=default_user_headers)
 
     assert response.status_code == status.HTTP_200_OK
-    stats = response.json()
-    assert "read" in stats
-    assert stats["read"] > 0  # Убедимся, что подсчитан хотя бы 1 READ
+    [summary] = [summary for summary in response.json() if summary["dataset_general_info_id"] == dataset_info.id]
+    [dataset] = summary["datasets_infos"]
+    assert dataset["frequency_of_use_in_month"] == 3  # CREATE and MODIFY events and one read
+    assert dataset["read_sessions_in_month"] == 1
+    assert dataset["last_read"] is not None
+    assert dataset["last_modified"] is not None
+
 
 @pytest.mark.asyncio(loop_scope="session")
-async def test_event_not_added_if_duplicate(client: AsyncClient, session: AsyncSession) -> None:
-    # Создаем событие напрямую
-    client_request = {
-        "hostname": "duplicate_host",
-        "dataset_name": "duplicate_dataset",
-        "last_access_date": "2024-11-22T12:34:56Z",
-        "access_rights": "public",
-        "last_modification_date": "2024-11-21T11:22:33Z",
-        "age": 1690195567.0,
-    }
+async def test_event_not_added_if_duplicate(
+    client: AsyncClient,
+    session: AsyncSession,
+    dataset_info: DatasetGeneralInfo,
+) -> None:
+    client_request = make_client_request(dataset_info)
 
-    existing_event = DatasetUsageHistory(
-        host_name=client_request["hostname"],
-        dataset_name=client_request["dataset_name"],
-        event_type=EventType.READ,
-        event_time=datetime.fromisoformat(client_request["last_access_date"]).replace(tzinfo=None),
-    )
-    session.add(existing_event)
-
-    existing_event = DatasetUsageHistory(
-        host_name=client_request["hostname"],
-        dataset_name=client_request["dataset_name"],
-        event_type=EventType.MODIFY,
-        event_time=datetime.fromisoformat(client_request["last_modification_date"]).replace(tzinfo=None),
-    )
-    session.add(existing_event)
-    existing_event = DatasetUsageHistory(
-        host_name=client_request["hostname"],
-        dataset_name=client_request["dataset_name"],
-        event_type=EventType.CREATE,
-        event_time=datetime.fromtimestamp(client_request["age"], tz=timezone.utc).replace(tzinfo=None),
-    )
-    session.add(existing_event)
-    await session.commit()
+    first = await client.post(app.url_path_for("add_usage_event"), json=client_request)
+    second = await client.post(app.url_path_for("add_usage_event"), json=client_request)
 
-    # Попробуем добавить через API
-    response = await client.put(
-        app.url_path_for("add_usage_event"),
-        json=client_request,
-    )
+    assert first.status_code == second.status_code == status.HTTP_200_OK
+    assert second.json() == {"message": "Event added = []"}
+    assert await session.scalar(select(func.count()).select_from(DatasetUsageHistory)) == 2
+    assert await session.scalar(select(func.sum(DatasetAccessSession.read_count))) == 1
 
-    assert response.status_code == status.HTTP_200_OK
-    assert response.json() == {"message": "Event not added"}
-
-    # Убедимся, что дубликатов не появилось
-    result = await session.execute(
-        select(DatasetUsageHistory).where(DatasetUsageHistory.dataset_name == client_request["dataset_name"])
-    )
-    events = result.scalars().all()
-    assert len(events) == 3
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_event_of_unknown_dataset_info(client: AsyncClient, dataset_info: DatasetGeneralInfo) -> None:
+    client_request = {**make_client_request(dataset_info), "dataset_general_info_id": dataset_info.id + 1000}
+
+    response = await client.post(app.url_path_for("add_usage_event"), json=client_request)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
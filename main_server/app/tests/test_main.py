@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.config import get_settings
+from app.core.heartbeat import HeartbeatBuffer
+from app.main import app, lifespan
+from app.models import TrackerHost
+from app.schemas.requests import HeartbeatRequest
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lifespan_flushes_the_heartbeats_on_shutdown(
+    session: AsyncSession,
+    heartbeat_buffer: HeartbeatBuffer,
+) -> None:
+    async with lifespan(app):
+        heartbeat_buffer.record(HeartbeatRequest(hostname="host-a"))
+
+    assert await session.scalar(select(TrackerHost.host)) == "host-a"
+
+
+class StalledSession:
+    """A session whose write hangs until the flush is cancelled."""
+    def __init__(self) -> None:
+        self.writing = asyncio.Event()
+
+    async def __aenter__(self) -> "StalledSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def execute(self, *args, **kwargs) -> None:
+        self.writing.set()
+        await asyncio.Event().wait()
+
+    async def rollback(self) -> None:
+        pass
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lifespan_writes_the_heartbeats_of_a_flush_cancelled_on_shutdown(
+    session: AsyncSession,
+    monkeypatch: pytest.MonkeyPatch,
+    heartbeat_buffer: HeartbeatBuffer,
+) -> None:
+    monkeypatch.setenv("HEARTBEAT__FLUSH_INTERVAL", "0")
+    get_settings.cache_clear()
+    stalled = StalledSession()
+    sessions = iter([stalled, session])
+    monkeypatch.setattr(database_session, "get_async_session", lambda: next(sessions))
+
+    async with lifespan(app):
+        heartbeat_buffer.record(HeartbeatRequest(hostname="host-a"))
+        async with asyncio.timeout(5):
+            await stalled.writing.wait()
+
+    assert await session.scalar(select(TrackerHost.host)) == "host-a"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lifespan_logs_a_failed_flush_on_shutdown(
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+    heartbeat_buffer: HeartbeatBuffer,
+) -> None:
+    def get_async_session() -> AsyncSession:
+        raise ConnectionError("database is gone")
+
+    monkeypatch.setattr(database_session, "get_async_session", get_async_session)
+
+    async with lifespan(app):
+        heartbeat_buffer.record(HeartbeatRequest(hostname="host-a"))
+
+    assert "Couldn't flush tracker heartbeats on shutdown: database is gone" in caplog.text